@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare the built-in formatter with jsonnetfmt on a synthetic rule tree.
+
+    python3 bench/formatter.py --rules 2000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from os.path import dirname, join, abspath
+sys.path.append(abspath(join(dirname(__file__), "..")))
+sys.path.append(abspath(dirname(__file__)))
+
+from src.jsonnet.writer import JsonnetWriter
+from src.jsonnet.formatter import FORMATTERS
+from src.jsonnet.papi.converter import RuleTreeConverter
+from src.output import OutputTree
+from synthetic import SyntheticRuleFormat, synthetic_rule_tree
+
+def run(formatter, ruleTree, out):
+  JsonnetWriter.formatter = FORMATTERS[formatter]()
+  start = time.perf_counter()
+  output = OutputTree(out)
+  writer = JsonnetWriter()
+  RuleTreeConverter(SyntheticRuleFormat(), ruleTree, output).convert(writer)
+  output.dump("rules.jsonnet", writer)
+  output.flush()
+  return time.perf_counter() - start
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rules", type=int, default=2000)
+  parser.add_argument("--fanout", type=int, default=10)
+  args = parser.parse_args()
+
+  formatters = ["none", "builtin"]
+  if shutil.which("jsonnetfmt"):
+    formatters.append("jsonnetfmt")
+  else:
+    print("jsonnetfmt not found on PATH, skipping", file=sys.stderr)
+
+  stderr = sys.stderr
+  timings = {}
+  for formatter in formatters:
+    with tempfile.TemporaryDirectory() as out:
+      # the output tree lists every file it writes on stderr
+      sys.stderr = open(os.devnull, "w")
+      try:
+        timings[formatter] = run(formatter, synthetic_rule_tree(rules=args.rules, depth=args.rules, fanout=args.fanout, behaviors=2), out)
+      finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+  for (formatter, elapsed) in timings.items():
+    line = "{:<12} {:>8.3f}s {:>10.0f} rules/s".format(formatter, elapsed, args.rules / elapsed)
+    if formatter != "jsonnetfmt" and "jsonnetfmt" in timings:
+      line += " {:>8.1f}x".format(timings["jsonnetfmt"] / elapsed)
+    print(line)
+
+if __name__ == "__main__":
+  main()
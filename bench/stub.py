@@ -0,0 +1,159 @@
+"""
+Local stand-in for the PAPI endpoints used by bootstrap, serving a synthetic
+schema, rule tree and hostnames.
+
+Point a command at it with the edgerc written by write_edgerc(), whose host has
+an http:// scheme.
+"""
+
+import datetime
+import json
+import math
+import re
+import threading
+import time
+from urllib import parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PROPERTY_VERSION = 1
+
+class StubPapi:
+  def __init__(self, schema, ruleTree, hostnames, propertyName="synthetic", delay=0.0, rateLimit=None, ruleTrees=None):
+    """
+    delay is added to each response, to model the latency of the API, and with
+    a rateLimit, requests beyond rateLimit per second are throttled with a 429
+    and the Akamai-RateLimit-* headers of the API.
+
+    ruleTrees serves several properties, by name, instead of ruleTree.
+    """
+    if ruleTrees is None:
+      ruleTrees = {propertyName: ruleTree}
+    self.bodies = {
+      "schema": json.dumps(schema).encode(),
+      "hostnames": json.dumps({"hostnames": {"items": hostnames}}).encode(),
+      "edgehostnames": json.dumps({"edgeHostnames": {"items": [
+        {"edgeHostnameDomain": hostname.get("cnameTo"), "edgeHostnameId": "ehn_{}".format(idx), "ipVersionBehavior": "IPV4"}
+        for (idx, hostname) in enumerate(hostnames)
+      ]}}).encode(),
+    }
+    # properties by name, whose versions go from 1 to latestVersion
+    self.properties = dict()
+    for (idx, (name, tree)) in enumerate(sorted(ruleTrees.items())):
+      propertyId = "prp_{}".format(idx + 1)
+      self.bodies["rules/" + propertyId] = json.dumps(dict(tree, propertyName=name)).encode()
+      self.properties[name] = dict(propertyId=propertyId, propertyName=name, contractId=tree.get("contractId"), groupId=tree.get("groupId"))
+    self.latestVersion = PROPERTY_VERSION
+    self.delay = delay
+    self.rateLimit = rateLimit
+    self.requests = 0
+    self.throttled = 0
+    self.lock = threading.Lock()
+    # start and number of requests of the current one second window
+    self.window = (0, 0)
+    self.server = None
+
+  def start(self):
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def log_message(self, *args):
+        pass
+
+      def do_GET(self):
+        (path, _, query) = self.path.partition("?")
+        if path.startswith("/papi/v1/schemas/products/"):
+          return self.reply("schema")
+        match = re.match(r"/papi/v1/properties/(prp_\w+)/versions/\d+/rules$", path)
+        if match:
+          return self.reply("rules/" + match.group(1))
+        if re.match(r"/papi/v1/properties/prp_\w+/versions/\d+/hostnames$", path):
+          return self.reply("hostnames")
+        if path == "/papi/v1/edgehostnames":
+          return self.reply("edgehostnames")
+        if path == "/papi/v1/groups":
+          groups = sorted(set((p.get("contractId"), p.get("groupId")) for p in stub.properties.values()))
+          return self.reply("groups", {"groups": {"items": [{"groupId": groupId, "contractIds": [contractId]} for (contractId, groupId) in groups]}})
+        if path == "/papi/v1/properties":
+          params = dict(parse.parse_qsl(query))
+          listed = [p for p in stub.properties.values() if (p.get("contractId"), p.get("groupId")) == (params.get("contractId"), params.get("groupId"))]
+          return self.reply("properties", {"properties": {"items": [dict(p, latestVersion=stub.latestVersion) for p in listed]}})
+        match = re.match(r"/papi/v1/properties/(prp_\w+)$", path)
+        if match:
+          listed = [p for p in stub.properties.values() if p.get("propertyId") == match.group(1)]
+          return self.reply("property" if len(listed) else None, {"properties": {"items": [dict(p, latestVersion=stub.latestVersion) for p in listed]}})
+        self.reply(None)
+
+      def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/papi/v1/search/find-by-value"):
+          found = stub.properties.get(json.loads(body or b"{}").get("propertyName"))
+          versions = [dict(found, propertyVersion=version) for version in range(1, stub.latestVersion + 1)] if found is not None else []
+          return self.reply("found", {"versions": {"items": versions}})
+        self.reply(None)
+
+      def reply(self, name, value=None):
+        """
+        Answer with value, or else the body named name, or a 404 if there is none.
+        """
+        if stub.delay:
+          time.sleep(stub.delay)
+        (status, headers) = stub.admit()
+        body = json.dumps(value).encode() if value is not None else stub.bodies.get(name, b'{"title": "not found"}')
+        if status != 200:
+          body = b'{"title": "Too Many Requests"}'
+        missing = name is None or value is None and name not in stub.bodies
+        self.send_response(404 if missing and status == 200 else status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for (header, value) in headers.items():
+          self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.server.daemon_threads = True
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def admit(self):
+    """
+    Count a request, and return its status and rate limit headers.
+    """
+    with self.lock:
+      self.requests += 1
+      if self.rateLimit is None:
+        return (200, dict())
+      now = time.time()
+      (start, count) = self.window
+      if now - start >= 1:
+        (start, count) = (math.floor(now), 0)
+      count += 1
+      self.window = (start, count)
+      headers = {
+        "Akamai-RateLimit-Limit": str(self.rateLimit),
+        "Akamai-RateLimit-Remaining": str(max(0, self.rateLimit - count)),
+        "Akamai-RateLimit-Next": datetime.datetime.fromtimestamp(start + 1, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+      }
+      if count > self.rateLimit:
+        self.throttled += 1
+        return (429, headers)
+      return (200, headers)
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  @property
+  def url(self):
+    return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+  def write_edgerc(self, path, section="default"):
+    with open(path, "w") as fd:
+      fd.write("[{}]\n".format(section))
+      fd.write("host = {}\n".format(self.url))
+      fd.write("client_token = akab-client-token\n")
+      fd.write("client_secret = client-secret\n")
+      fd.write("access_token = akab-access-token\n")
+    return path
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark the conversions on synthetic PAPI schemas and rule trees.
+
+Each benchmark runs in its own process, so that its peak RSS can be measured,
+and reports its throughput, peak RSS and the number of files it wrote:
+
+    ruleformat  RuleFormatConverter on a schema of --behaviors/--criteria atoms
+    ruletree    RuleTreeConverter on a rule tree of --rules rules
+    hostnames   HostnamesConverter on --hostnames hostnames
+    bootstrap   papi bootstrap against a local stub PAPI server
+
+    python3 bench/suite.py --rules 5000 --save baseline.json
+    python3 bench/suite.py --rules 5000 --compare baseline.json
+
+With --compare, the exit status is 1 if any benchmark is slower, or uses more
+memory, than the baseline by more than --tolerance.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import dirname, join, abspath
+sys.path.append(abspath(join(dirname(__file__), "..")))
+sys.path.append(abspath(dirname(__file__)))
+
+from src.jsonnet.writer import JsonnetWriter
+from src.jsonnet.formatter import get_formatter
+from src.jsonnet.papi.ruleformat import RuleFormat
+from src.jsonnet.papi.converter import RuleTreeConverter, HostnamesConverter
+from src.output import OutputTree
+from src.edgegrid import Session
+from src.ratelimit import RateLimiter
+from src.commands import papi
+from synthetic import synthetic_schema, synthetic_rule_tree, synthetic_hostnames, count_rules
+from stub import StubPapi
+
+BENCHMARKS = ("ruleformat", "ruletree", "hostnames", "bootstrap")
+PRODUCT = "prd_Synthetic"
+
+def inputs(args):
+  schema = synthetic_schema(args.behaviors, args.criteria, args.options, seed=args.seed)
+  ruleTree = synthetic_rule_tree(schema, args.rules, args.depth, args.fanout, args.density, args.criteriaDensity, args.advancedOverride, args.seed)
+  return (schema, ruleTree, synthetic_hostnames(args.hostnames))
+
+def bench_ruleformat(args, out):
+  (schema, _, _) = inputs(args)
+  def run():
+    output = OutputTree(out)
+    papi.write_ruleformat(output, RuleFormat(schema, PRODUCT, "v2023-01-05"))
+    output.flush()
+  return (run, args.behaviors + args.criteria, "atoms")
+
+def bench_ruletree(args, out):
+  (schema, ruleTree, _) = inputs(args)
+  ruleFormat = RuleFormat(schema, PRODUCT, ruleTree.get("ruleFormat"))
+  ruleFormat.catalog
+  def run():
+    output = OutputTree(out)
+    writer = JsonnetWriter()
+    RuleTreeConverter(ruleFormat, ruleTree, output, "template", dedup=args.dedup).convert(writer)
+    output.dump(join("template", "rules.jsonnet"), writer)
+    output.flush()
+  return (run, count_rules(ruleTree), "rules")
+
+def bench_hostnames(args, out):
+  (_, _, hostnames) = inputs(args)
+  edgeHostnames = dict((hostname.get("cnameTo"), {"ipVersionBehavior": "IPV4"}) for hostname in hostnames)
+  def run():
+    output = OutputTree(out)
+    writer = JsonnetWriter()
+    HostnamesConverter(hostnames).convert(writer, terraform=True, edgeHostnames=edgeHostnames)
+    output.dump("hostnames.jsonnet", writer)
+    output.flush()
+  return (run, len(hostnames), "hostnames")
+
+def bench_bootstrap(args, out):
+  if args.rateLimit is not None:
+    Session.limiter = RateLimiter(args.rateLimit)
+  def run():
+    papi.bootstrap(args.edgerc, "default", PRODUCT, "synthetic", ruleFormat="v2023-01-05", out=out, noCache=True, dedup=args.dedup)
+  return (run, args.items, "rules")
+
+def run_child(args):
+  """
+  Run a single benchmark in this process and print its results as json.
+  """
+  JsonnetWriter.formatter = get_formatter(args.formatter)
+  results = dict(name=args.child, seconds=None)
+  (stdout, stderr) = (sys.stdout, sys.stderr)
+  with open(os.devnull, "w") as devnull:
+    for _ in range(args.repeat):
+      with tempfile.TemporaryDirectory() as out:
+        (run, items, unit) = globals()["bench_" + args.child](args, out)
+        # commands report every file they write
+        (sys.stdout, sys.stderr) = (devnull, devnull)
+        try:
+          start = time.perf_counter()
+          run()
+          elapsed = time.perf_counter() - start
+        finally:
+          (sys.stdout, sys.stderr) = (stdout, stderr)
+        files = sum(len(filenames) for (_, _, filenames) in os.walk(out))
+      if results.get("seconds") is None or elapsed < results.get("seconds"):
+        results.update(seconds=elapsed, items=items, unit=unit, rate=items / elapsed, files=files)
+  # kilobytes on Linux, bytes on macOS
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  results["rss"] = maxrss if sys.platform == "darwin" else maxrss * 1024
+  print(json.dumps(results))
+
+def child_params(args):
+  return dict((name, value) for (name, value) in vars(args).items() if name not in ("child", "params", "benchmarks", "save", "compare", "tolerance", "delay", "stubRateLimit"))
+
+def saved_params(args):
+  return dict((name, value) for (name, value) in child_params(args).items() if name not in ("edgerc", "items"))
+
+def run_benchmark(args, name):
+  command = [sys.executable, abspath(__file__), "--child", name, "--params", json.dumps(child_params(args))]
+  completed = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+  return json.loads(completed.stdout.decode("utf-8").splitlines()[-1])
+
+def report(results, baseline=None, tolerance=0.0):
+  """
+  Print the results, next to the baseline if any, and return the regressions.
+  """
+  regressions = []
+  for result in results:
+    line = "{name:<12} {seconds:>8.3f}s {rate:>10.0f} {unit}/s {rss_mb:>8.1f} MB {files:>7} files".format(rss_mb=result.get("rss") / 2**20, **result)
+    previous = baseline.get(result.get("name")) if baseline is not None else None
+    if previous is not None:
+      speed = result.get("rate") / previous.get("rate")
+      memory = result.get("rss") / previous.get("rss")
+      line += " {:>6.2f}x speed {:>6.2f}x rss".format(speed, memory)
+      if speed < 1 - tolerance:
+        regressions.append("{} is {:.0%} slower".format(result.get("name"), 1 - speed))
+      if memory > 1 + tolerance:
+        regressions.append("{} uses {:.0%} more memory".format(result.get("name"), memory - 1))
+    print(line)
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK", help="benchmarks to run among {}, all by default".format(", ".join(BENCHMARKS)))
+  parser.add_argument("--rules", type=int, default=2000, help="number of rules in the rule tree")
+  parser.add_argument("--depth", type=int, default=6, help="maximum depth of the rule tree")
+  parser.add_argument("--fanout", type=int, default=10, help="children per rule")
+  parser.add_argument("--density", type=int, default=3, help="behaviors per rule")
+  parser.add_argument("--criteria-density", dest="criteriaDensity", type=int, default=1, help="criteria per rule")
+  parser.add_argument("--advanced-override", dest="advancedOverride", type=int, default=0, help="size of the advancedOverride of the default rule, in bytes")
+  parser.add_argument("--behaviors", type=int, default=200, help="number of behaviors in the schema")
+  parser.add_argument("--criteria", type=int, default=40, help="number of criteria in the schema")
+  parser.add_argument("--options", type=int, default=8, help="maximum number of options per behavior or criterion")
+  parser.add_argument("--hostnames", type=int, default=50)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--dedup", action="store_true", help="convert the rule tree with --dedup")
+  parser.add_argument("--formatter", default="builtin")
+  parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest one is reported")
+  parser.add_argument("--delay", type=float, default=0.0, help="latency added by the stub server, in seconds")
+  parser.add_argument("--stub-rate-limit", dest="stubRateLimit", type=int, default=None, help="requests per second beyond which the stub server answers with a 429")
+  parser.add_argument("--rate-limit", dest="rateLimit", type=float, default=None, help="--rate-limit of the bootstrap command")
+  parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+  parser.add_argument("--compare", metavar="FILE", help="compare the results with a baseline")
+  parser.add_argument("--tolerance", type=float, default=0.15, help="regression allowed by --compare, e.g. 0.15 for 15%%")
+  parser.add_argument("--child", choices=BENCHMARKS, help=argparse.SUPPRESS)
+  parser.add_argument("--params", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  (args.edgerc, args.items) = (None, None)
+  if args.params is not None:
+    vars(args).update(json.loads(args.params))
+  for name in args.benchmarks:
+    if name not in BENCHMARKS:
+      parser.error("unknown benchmark: {}".format(name))
+
+  if args.child is not None:
+    return run_child(args)
+
+  benchmarks = args.benchmarks or BENCHMARKS
+  baseline = None
+  if args.compare is not None:
+    with open(args.compare, "r") as fd:
+      saved = json.load(fd)
+    baseline = dict((result.get("name"), result) for result in saved.get("results"))
+    if saved.get("params") != saved_params(args):
+      print("!!! the baseline was run with other parameters: {}".format(json.dumps(saved.get("params"))), file=sys.stderr)
+
+  results = []
+  with contextlib.ExitStack() as stack:
+    if "bootstrap" in benchmarks:
+      (schema, ruleTree, hostnames) = inputs(args)
+      stub = StubPapi(schema, ruleTree, hostnames, delay=args.delay, rateLimit=args.stubRateLimit).start()
+      stack.callback(stub.stop)
+      tmp = stack.enter_context(tempfile.TemporaryDirectory())
+      args.edgerc = stub.write_edgerc(join(tmp, ".edgerc"))
+      # the rule tree is only generated by the stub, not by the benchmark
+      args.items = count_rules(ruleTree)
+      del (schema, ruleTree, hostnames)
+    for name in benchmarks:
+      results.append(run_benchmark(args, name))
+
+  regressions = report(results, baseline, args.tolerance)
+  if args.save is not None:
+    with open(args.save, "w") as fd:
+      json.dump(dict(params=saved_params(args), results=results), fd, indent=2)
+      fd.write("\n")
+  for regression in regressions:
+    print("!!! {}".format(regression), file=sys.stderr)
+  return 1 if len(regressions) else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Synthetic PAPI rule formats, rule trees and hostnames for the benchmarks.
+
+Everything is generated from a seed, so that runs with the same parameters
+convert exactly the same inputs.
+"""
+
+import random
+
+OPTION_TYPES = ("string", "boolean", "integer", "array")
+
+class SyntheticRuleFormat:
+  """
+  Stand-in for RuleFormat accepting the options of synthetic_rule_tree() without a schema.
+  """
+  product = "prd_Synthetic"
+  ruleFormat = "v2023-01-05"
+
+  def get_options(self, ns, name):
+    return {"behavior": {}, "ttl": {}, "enabled": {}, "values": {}, "matchOperator": {}}
+
+def synthetic_schema(behaviors=200, criteria=40, options=8, refs=0.3, seed=0):
+  """
+  Return a rule format schema with the given number of behaviors and criteria,
+  each with up to options options; a fraction refs of the options are $refs to
+  shared definitions, as in the real schemas.
+  """
+  rng = random.Random(seed)
+  definitions = dict()
+  for idx in range(max(1, options * 4)):
+    definitions["option_{}".format(idx)] = option_schema(rng)
+  catalog = dict(behaviors=dict(), criteria=dict())
+  for (ns, count) in (("behaviors", behaviors), ("criteria", criteria)):
+    for idx in range(count):
+      name = atom_name(ns, idx)
+      properties = dict()
+      for opt in range(rng.randint(1, options)):
+        if rng.random() < refs:
+          properties["option{}".format(opt)] = {"$ref": "#/definitions/option_{}".format(rng.randrange(len(definitions)))}
+        else:
+          properties["option{}".format(opt)] = option_schema(rng)
+      catalog[ns][name] = {
+        "type": "object",
+        "properties": {
+          "name": {"type": "string", "enum": [name]},
+          "options": {"type": "object", "properties": properties},
+        },
+      }
+  definitions["catalog"] = catalog
+  return {"$schema": "http://json-schema.org/draft-04/schema#", "definitions": definitions}
+
+def option_schema(rng):
+  kind = rng.choice(OPTION_TYPES)
+  option = {"type": kind}
+  if kind == "string":
+    option["enum"] = ["VALUE_{}".format(idx) for idx in range(rng.randint(2, 6))]
+    option["default"] = option["enum"][0]
+  elif kind == "boolean":
+    option["default"] = rng.random() < 0.5
+  elif kind == "integer":
+    option["default"] = rng.randint(0, 100)
+  else:
+    option["items"] = {"type": "string"}
+  return option
+
+def atom_name(ns, idx):
+  return "{}{}".format("behavior" if ns == "behaviors" else "criterion", idx)
+
+def synthetic_rule_tree(schema=None, rules=2000, depth=6, fanout=10, behaviors=3, criteria=1, advancedOverride=0, seed=0):
+  """
+  Return a rule tree of up to rules rules, breadth first with fanout children
+  per rule and at most depth levels below the default rule.
+
+  Each rule has behaviors behaviors and criteria criteria picked from schema,
+  or caching/gzipResponse/path ones without a schema; the default rule gets an
+  advancedOverride of advancedOverride bytes.
+  """
+  rng = random.Random(seed)
+  def atoms(ns, count):
+    if schema is None:
+      if ns == "criteria":
+        return [{"name": "path", "options": {"matchOperator": "MATCHES_ONE_OF", "values": ["/static/{}/*".format(rng.randrange(1000))]}}]
+      return [
+        {"name": "caching", "options": {"behavior": "MAX_AGE", "ttl": "{}d".format(rng.randint(1, 30))}},
+        {"name": "gzipResponse", "options": {"enabled": True}},
+      ][:count]
+    catalog = schema["definitions"]["catalog"][ns]
+    names = sorted(catalog.keys())
+    result = []
+    for _ in range(count):
+      name = rng.choice(names)
+      result.append({"name": name, "options": dict(
+        (option, option_value(rng, schema, spec)) for (option, spec) in catalog[name]["properties"]["options"]["properties"].items()
+      )})
+    return result
+  def rule(idx):
+    return {
+      "name": "Rule {}".format(idx),
+      "comments": "Synthetic rule number {}.".format(idx),
+      "uuid": "uuid-{}".format(idx),
+      "criteria": atoms("criteria", criteria),
+      "criteriaMustSatisfy": "all",
+      "behaviors": atoms("behaviors", behaviors),
+      "children": [],
+    }
+
+  root = rule(0)
+  root["name"] = "default"
+  root["options"] = {"is_secure": False}
+  root["variables"] = [
+    {"name": "PMUSER_VAR{}".format(idx), "value": "", "description": "", "hidden": False, "sensitive": False} for idx in range(3)
+  ]
+  if advancedOverride > 0:
+    root["advancedOverride"] = "<!-- synthetic -->\n" + ("<match:request.header name=\"X\" value=\"y\"/>\n" * (advancedOverride // 44 + 1))[:advancedOverride]
+  queue = [(root, 0)]
+  count = 1
+  while count < rules and len(queue):
+    (parent, level) = queue.pop(0)
+    if level >= depth:
+      continue
+    for _ in range(fanout):
+      if count >= rules:
+        break
+      child = rule(count)
+      parent["children"].append(child)
+      queue.append((child, level + 1))
+      count += 1
+  return {"contractId": "ctr_X", "groupId": "grp_X", "ruleFormat": "v2023-01-05", "rules": root}
+
+def option_value(rng, schema, spec):
+  if "$ref" in spec:
+    spec = schema["definitions"][spec["$ref"].rpartition("/")[2]]
+  kind = spec.get("type")
+  if kind == "string":
+    return rng.choice(spec["enum"])
+  if kind == "boolean":
+    return rng.random() < 0.5
+  if kind == "integer":
+    return rng.randint(0, 100)
+  return ["/path/{}".format(rng.randrange(1000)) for _ in range(rng.randint(1, 4))]
+
+def count_rules(ruleTree):
+  (count, pending) = (0, [ruleTree.get("rules")])
+  while len(pending):
+    count += 1
+    pending.extend(pending.pop().get("children", []))
+  return count
+
+def synthetic_hostnames(count=50):
+  return [
+    {
+      "cnameType": "EDGE_HOSTNAME",
+      "cnameFrom": "www{}.example.com".format(idx),
+      "cnameTo": "www{}.example.com.edgekey.net".format(idx),
+      "certProvisioningType": "CPS_MANAGED",
+    } for idx in range(count)
+  ]
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+from .metrics import metrics
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+class Cache:
+  """
+  Content-addressed on-disk cache.
+
+  Payloads are stored once per content digest under `objects/`, and each key
+  points to a payload through a small metadata file under `refs/`. The total
+  size of the payloads is kept in `index.json`, and when it exceeds `maxSize`
+  bytes, the least recently used payloads are evicted.
+  """
+
+  @staticmethod
+  def default_directory():
+    base = os.getenv("XDG_CACHE_HOME")
+    if not base:
+      base = str(pathlib.Path("~/.cache").expanduser())
+    return os.path.join(base, "akamai-jsonnet")
+
+  def __init__(self, directory=None, maxSize=DEFAULT_MAX_SIZE):
+    self.directory = directory if directory is not None else Cache.default_directory()
+    self.directory = str(pathlib.Path(self.directory).expanduser())
+    self.maxSize = maxSize
+
+  def _ref_path(self, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(self.directory, "refs", digest[:2], digest + ".json")
+
+  def _object_path(self, digest):
+    return os.path.join(self.directory, "objects", digest[:2], digest)
+
+  def _atomic_write(self, path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+      with os.fdopen(fd, "wb") as out:
+        out.write(data)
+      os.replace(tmp, path)
+    except:
+      os.unlink(tmp)
+      raise
+
+  def get(self, key):
+    """
+    Return the metadata stored for key, or None if it is not cached.
+    """
+    path = self._ref_path(key)
+    try:
+      with open(path, "r") as fd:
+        entry = json.load(fd)
+    except (OSError, ValueError):
+      return None
+    if entry.get("key") != key or not os.path.exists(self._object_path(entry.get("digest"))):
+      return None
+    return entry
+
+  def read(self, entry):
+    path = self._object_path(entry.get("digest"))
+    with open(path, "rb") as fd:
+      data = fd.read()
+    # mark as recently used, for eviction
+    os.utime(path)
+    return data
+
+  def load(self, key):
+    """
+    Return the payload stored for key, or None if it is not cached.
+    """
+    entry = self.get(key)
+    try:
+      data = self.read(entry) if entry is not None else None
+    except OSError:
+      data = None
+    metrics.count("cache.misses" if data is None else "cache.hits")
+    return data
+
+  def put(self, key, data, **meta):
+    digest = hashlib.sha256(data).hexdigest()
+    objectPath = self._object_path(digest)
+    if os.path.exists(objectPath):
+      os.utime(objectPath)
+    else:
+      total = self.size() + len(data)
+      self._atomic_write(objectPath, data)
+      if total > self.maxSize:
+        self.evict()
+      else:
+        self._write_index(total)
+    entry = dict(meta, key=key, digest=digest, size=len(data))
+    self._atomic_write(self._ref_path(key), json.dumps(entry).encode())
+    return entry
+
+  def size(self):
+    """
+    Return the total size of the payloads, as tracked by the index.
+
+    Processes sharing the cache may overwrite each other's updates, so the size
+    is approximate until the next eviction, which measures it again.
+    """
+    try:
+      with open(os.path.join(self.directory, "index.json"), "r") as fd:
+        return int(json.load(fd).get("size"))
+    except (OSError, ValueError, TypeError, AttributeError):
+      # caches predating the index
+      total = sum(size for (_, size, _) in self._objects())
+      self._write_index(total)
+      return total
+
+  def _write_index(self, total):
+    self._atomic_write(os.path.join(self.directory, "index.json"), json.dumps(dict(size=total)).encode())
+
+  def _objects(self):
+    """
+    Yield the mtime, size and path of each payload.
+    """
+    for (dirpath, _, filenames) in os.walk(os.path.join(self.directory, "objects")):
+      for filename in filenames:
+        if filename.startswith(".tmp-"):
+          continue
+        path = os.path.join(dirpath, filename)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        yield (stat.st_mtime, stat.st_size, path)
+
+  def evict(self):
+    """
+    Remove the least recently used payloads until they fit in maxSize.
+    """
+    objects = sorted(self._objects())
+    total = sum(size for (_, size, _) in objects)
+    for (_, size, path) in objects:
+      if total <= self.maxSize:
+        break
+      try:
+        os.unlink(path)
+        total -= size
+      except OSError:
+        pass
+    self._write_index(total)
+    self.prune()
+
+  def prune(self):
+    """
+    Remove refs pointing to evicted objects.
+    """
+    refsDir = os.path.join(self.directory, "refs")
+    for (dirpath, _, filenames) in os.walk(refsDir):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        try:
+          with open(path, "r") as fd:
+            digest = json.load(fd).get("digest")
+          if not os.path.exists(self._object_path(digest)):
+            os.unlink(path)
+        except (OSError, ValueError, TypeError):
+          pass
+
+def open_cache(cacheDir=None, noCache=False, cacheSize=None):
+  """
+  Return the cache configured on the command line, or None if caching is disabled.
+  """
+  if noCache:
+    return None
+  maxSize = DEFAULT_MAX_SIZE if cacheSize is None else cacheSize * 1024 * 1024
+  return Cache(cacheDir, maxSize)
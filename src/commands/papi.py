@@ -1,285 +1,809 @@
 import os, os.path
+import re
+import sys
 import json
+import glob
 from ..jsonnet.writer import JsonnetWriter
-from ..utils import pushd
-from ..edgegrid import Session
+from ..output import OutputTree
+from ..jsonstream import JsonStream
+from ..utils import gather, get_valid_filename
+from ..edgegrid import Session, DEFAULT_POOL_SIZE
+from ..cache import open_cache
 from ..logging import logger
-from ..jsonnet.papi.ruleformat import RuleFormat
-from ..jsonnet.papi.property import Property
-from ..jsonnet.papi.converter import RuleTreeConverter, RuleFormatConverter, HostnamesConverter
+from ..metrics import metrics, profiled
+from ..jsonnet.papi.ruleformat import RuleFormat, RuleFormatError
+from ..jsonnet.papi.property import Property, PropertyError
+from ..jsonnet.papi.converter import RuleTreeConverter, StreamingRuleTreeConverter, RuleFormatConverter, SplitRuleFormatConverter, HostnamesConverter, CommonRules
 import textwrap
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
-def products(edgerc, section, contractId, accountkey=None, **kwargs):
-  session = Session(edgerc, section, accountkey)
+# imports of lib/common files by properties, and by other common files
+COMMON_IMPORT = re.compile(r"""import\s*(['"])(common/[^'"]+)\1""")
+
+# rule format library of a jsonnet file, and the behaviors and criteria it uses
+LIBRARY_IMPORT = re.compile(r"""local papi = import (['"])(papi/[^'"]+)\1""")
+ATOM_REFERENCE = re.compile(r"\bpapi\.(behaviors|criteria)\.([_a-zA-Z][_a-zA-Z0-9]*)")
+
+# size of the generated files held in memory before writing them out, when
+# converting rule trees streamed from a file
+SPILL_SIZE = 64 * 1024 * 1024
+
+class BootstrapError(RuntimeError):
+  pass
+
+def products(edgerc, section, contractId, accountkey=None, poolSize=DEFAULT_POOL_SIZE, **kwargs):
+  session = Session(edgerc, section, accountkey, poolSize)
   response = session.get("/papi/v1/products", params={"contractId": contractId})
   products = response.json().get("products").get("items")
   print("\n".join(map(lambda p: "{productName}: {productId}".format(**p), products)))
 
-def ruleformat(edgerc, section, productId, ruleFormat="latest", accountkey=None, **kwargs):
-  ruleFormat = RuleFormat.get(edgerc, section, productId, ruleFormat, accountkey)
+def sync_catalog(edgerc, section, accountkey=None, cacheDir=None, noCache=False, cacheSize=None, poolSize=DEFAULT_POOL_SIZE, **kwargs):
+  cache = open_cache(cacheDir, noCache, cacheSize)
+  if cache is None:
+    raise PropertyError("the property catalog is kept in the cache, which --no-cache disables")
+  session = Session(edgerc, section, accountkey, poolSize)
+  properties = Property.syncCatalog(session, cache, poolSize)
+  print("### Indexed {} properties; property names are now resolved without searching the API".format(len(properties)))
+
+def ruleformat(edgerc, section, productId, ruleFormat="latest", accountkey=None, cacheDir=None, noCache=False, cacheSize=None, poolSize=DEFAULT_POOL_SIZE, trim=False, propertyNames=None, propertyVersion="latest", files=None, allow=None, layout="single", out=None, **kwargs):
+  session = Session(edgerc, section, accountkey, poolSize)
+  cache = open_cache(cacheDir, noCache, cacheSize)
+  ruleFormat = RuleFormat.get(session, productId, ruleFormat, cache)
+  atoms = None
+  if trim:
+    ruleTrees = []
+    for file in files or []:
+      with open(file, "r") as fd:
+        ruleTrees.append(json.load(fd))
+    with ThreadPoolExecutor(max_workers=poolSize) as executor:
+      ruleTrees += [property.ruleTree for property in gather(*(
+        executor.submit(Property.get, session, name, propertyVersion, ruleFormat, cache) for name in propertyNames or []
+      ))]
+    if len(ruleTrees) == 0:
+      raise RuleFormatError("--trim requires rule trees, see --propertyNames and --files")
+    atoms = get_trimmed_atoms(ruleFormat, ruleTrees, allow)
+  if out is not None:
+    output = OutputTree(os.path.realpath(out))
+    write_ruleformat(output, ruleFormat, atoms, layout, libDir="")
+    output.flush()
+    return
+  if layout != "single":
+    raise RuleFormatError("--layout {} writes several files, it requires --out".format(layout))
   writer = JsonnetWriter()
-  converter = RuleFormatConverter(ruleFormat)
-  converter.convert(writer)
+  converter = RuleFormatConverter(ruleFormat, atoms)
+  with metrics.phase("convert"):
+    converter.convert(writer)
   print(writer.getvalue())
 
-def ruletree(edgerc, section, productId, propertyName, propertyVersion="latest", file=None, out=None, ruleFormat="latest", accountkey=None, **kwargs):
-  ruleFormat = RuleFormat.get(edgerc, section, productId, ruleFormat, accountkey)
-  property = None
-  if file is None:
-    property = Property.get(edgerc, section, propertyName, propertyVersion, ruleFormat, accountkey)
+def get_trimmed_atoms(ruleFormat, ruleTrees, allow=None):
+  """
+  Return the atoms used by ruleTrees, plus those in the allow list.
+  """
+  atoms = RuleFormatConverter.allow_atoms(ruleFormat, allow or [], dict(behaviors=set(), criteria=set()))
+  for ruleTree in ruleTrees:
+    RuleFormatConverter.collect_atoms(ruleTree, atoms)
+  return atoms
+
+def ruletree(edgerc, section, productId, propertyName, propertyVersion="latest", file=None, out=None, ruleFormat="latest", accountkey=None, cacheDir=None, noCache=False, cacheSize=None, poolSize=DEFAULT_POOL_SIZE, archive=None, full=False, dedup=False, **kwargs):
+  session = Session(edgerc, section, accountkey, poolSize)
+  cache = open_cache(cacheDir, noCache, cacheSize)
+  ruleFormat = RuleFormat.get(session, productId, ruleFormat, cache)
+  out = os.path.realpath(propertyName if out is None else out)
+  # archives contain all the files, so they can't skip the unchanged ones
+  incremental = archive is None and not full
+  ruleTreeWriter = JsonnetWriter()
+  if file is None or dedup:
+    if file is None:
+      ruleTree = Property.get(session, propertyName, propertyVersion, ruleFormat, cache).ruleTree
+    else:
+      # finding the copies of subtrees requires the whole tree
+      with open(file, "r", encoding="utf-8") as fd:
+        ruleTree = json.load(fd)
+    output = OutputTree(out)
+    ruleTreeConverter = RuleTreeConverter(ruleFormat, ruleTree, output, incremental=incremental, dedup=dedup)
+    with metrics.phase("convert"):
+      ruleTreeConverter.convert(ruleTreeWriter)
   else:
-    with open(file, "r") as fd:
-      ruleTree = json.loads(fd.read())
-      property = Property(propertyName, None, ruleTree, [])
-
-  out = '%s/rules.jsonnet' % (propertyName if out is None else out)
-  with pushd(os.path.dirname(os.path.realpath(out))):
-    ruleTreeWriter = JsonnetWriter()
-    ruleTreeConverter = RuleTreeConverter(ruleFormat, property.ruleTree)
-    ruleTreeConverter.convert(ruleTreeWriter)
-    ruleTreeWriter.dump(os.path.basename(out))
+    # rule trees read from files can be huge: convert the rules as they are
+    # parsed, and write the files along the way unless they are archived
+    output = OutputTree(out, spillSize=SPILL_SIZE if archive is None else None)
+    with open(file, "r", encoding="utf-8") as fd:
+      ruleTreeConverter = StreamingRuleTreeConverter(ruleFormat, JsonStream(fd), output, incremental=incremental)
+      with metrics.phase("convert"):
+        ruleTreeConverter.convert(ruleTreeWriter)
+  output.dump('rules.jsonnet', ruleTreeWriter)
+  flush_output(output, archive)
+
+def flush_output(output, archive=None):
+  """
+  Write the output tree to disk, or to stdout as an archive.
+  """
+  if archive is not None:
+    output.archive(sys.stdout.buffer, archive)
+    sys.stdout.flush()
+  else:
+    output.flush()
 
-def hostnames(edgerc, section, propertyName, propertyVersion="latest", accountkey=None, **kwargs):
-  hostnames = Property.getHostnames(edgerc, section, propertyName, propertyVersion, accountkey)
+def hostnames(edgerc, section, propertyName, propertyVersion="latest", accountkey=None, cacheDir=None, noCache=False, cacheSize=None, poolSize=DEFAULT_POOL_SIZE, **kwargs):
+  session = Session(edgerc, section, accountkey, poolSize)
+  cache = open_cache(cacheDir, noCache, cacheSize)
+  hostnames = Property.getHostnames(session, propertyName, propertyVersion, cache)
   hostnamesWriter = JsonnetWriter()
   hostnamesConverter = HostnamesConverter(hostnames)
   hostnamesConverter.convert(hostnamesWriter)
   print(hostnamesWriter.getvalue())
 
-def bootstrap(edgerc, section, productId, propertyName, propertyVersion="latest", ruleFormat="latest", out=None, accountkey=None, bossman=False, terraform=False, **kwargs):
+def bootstrap(edgerc, section, productId, propertyName, propertyVersion="latest", ruleFormat="latest", out=None, accountkey=None, bossman=False, terraform=False, cacheDir=None, noCache=False, cacheSize=None, poolSize=DEFAULT_POOL_SIZE, archive=None, full=False, trim=False, allow=None, layout="single", dedup=False, **kwargs):
+  session = Session(edgerc, section, accountkey, poolSize)
+  cache = open_cache(cacheDir, noCache, cacheSize)
+  (ruleFormat, property, edgeHostnames) = fetch_bootstrap_inputs(session, cache, productId, ruleFormat, propertyName, propertyVersion)
   out = os.path.realpath(out if not out is None else propertyName)
-  with pushd(out):
-    with open('.gitignore', 'w', newline='\n') as gitignore:
-      if bossman:
-        gitignore.write(textwrap.dedent(
-          """
-          .bossmancache
-          """
-        ))
-      if terraform:
-        from ..utils import GITIGNORE_TERRAFORM
-        gitignore.write(textwrap.dedent(GITIGNORE_TERRAFORM))
-
-    ruleFormat = RuleFormat.get(edgerc, section, productId, ruleFormat, accountkey)
-    with pushd('lib/papi/{}'.format(ruleFormat.product)):
-      ruleFormatWriter = JsonnetWriter()
-      ruleFormatConverter = RuleFormatConverter(ruleFormat)
-      ruleFormatConverter.convert(ruleFormatWriter)
-      ruleFormatWriter.dump('{}.libsonnet'.format(ruleFormat.ruleFormat))
-
-    property = Property.get(edgerc, section, propertyName, propertyVersion, ruleFormat, accountkey)
-    edgeHostnames = get_edgehostnames(edgerc, section, property.contractId, property.groupId, accountkey=accountkey)
-    with pushd('template'):
-      ruleTreeWriter = JsonnetWriter()
-      ruleTreeConverter = RuleTreeConverter(ruleFormat, property.ruleTree)
-      ruleTreeConverter.convert(ruleTreeWriter)
-      ruleTreeWriter.dump('rules.jsonnet')
-
-      if terraform:
-        terraformWriter = JsonnetWriter()
-        terraformWriter.write(
-          f"""
-          local env = std.extVar('env');
-          local rules = import './rules.jsonnet';
-
-          {{
-            terraform: {{
-              required_version: '>= 1.0.0',
-              required_providers: {{
-                akamai: {{
-                  source: 'akamai/akamai',
-                  version: '>=2.4.2',
-                }},
-              }},
-            }},
+  output = OutputTree(out)
+  write_gitignore(output, bossman, terraform)
+  write_ruleformat(output, ruleFormat, get_trimmed_atoms(ruleFormat, [property.ruleTree], allow) if trim else None, layout)
+  write_property(output, property, ruleFormat, edgeHostnames, edgerc, section, terraform, incremental=archive is None and not full, dedup=dedup)
+  if bossman:
+    write_bossman(output, edgerc, section, accountkey)
+  write_render_scripts(output)
+  flush_output(output, archive)
+  if archive is not None:
+    return
 
-            provider: {{
-              akamai: {{
-                edgerc: '{edgerc}',
-                config_section: '{section}',
-              }}
-            }},
+  if terraform:
+    print(f'### Some required parameters must be set in {out}/envs/{property.name}.jsonnet')
+  print('### You may now render your template using:')
+  print('    akamai jsonnet render {out}'.format(out=out))
+  print('### or shell script:')
+  print('    {out}/render.sh'.format(out=out))
+  print('### or PowerShell script:')
+  print('    {out}/render.ps1'.format(out=out))
+  if terraform:
+    print('### You will then be able to run terraform from the dist dir')
+    print(f'    cd {out}/dist/{property.name}')
+    print(f'    terraform init')
+    print(f'    terraform import akamai_property.{property.name} {property.id}')
+    for idx, hostname in enumerate(property.hostnames):
+      if hostname.get('cnameTo') in edgeHostnames:
+        ehnId = edgeHostnames.get(hostname.get('cnameTo')).get('edgeHostnameId')
+        print(f'    terraform import akamai_edge_hostname.ehn_{idx} {ehnId},{property.contractId},{property.groupId}')
+    print(f'    terraform apply')
+  if bossman:
+    print('### Then run the following commands to get started with Bossman'.format(out=out))
+    print('    cd {out}'.format(out=out))
+    print('    $EDITOR .bossman # Check that contents are correct'.format(out=out))
+    print('    git init && git add . && git commit -m "init"')
+    print('    bossman init')
+    print('    bossman status')
 
-            resource: {{
-              akamai_edge_hostname: {{
-                [hostname.resourceId]: {{
-                  edge_hostname: hostname.cnameTo,
-                  ip_behavior: hostname.ipBehavior,
-                  product_id: rules.productId,
-                  contract_id: rules.contractId,
-                  group_id: rules.groupId,
-                  certificate: hostname.certificate,
-                }}
-                for hostname in std.mapWithIndex(function (idx, hostname) hostname + {{resourceId: 'ehn_%d' % idx}}, env.hostnames)
-              }},
-
-              akamai_property: {{
-                [env.name]: {{
-                  name: env.name,
-                  product_id: rules.productId,
-                  rule_format: rules.ruleFormat,
-                  contract_id: rules.contractId,
-                  group_id: rules.groupId,
-                  hostnames: std.map(function (hostname) {{
-                      cname_from: hostname.cnameFrom,
-                      cname_to: hostname.cnameTo,
-                      cert_provisioning_type: 'CPS_MANAGED',
-                    }}, env.hostnames),
-                  rules: '${{templatefile("./rules.json", {{}})}}',
-                }}
-              }},
-
-              akamai_property_activation: {{
-                [env.name + '-staging']: {{
-                  property_id: '${{akamai_property.%s.id}}' % env.name,
-                  version: '${{akamai_property.%s.latest_version}}' % env.name,
-                  network: 'STAGING',
-                  contact: env.contact,
-                }},
-
-              // Uncomment the following lines to let Terraform activate also on the
-              // Akamai production network.
-              // The strategy here is that the production network is pinned to a specific
-              // version defined in the Jsonnet environment file. This is a good strategy
-              // if you have few configurations, but it does require a new commit (to bless)
-              // a different version of the config.
-              // With many environments, it is likely better to always activate the latest version
-              // on the production network, but apply first on test envs (Essentially ignore
-              // the existence of the staging network).
-
-              //  [env.name + '-production']: {{
-              //    property_id: '${{akamai_property.%s.id}}' % env.name,
-              //    version: env.productionVersion,
-              //    network: 'PRODUCTION',
-              //    contact: env.contact,
-              //  }},
-              }},
-            }}
-          }}
-          """
-        )
-        terraformWriter.dump('terraform.tf.jsonnet')
-
-    with pushd('envs'):
-      envWriter = JsonnetWriter()
-      envWriter.writeln('{')
-      envWriter.writeln('name: {},'.format(json.dumps(property.name)))
-      if terraform:
-        envWriter.writeln('// The terraform template will reference these variables')
-        envWriter.writeln('// - to determine which version should be active in production.')
-        envWriter.writeln('productionVersion: error "productionVersion should be an integer",')
-
-        envWriter.writeln('// - to determine the email addresses to send notifications to.')
-        envWriter.writeln('contact: error "contact should be an array of email addresses",')
-
-      envWriter.write('hostnames: ')
-      hostnamesConverter = HostnamesConverter(property.hostnames)
-      hostnamesConverter.convert(envWriter, terraform, edgeHostnames)
-      envWriter.writeln(',')
-      envWriter.writeln('}')
-      envWriter.dump('{}.jsonnet'.format(property.name))
-
-    templateWriter = JsonnetWriter()
-    templateWriter.writeln('local env = std.extVar("env");')
-    templateWriter.writeln('')
-    templateWriter.writeln('{')
-    templateWriter.writeln('["%s/rules.json" % env.name]: import "template/rules.jsonnet",')
-    if not terraform:
-      # if we're generating for terraform, the hostnames are embedded in the terraform config file
-      templateWriter.writeln('["%s/hostnames.json" % env.name]: env.hostnames,')
-    if terraform:
-      templateWriter.writeln('["%s/terraform.tf.json" % env.name]: import "template/terraform.tf.jsonnet",')
-    templateWriter.writeln('}')
-    templateWriter.dump('template.jsonnet')
-
-    if bossman:
-      with open('./.bossman', 'w', newline='\n') as bossmanRcFd:
-        print(
-          (
-            'resources:\n'
-            '#   https://bossman.readthedocs.io/en/latest/plugins/akamai/property.html#resource-configuration\n'
-            '  - module: bossman.plugins.akamai.property\n'
-            '    pattern: dist/{{name}}\n'
-            '#   options:\n'
-            '#     edgerc: {edgerc}\n'
-            '#     section: {section}\n'
-            '#     env_prefix: ""\n'
-            '#     switch_key: {accountkey}\n'
-          ).format(
-            edgerc=edgerc if edgerc else "~/.edgerc",
-            section=section if section else "papi",
-            accountkey=accountkey if accountkey else "xyz"
-          ),
-          file=bossmanRcFd
+def bootstrap_many(edgerc, section, productId, out, propertyNames=None, pattern=None, manifest=None, propertyVersion="latest", ruleFormat="latest", jobs=None, accountkey=None, bossman=False, terraform=False, cacheDir=None, noCache=False, cacheSize=None, poolSize=DEFAULT_POOL_SIZE, archive=None, full=False, trim=False, allow=None, layout="single", dedup=False, common=False, **kwargs):
+  if dedup and common:
+    raise BootstrapError("--dedup and --common can't be used together")
+  session = Session(edgerc, section, accountkey, poolSize)
+  cache = open_cache(cacheDir, noCache, cacheSize)
+  specs = get_bootstrap_specs(session, productId, ruleFormat, propertyVersion, propertyNames, pattern, manifest, cache)
+  if len(specs) == 0:
+    raise BootstrapError("no properties to bootstrap")
+
+  # each distinct rule format is downloaded once and shared by all workers
+  keys = sorted(set((spec.get("productId"), spec.get("ruleFormat")) for spec in specs))
+  with ThreadPoolExecutor(max_workers=poolSize) as executor:
+    ruleFormats = dict(zip(keys, gather(*(executor.submit(RuleFormat.get, session, *key, cache) for key in keys))))
+
+  # with --trim, a library only has the atoms used by the properties sharing it
+  used = dict((key, get_trimmed_atoms(ruleFormat, [], allow)) for (key, ruleFormat) in ruleFormats.items())
+
+  out = os.path.realpath(out)
+  output = OutputTree(out)
+  write_gitignore(output, bossman, terraform)
+  if bossman:
+    write_bossman(output, edgerc, section, accountkey)
+  write_render_scripts(output, multi=True)
+  if archive is None:
+    output.flush()
+    output = OutputTree(out)
+
+  failures = []
+  initargs = (edgerc, section, accountkey, poolSize, cacheDir, noCache, cacheSize, JsonnetWriter.formatter, ruleFormats, metrics.enabled, Session.transport, Session.limiter)
+  spool = tempfile.TemporaryDirectory(prefix="akamai-jsonnet-") if common else None
+  try:
+    (commonRules, prepared, uses) = (None, dict(), dict())
+    if common:
+      with ProcessPoolExecutor(max_workers=jobs, initializer=init_bootstrap_worker, initargs=initargs) as executor:
+        (commonRules, prepared, uses, failures) = analyze_common(executor, specs, spool.name)
+      initargs += (commonRules, CommonRules.key(commonRules))
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_bootstrap_worker, initargs=initargs) as executor:
+      (pending, owned, succeeded, converted) = ([index for (index, spec) in enumerate(specs) if not common or index in prepared], assign_common(uses), set(), set())
+      while len(pending):
+        futures = dict(
+          (executor.submit(profiled, bootstrap_worker, out, specs[index], terraform, archive is not None, not full, dedup, prepared.get(index), owned.get(index)), index)
+          for index in pending
         )
-        os.chmod(bossmanRcFd.name, mode=0o640)
-
-    with open('./render.sh', 'w', newline='\n') as renderFd:
-      print(
-        '#!/bin/sh\n'
-        'set -e\n'
-        '\n'
-        'echo ">" cd $(dirname $0)\n'
-        'cd $(dirname $0)\n'
-        'ls envs/*.jsonnet |\n'
-        '  while IFS=/ read _ envFile; do\n'
-        '    envName=$(basename $envFile .jsonnet)\n'
-        '    echo "> Rendering $envName..."\n'
-        '    jsonnet -cm ./dist -J ./lib \\\n'
-        '      --ext-code-file env=./envs/${envFile} \\\n'
-        '      ./template.jsonnet\n'
-        '    echo\n'
-        '  done\n',
-        file=renderFd
-      )
-      os.chmod(renderFd.name, mode=0o750)
-
-    with open('./render.ps1', 'w', newline='\n') as renderFd:
-      print(
-        '#!/usr/bin/env pwsh\n'
-        '\n'
-        '$dirname = $PSScriptRoot\n'
-        'echo "> cd $dirname"\n'
-        'cd $dirname\n'
-        'Get-ChildItem "envs" -Filter "*.jsonnet" |\n'
-        'Foreach-Object {\n'
-        '  $envName=Split-Path $_.FullName -LeafBase\n'
-        '  echo "> Rendering $envName..."\n'
-        '  jsonnet -cm dist -J "lib"`\n'
-        '    --ext-code-file "env=$($_.FullName)"`\n'
-        '      template.jsonnet\n'
-        '  echo ""\n'
-        '}\n',
-        file=renderFd
-      )
-      os.chmod(renderFd.name, mode=0o750)
-
-    if terraform:
-      print(f'### Some required parameters must be set in {out}/envs/{property.name}.jsonnet')
-    print('### You may now render your template using shell script:')
+        for future in as_completed(futures):
+          index = futures[future]
+          spec = specs[index]
+          name = spec.get("propertyName")
+          try:
+            (error, files, atoms) = metrics.merge_result(future.result())
+          except Exception as e:
+            (error, files, atoms) = ("%s: %s" % (e.__class__.__name__, str(e)), None, None)
+          if files is not None:
+            output.merge(files)
+          if atoms is not None:
+            for (ns, names) in atoms.items():
+              used[(spec.get("productId"), spec.get("ruleFormat"))][ns].update(names)
+          if error is not None:
+            succeeded.discard(index)
+            failures.append((name, error))
+            print("!!! failed to bootstrap", name, file=sys.stderr)
+          else:
+            succeeded.add(index)
+            converted.update(owned.get(index, set()))
+            print("*** bootstrapped", name, file=sys.stderr)
+        if not common:
+          break
+        # the common files of the properties that failed are converted again by
+        # other properties importing them, which fail in turn if they can't
+        missing = set().union(*(uses.get(index) for index in succeeded)) - converted
+        owned = assign_common(dict((index, uses.get(index) & missing) for index in succeeded))
+        pending = sorted(owned)
+        if len(pending):
+          print("*** converting {} common files again".format(len(missing)), file=sys.stderr)
+  finally:
+    # the spooled rule trees are of no use once converted, or after a failure
+    if spool is not None:
+      spool.cleanup()
+
+  if trim and archive is None:
+    collect_existing_atoms(output, ruleFormats, used, [get_valid_filename(spec.get("propertyName")) for spec in specs])
+  for (key, ruleFormat) in ruleFormats.items():
+    write_ruleformat(output, ruleFormat, used.get(key) if trim else None, layout)
+  if common and archive is None:
+    remove_stale_common(output)
+  if archive is not None:
+    # stdout carries the archive, so the summary goes to stderr
+    flush_output(output, archive)
+    for (name, error) in sorted(failures):
+      print(textwrap.indent("%s: %s" % (name, error), prefix='!!! '), file=sys.stderr)
+  else:
+    output.flush()
+    print('### Bootstrapped {} of {} properties into {}/properties'.format(len(specs) - len(failures), len(specs), out))
+    for (name, error) in sorted(failures):
+      print(textwrap.indent("%s: %s" % (name, error), prefix='!!! '))
+    print('### You may now render your templates in parallel using:')
+    print('    akamai jsonnet render {out}'.format(out=out))
+    print('### or shell script:')
     print('    {out}/render.sh'.format(out=out))
     print('### or PowerShell script:')
     print('    {out}/render.ps1'.format(out=out))
-    if terraform:
-      print('### You will then be able to run terraform from the dist dir')
-      print(f'    cd {out}/dist/{property.name}')
-      print(f'    terraform init')
-      print(f'    terraform import akamai_property.{property.name} {property.id}')
-      for idx, hostname in enumerate(property.hostnames):
-        if hostname.get('cnameTo') in edgeHostnames:
-          ehnId = edgeHostnames.get(hostname.get('cnameTo')).get('edgeHostnameId')
-          print(f'    terraform import akamai_edge_hostname.ehn_{idx} {ehnId},{property.contractId},{property.groupId}')
-      print(f'    terraform apply')
-    if bossman:
-      print('### Then run the following commands to get started with Bossman'.format(out=out))
-      print('    cd {out}'.format(out=out))
-      print('    $EDITOR .bossman # Check that contents are correct'.format(out=out))
-      print('    git init && git add . && git commit -m "init"')
-      print('    bossman init')
-      print('    bossman status')
-
-def get_edgehostnames(edgerc, section, contractId, groupId, accountkey=None, **kwargs):
-  session = Session(edgerc, section, accountkey)
+  if len(failures):
+    raise BootstrapError("failed to bootstrap {} of {} properties".format(len(failures), len(specs)))
+
+def collect_existing_atoms(output, ruleFormats, used, names):
+  """
+  Add the behaviors and criteria that the properties of properties/ other than
+  names, and the files of lib/common, use from each rule format library to
+  used, so that trimming a library doesn't break the properties left out of
+  the run.
+  """
+  libraries = dict(
+    ("papi/{}/{}.libsonnet".format(ruleFormat.product, ruleFormat.ruleFormat), used.get(key))
+    for (key, ruleFormat) in ruleFormats.items()
+  )
+  roots = [os.path.join(output.root, CommonRules.dirname)]
+  propertiesDir = os.path.join(output.root, "properties")
+  if os.path.isdir(propertiesDir):
+    roots += [os.path.join(propertiesDir, name) for name in sorted(set(os.listdir(propertiesDir)) - set(names))]
+  for root in roots:
+    for (dirpath, dirnames, filenames) in os.walk(root):
+      for filename in filenames:
+        if not filename.endswith("sonnet"):
+          continue
+        with open(os.path.join(dirpath, filename), "r", encoding="utf-8") as fd:
+          source = fd.read()
+        library = LIBRARY_IMPORT.search(source)
+        atoms = libraries.get(library.group(2)) if library is not None else None
+        if atoms is not None:
+          for (ns, name) in ATOM_REFERENCE.findall(source):
+            atoms[ns].add(name)
+
+def get_bootstrap_specs(session, productId, ruleFormat, propertyVersion, propertyNames=None, pattern=None, manifest=None, cache=None):
+  """
+  List the properties to bootstrap, along with their version, product and rule format.
+
+  Properties matching pattern are taken from the property catalog, if it was synced.
+  """
+  defaults = dict(propertyVersion=propertyVersion, productId=productId, ruleFormat=ruleFormat)
+  if propertyNames is not None:
+    entries = propertyNames
+  elif pattern is not None:
+    regex = re.compile(pattern)
+    catalog = Property.loadCatalog(session, cache) if cache is not None else dict()
+    names = catalog.keys() if len(catalog) else [p.get("propertyName") for p in Property.list(session)]
+    entries = sorted(name for name in names if regex.search(name))
+  else:
+    with open(manifest, "r") as fd:
+      entries = json.load(fd)
+    if not isinstance(entries, list):
+      raise BootstrapError("{}: expecting a list of property names or objects".format(manifest))
+  specs = []
+  for entry in entries:
+    spec = dict(defaults, **(entry if isinstance(entry, dict) else dict(propertyName=entry)))
+    if not spec.get("propertyName"):
+      raise BootstrapError("missing propertyName: {}".format(json.dumps(entry)))
+    specs.append(spec)
+  return specs
+
+def analyze_common(executor, specs, spool):
+  """
+  Fetch the rule trees of all the properties into spool, and find the rules,
+  criteria and behaviors found in more than one property.
+
+  Return the common (kind, digest) pairs, the property found and the rule tree
+  file of each spec by index, the common pairs each spec imports by index, and
+  the failures.
+  """
+  print("*** looking for rules common to several properties", file=sys.stderr)
+  futures = dict((executor.submit(profiled, analyze_worker, spec, os.path.join(spool, "{}.json".format(index))), index) for (index, spec) in enumerate(specs))
+  (counts, analyzed, prepared, failures) = (Counter(), dict(), dict(), [])
+  for future in as_completed(futures):
+    index = futures[future]
+    try:
+      (error, found, digests) = metrics.merge_result(future.result())
+    except Exception as e:
+      (error, found, digests) = ("%s: %s" % (e.__class__.__name__, str(e)), None, None)
+    if error is not None:
+      failures.append((specs[index].get("propertyName"), error))
+      print("!!! failed to analyze", specs[index].get("propertyName"), file=sys.stderr)
+      continue
+    prepared[index] = found
+    analyzed[index] = digests
+    counts.update(digests)
+  common = set(digest for (digest, count) in counts.items() if count > 1)
+  uses = dict((index, digests & common) for (index, digests) in analyzed.items())
+  print("*** found {} rules, criteria and behaviors common to several properties".format(len(common)), file=sys.stderr)
+  return (common, prepared, uses, failures)
+
+def assign_common(uses):
+  """
+  Return the common (kind, digest) pairs each spec converts, by index, given
+  those it imports: each pair is converted by the first spec importing it.
+  """
+  (owned, assigned) = (dict(), set())
+  for index in sorted(uses):
+    digests = uses.get(index) - assigned
+    if len(digests):
+      owned[index] = digests
+      assigned.update(digests)
+  return owned
+
+def remove_stale_common(output):
+  """
+  Remove the files of lib/common that no property under properties/ imports
+  anymore, directly or through other common files, whether it was part of
+  this run or not.
+  """
+  root = os.path.join(output.root, CommonRules.dirname)
+  files = set()
+  for (dirpath, dirnames, filenames) in os.walk(root):
+    files.update(os.path.relpath(os.path.join(dirpath, filename), output.root) for filename in filenames)
+  if len(files) == 0:
+    return
+  pending = []
+  for (dirpath, dirnames, filenames) in os.walk(os.path.join(output.root, "properties")):
+    pending.extend(os.path.join(dirpath, filename) for filename in filenames if filename.endswith("sonnet"))
+  imported = set()
+  while len(pending):
+    with open(pending.pop(), "r", encoding="utf-8") as fd:
+      source = fd.read()
+    for match in COMMON_IMPORT.finditer(source):
+      path = os.path.normpath(os.path.join("lib", match.group(2)))
+      if path in imported or path not in files:
+        continue
+      # the children of common rules are in a directory named after them
+      children = os.path.splitext(path)[0] + os.sep
+      for child in [path] + [file for file in files if file.startswith(children)]:
+        if child not in imported:
+          imported.add(child)
+          pending.append(os.path.join(output.root, child))
+  for path in files - imported:
+    output.remove(path)
+
+_worker = dict()
+
+def init_bootstrap_worker(edgerc, section, accountkey, poolSize, cacheDir, noCache, cacheSize, formatter, ruleFormats, profile=False, transport=None, limiter=None, common=None, commonKey=None):
+  JsonnetWriter.formatter = formatter
+  if transport is not None:
+    Session.transport = transport
+  Session.limiter = limiter
+  metrics.reset(profile)
+  _worker.update(
+    session=Session(edgerc, section, accountkey, poolSize),
+    cache=open_cache(cacheDir, noCache, cacheSize),
+    ruleFormats=ruleFormats,
+    edgerc=edgerc,
+    section=section,
+    common=common,
+    commonKey=commonKey,
+  )
+
+def analyze_worker(spec, ruleTreeFile):
+  """
+  Fetch the rule tree of one property into ruleTreeFile, for bootstrap_worker.
+
+  Return an error message on failure, the property as found with the rule
+  tree file, and the (kind, digest) pairs of its rules, criteria and behaviors.
+  """
+  try:
+    (session, cache) = (_worker.get("session"), _worker.get("cache"))
+    ruleFormat = _worker.get("ruleFormats").get((spec.get("productId"), spec.get("ruleFormat")))
+    name = spec.get("propertyName")
+    found = Property.find(session, name, spec.get("propertyVersion"), cache)
+    ruleTree = Property.fetchRules(session, name, found.get("propertyId"), found.get("propertyVersion"), ruleFormat.ruleFormat, cache, ruleFormat.digest)
+    with open(ruleTreeFile, "w") as fd:
+      json.dump(ruleTree, fd)
+    return (None, dict(found, ruleTreeFile=ruleTreeFile), CommonRules.analyze(ruleTree, get_common_salt(ruleFormat)))
+  except Exception as e:
+    return ("%s: %s" % (e.__class__.__name__, str(e)), None, None)
+
+def get_common_salt(ruleFormat):
+  # common files depend on the rule format they are converted with
+  return "{}/{}".format(ruleFormat.product, ruleFormat.ruleFormat)
+
+def bootstrap_worker(out, spec, terraform=False, collect=False, incremental=True, dedup=False, found=None, owned=None):
+  """
+  Fetch and convert one property into {out}/properties.
+
+  found is the property as found by analyze_worker, along with its rule tree
+  file, and owned the common files it converts, with --common.
+
+  Return an error message on failure, the generated files instead of writing
+  them if collect is set, and the atoms the property uses.
+  """
+  try:
+    (session, cache) = (_worker.get("session"), _worker.get("cache"))
+    ruleFormat = _worker.get("ruleFormats").get((spec.get("productId"), spec.get("ruleFormat")))
+    name = spec.get("propertyName")
+    ruleTreeFile = None
+    if found is None:
+      found = Property.find(session, name, spec.get("propertyVersion"), cache)
+    else:
+      ruleTreeFile = found.get("ruleTreeFile")
+    with ThreadPoolExecutor(max_workers=3) as executor:
+      (ruleTree, hostnames, edgeHostnames) = gather(*submit_property_fetches(executor, session, cache, name, found, ruleFormat.ruleFormat, ruleTreeFile, ruleFormat.digest))
+    property = Property(name, found.get("propertyId"), ruleTree, hostnames)
+    common = None
+    if _worker.get("common") is not None:
+      common = CommonRules(ruleTree, get_common_salt(ruleFormat), _worker.get("common"), owned or set(), _worker.get("commonKey"))
+    output = OutputTree(out)
+    prefix = os.path.join("properties", get_valid_filename(name))
+    write_property(output, property, ruleFormat, edgeHostnames, _worker.get("edgerc"), _worker.get("section"), terraform, prefix, incremental and not collect, dedup, common)
+    atoms = RuleFormatConverter.collect_atoms(property.ruleTree)
+    if collect:
+      output.format()
+      return (None, output.files, atoms)
+    output.flush()
+  except Exception as e:
+    return ("%s: %s" % (e.__class__.__name__, str(e)), None, None)
+  return (None, None, atoms)
+
+def write_gitignore(output, bossman=False, terraform=False):
+  gitignore = ''
+  if bossman:
+    gitignore += textwrap.dedent(
+      """
+      .bossmancache
+      """
+    )
+  if terraform:
+    from ..utils import GITIGNORE_TERRAFORM
+    gitignore += textwrap.dedent(GITIGNORE_TERRAFORM)
+  output.write('.gitignore', gitignore)
+
+def write_ruleformat(output, ruleFormat, atoms=None, layout="single", libDir="lib"):
+  dirname = os.path.join(libDir, 'papi', ruleFormat.product)
+  # remove the files of the atoms left out of a split library generated before,
+  # or of all of them when the library isn't split anymore
+  atomsDir = os.path.join(dirname, ruleFormat.ruleFormat)
+  for ns in ("behaviors", "criteria"):
+    for path in sorted(glob.glob(os.path.join(glob.escape(os.path.join(output.root, atomsDir, ns)), "*.libsonnet"))):
+      output.remove(os.path.join(atomsDir, ns, os.path.basename(path)))
+  ruleFormatWriter = JsonnetWriter()
+  if layout == "split":
+    ruleFormatConverter = SplitRuleFormatConverter(ruleFormat, output, dirname, atoms)
+  else:
+    ruleFormatConverter = RuleFormatConverter(ruleFormat, atoms)
+  with metrics.phase("convert"):
+    ruleFormatConverter.convert(ruleFormatWriter)
+  output.dump(os.path.join(dirname, '{}.libsonnet'.format(ruleFormat.ruleFormat)), ruleFormatWriter)
+
+def write_property(output, property, ruleFormat, edgeHostnames, edgerc, section, terraform=False, prefix="", incremental=False, dedup=False, common=None):
+  """
+  Write a property's template, template/ and envs/ to the prefix directory of output.
+  """
+  templateDir = os.path.join(prefix, 'template')
+  ruleTreeWriter = JsonnetWriter()
+  ruleTreeConverter = RuleTreeConverter(ruleFormat, property.ruleTree, output, templateDir, incremental, dedup, common)
+  with metrics.phase("convert"):
+    ruleTreeConverter.convert(ruleTreeWriter)
+  output.dump(os.path.join(templateDir, 'rules.jsonnet'), ruleTreeWriter)
+
+  if terraform:
+    terraformWriter = JsonnetWriter()
+    terraformWriter.write(
+      f"""
+      local env = std.extVar('env');
+      local rules = import './rules.jsonnet';
+
+      {{
+        terraform: {{
+          required_version: '>= 1.0.0',
+          required_providers: {{
+            akamai: {{
+              source: 'akamai/akamai',
+              version: '>=2.4.2',
+            }},
+          }},
+        }},
+
+        provider: {{
+          akamai: {{
+            edgerc: '{edgerc}',
+            config_section: '{section}',
+          }}
+        }},
+
+        resource: {{
+          akamai_edge_hostname: {{
+            [hostname.resourceId]: {{
+              edge_hostname: hostname.cnameTo,
+              ip_behavior: hostname.ipBehavior,
+              product_id: rules.productId,
+              contract_id: rules.contractId,
+              group_id: rules.groupId,
+              certificate: hostname.certificate,
+            }}
+            for hostname in std.mapWithIndex(function (idx, hostname) hostname + {{resourceId: 'ehn_%d' % idx}}, env.hostnames)
+          }},
+
+          akamai_property: {{
+            [env.name]: {{
+              name: env.name,
+              product_id: rules.productId,
+              rule_format: rules.ruleFormat,
+              contract_id: rules.contractId,
+              group_id: rules.groupId,
+              hostnames: std.map(function (hostname) {{
+                  cname_from: hostname.cnameFrom,
+                  cname_to: hostname.cnameTo,
+                  cert_provisioning_type: 'CPS_MANAGED',
+                }}, env.hostnames),
+              rules: '${{templatefile("./rules.json", {{}})}}',
+            }}
+          }},
+
+          akamai_property_activation: {{
+            [env.name + '-staging']: {{
+              property_id: '${{akamai_property.%s.id}}' % env.name,
+              version: '${{akamai_property.%s.latest_version}}' % env.name,
+              network: 'STAGING',
+              contact: env.contact,
+            }},
+
+          // Uncomment the following lines to let Terraform activate also on the
+          // Akamai production network.
+          // The strategy here is that the production network is pinned to a specific
+          // version defined in the Jsonnet environment file. This is a good strategy
+          // if you have few configurations, but it does require a new commit (to bless)
+          // a different version of the config.
+          // With many environments, it is likely better to always activate the latest version
+          // on the production network, but apply first on test envs (Essentially ignore
+          // the existence of the staging network).
+
+          //  [env.name + '-production']: {{
+          //    property_id: '${{akamai_property.%s.id}}' % env.name,
+          //    version: env.productionVersion,
+          //    network: 'PRODUCTION',
+          //    contact: env.contact,
+          //  }},
+          }},
+        }}
+      }}
+      """
+    )
+    output.dump(os.path.join(templateDir, 'terraform.tf.jsonnet'), terraformWriter)
+
+  envWriter = JsonnetWriter()
+  envWriter.writeln('{')
+  envWriter.writeln('name: {},'.format(json.dumps(property.name)))
+  if terraform:
+    envWriter.writeln('// The terraform template will reference these variables')
+    envWriter.writeln('// - to determine which version should be active in production.')
+    envWriter.writeln('productionVersion: error "productionVersion should be an integer",')
+
+    envWriter.writeln('// - to determine the email addresses to send notifications to.')
+    envWriter.writeln('contact: error "contact should be an array of email addresses",')
+
+  envWriter.write('hostnames: ')
+  hostnamesConverter = HostnamesConverter(property.hostnames)
+  hostnamesConverter.convert(envWriter, terraform, edgeHostnames)
+  envWriter.writeln(',')
+  envWriter.writeln('}')
+  output.dump(os.path.join(prefix, 'envs', '{}.jsonnet'.format(property.name)), envWriter)
+
+  templateWriter = JsonnetWriter()
+  templateWriter.writeln('local env = std.extVar("env");')
+  templateWriter.writeln('')
+  templateWriter.writeln('{')
+  templateWriter.writeln('["%s/rules.json" % env.name]: import "template/rules.jsonnet",')
+  if not terraform:
+    # if we're generating for terraform, the hostnames are embedded in the terraform config file
+    templateWriter.writeln('["%s/hostnames.json" % env.name]: env.hostnames,')
+  if terraform:
+    templateWriter.writeln('["%s/terraform.tf.json" % env.name]: import "template/terraform.tf.jsonnet",')
+  templateWriter.writeln('}')
+  output.dump(os.path.join(prefix, 'template.jsonnet'), templateWriter)
+
+def write_bossman(output, edgerc, section, accountkey=None):
+  output.write(
+    '.bossman',
+    (
+      'resources:\n'
+      '#   https://bossman.readthedocs.io/en/latest/plugins/akamai/property.html#resource-configuration\n'
+      '  - module: bossman.plugins.akamai.property\n'
+      '    pattern: dist/{{name}}\n'
+      '#   options:\n'
+      '#     edgerc: {edgerc}\n'
+      '#     section: {section}\n'
+      '#     env_prefix: ""\n'
+      '#     switch_key: {accountkey}\n'
+    ).format(
+      edgerc=edgerc if edgerc else "~/.edgerc",
+      section=section if section else "papi",
+      accountkey=accountkey if accountkey else "xyz"
+    ) + '\n',
+    mode=0o640
+  )
+
+def write_render_scripts(output, multi=False):
+  if multi:
+    write_multi_render_scripts(output)
+    return
+
+  output.write(
+    'render.sh',
+    '#!/bin/sh\n'
+    'set -e\n'
+    '\n'
+    'echo ">" cd $(dirname $0)\n'
+    'cd $(dirname $0)\n'
+    'ls envs/*.jsonnet |\n'
+    '  while IFS=/ read _ envFile; do\n'
+    '    envName=$(basename $envFile .jsonnet)\n'
+    '    echo "> Rendering $envName..."\n'
+    '    jsonnet -cm ./dist -J ./lib \\\n'
+    '      --ext-code-file env=./envs/${envFile} \\\n'
+    '      ./template.jsonnet\n'
+    '    echo\n'
+    '  done\n' + '\n',
+    mode=0o750
+  )
+
+  output.write(
+    'render.ps1',
+    '#!/usr/bin/env pwsh\n'
+    '\n'
+    '$dirname = $PSScriptRoot\n'
+    'echo "> cd $dirname"\n'
+    'cd $dirname\n'
+    'Get-ChildItem "envs" -Filter "*.jsonnet" |\n'
+    'Foreach-Object {\n'
+    '  $envName=Split-Path $_.FullName -LeafBase\n'
+    '  echo "> Rendering $envName..."\n'
+    '  jsonnet -cm dist -J "lib"`\n'
+    '    --ext-code-file "env=$($_.FullName)"`\n'
+    '      template.jsonnet\n'
+    '  echo ""\n'
+    '}\n' + '\n',
+    mode=0o750
+  )
+
+def write_multi_render_scripts(output):
+  output.write(
+    'render.sh',
+    '#!/bin/sh\n'
+    'set -e\n'
+    '\n'
+    'echo ">" cd $(dirname $0)\n'
+    'cd $(dirname $0)\n'
+    'for envPath in properties/*/envs/*.jsonnet; do\n'
+    '  propertyDir=$(dirname $(dirname $envPath))\n'
+    '  envName=$(basename $envPath .jsonnet)\n'
+    '  echo "> Rendering $envName..."\n'
+    '  jsonnet -cm ./dist -J ./lib \\\n'
+    '    --ext-code-file env=./${envPath} \\\n'
+    '    ./${propertyDir}/template.jsonnet\n'
+    '  echo\n'
+    'done\n' + '\n',
+    mode=0o750
+  )
+
+  output.write(
+    'render.ps1',
+    '#!/usr/bin/env pwsh\n'
+    '\n'
+    '$dirname = $PSScriptRoot\n'
+    'echo "> cd $dirname"\n'
+    'cd $dirname\n'
+    'Get-ChildItem "properties/*/envs" -Filter "*.jsonnet" |\n'
+    'Foreach-Object {\n'
+    '  $envName=Split-Path $_.FullName -LeafBase\n'
+    '  $propertyDir=Split-Path (Split-Path $_.FullName -Parent) -Parent\n'
+    '  echo "> Rendering $envName..."\n'
+    '  jsonnet -cm dist -J "lib"`\n'
+    '    --ext-code-file "env=$($_.FullName)"`\n'
+    '      "$propertyDir/template.jsonnet"\n'
+    '  echo ""\n'
+    '}\n' + '\n',
+    mode=0o750
+  )
+
+def fetch_bootstrap_inputs(session, cache, productId, ruleFormat, propertyName, propertyVersion):
+  """
+  Fetch everything bootstrap needs from the API, concurrently.
+
+  The rule format schema doesn't depend on the property, and the rule tree,
+  hostnames and edge hostnames only depend on the property lookup.
+  """
+  executor = ThreadPoolExecutor(max_workers=4)
+  try:
+    ruleFormatFuture = executor.submit(RuleFormat.get, session, productId, ruleFormat, cache)
+    foundFuture = executor.submit(Property.find, session, propertyName, propertyVersion, cache)
+    pending = {ruleFormatFuture, foundFuture}
+    while foundFuture in pending:
+      # report a failure to get the schema or to find the property without
+      # waiting for the other one
+      done, pending = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        future.result()
+    found = foundFuture.result()
+    schemaDigest = None
+    if ruleFormat == "latest" and cache is not None:
+      # the cached rule tree depends on the schema "latest" resolves to
+      schemaDigest = ruleFormatFuture.result().digest
+    (ruleFormat, ruleTree, hostnames, edgeHostnames) = gather(
+      ruleFormatFuture,
+      *submit_property_fetches(executor, session, cache, propertyName, found, ruleFormat, schemaDigest=schemaDigest)
+    )
+  except:
+    # leaving a with block would wait for the requests still running
+    executor.shutdown(wait=False, cancel_futures=True)
+    raise
+  executor.shutdown()
+  return (ruleFormat, Property(propertyName, found.get("propertyId"), ruleTree, hostnames), edgeHostnames)
+
+def submit_property_fetches(executor, session, cache, propertyName, found, ruleFormat, ruleTreeFile=None, schemaDigest=None):
+  """
+  Submit the requests for a property's rule tree, unless it was saved to
+  ruleTreeFile already, hostnames and edge hostnames.
+
+  schemaDigest is the digest of the schema ruleFormat resolves to, see
+  Property.fetchRules.
+  """
+  (pid, version) = (found.get("propertyId"), found.get("propertyVersion"))
+  return (
+    executor.submit(Property.fetchRules, session, propertyName, pid, version, ruleFormat, cache, schemaDigest) if ruleTreeFile is None else executor.submit(load_json, ruleTreeFile),
+    executor.submit(Property.fetchHostnames, session, propertyName, pid, version, cache),
+    executor.submit(get_edgehostnames, session, found.get("contractId"), found.get("groupId")),
+  )
+
+def load_json(path):
+  with open(path, "r") as fd:
+    return json.load(fd)
+
+def get_edgehostnames(session, contractId, groupId):
   response = session.get("/papi/v1/edgehostnames", params={
     "contractId": contractId,
     "groupId": groupId,
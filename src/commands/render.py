@@ -0,0 +1,234 @@
+import os, os.path
+import sys
+import json
+import glob
+import shutil
+import subprocess
+import time
+import textwrap
+import hashlib
+import importlib.util
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from ..output import OutputTree
+from ..jsonnet.imports import ImportGraph, JsonnetImportError
+from ..metrics import metrics, profiled
+
+RENDER_ENGINES = ("auto", "python", "jsonnet")
+
+# bump whenever a change to the renderer changes the rendered files
+RENDER_CACHE_VERSION = 2
+
+# indentation of the json manifested by jsonnet
+MANIFEST_INDENT = "   "
+
+class RenderError(RuntimeError):
+  pass
+
+def split_manifest(manifest):
+  """
+  Split the json jsonnet manifested for a template into the files `jsonnet -m`
+  would write for it, by path.
+
+  Strings are manifested without raw newlines, so each line of the manifest
+  indented once starts a field of the template.
+  """
+  lines = manifest.rstrip("\n").split("\n")
+  if lines == ["{ }"]:
+    return dict()
+  if lines[0] != "{" or lines[-1] != "}":
+    raise RenderError("templates must output an object, whose fields are the files to write")
+  files = dict()
+  decoder = json.JSONDecoder()
+  (path, value) = (None, None)
+  for line in lines[1:-1]:
+    if line.startswith(MANIFEST_INDENT + '"'):
+      (path, end) = decoder.raw_decode(line, len(MANIFEST_INDENT))
+      value = files[path] = [line[end + len(": "):]]
+    else:
+      value.append(line[len(MANIFEST_INDENT):])
+  for (path, value) in files.items():
+    value = "\n".join(value)
+    # json values never end with a comma, other than the one separating fields
+    files[path] = (value[:-1] if value.endswith(",") else value) + "\n"
+  return files
+
+class RenderCache:
+  """
+  Digest of the inputs of each env rendered into an output directory, and of
+  the files it produced, stored as .render-cache.json in that directory.
+
+  The inputs of an env are the env file and the template, along with all the
+  files they import transitively; an env whose inputs haven't changed and whose
+  files are still in the output directory doesn't need rendering.
+  """
+  filename = ".render-cache.json"
+
+  def __init__(self, output, directory, libDirs):
+    self.output = output
+    self.directory = directory
+    self.graph = ImportGraph(libDirs)
+    self.envs = dict()
+    self.stats = dict(hits=0, misses=0)
+    try:
+      with open(os.path.join(output.root, self.filename), "r") as fd:
+        cache = json.load(fd)
+      if cache.get("version") == RENDER_CACHE_VERSION:
+        self.envs = cache.get("envs", {})
+        self.stats = dict(self.stats, **cache.get("stats", {}))
+    except (OSError, ValueError, AttributeError):
+      pass
+    self.run = dict(hits=0, misses=0)
+
+  def digest(self, template, env):
+    """
+    Return the digest of the inputs of env, or None if they can't be determined.
+    """
+    h = hashlib.sha256()
+    try:
+      for path in (template, env):
+        for (dependency, digest) in self.graph.closure(path):
+          h.update("{}\0{}\0".format(os.path.relpath(dependency, self.directory), digest).encode())
+    except (OSError, JsonnetImportError) as e:
+      print("!!! not caching {}: {}".format(os.path.relpath(env, self.directory), str(e)), file=sys.stderr)
+      return None
+    return h.hexdigest()
+
+  def hit(self, name, digest):
+    entry = self.envs.get(name)
+    hit = digest is not None and entry is not None and entry.get("digest") == digest and all(
+      file_digest(os.path.join(self.output.root, path)) == fileDigest for (path, fileDigest) in entry.get("files", {}).items()
+    )
+    self.count("hits" if hit else "misses")
+    return hit
+
+  def count(self, stat):
+    self.run[stat] += 1
+    self.stats[stat] += 1
+    metrics.count("render.cache.{}".format(stat))
+
+  def record(self, name, digest, files):
+    if digest is None:
+      self.envs.pop(name, None)
+      return
+    self.envs[name] = dict(digest=digest, files=dict((path, hashlib.sha256(data.encode("utf-8")).hexdigest()) for (path, data) in files.items()))
+
+  def save(self):
+    cache = dict(version=RENDER_CACHE_VERSION, envs=self.envs, stats=self.stats)
+    self.output.write(self.filename, json.dumps(cache, indent=2, sort_keys=True) + "\n")
+
+def file_digest(path):
+  try:
+    with open(path, "rb") as fd:
+      return hashlib.sha256(fd.read()).hexdigest()
+  except OSError:
+    return None
+
+def render(directory=".", out=None, jobs=None, engine="auto", force=False, **kwargs):
+  directory = os.path.realpath(directory)
+  envs = find_envs(directory)
+  if len(envs) == 0:
+    raise RenderError("no environments found in {}/envs or {}/properties/*/envs".format(directory, directory))
+  engine = get_engine(engine)
+  libDirs = [os.path.join(directory, "lib")]
+  output = OutputTree(os.path.realpath(out if out is not None else os.path.join(directory, "dist")))
+  cache = RenderCache(output, directory, libDirs)
+
+  start = time.perf_counter()
+  with metrics.phase("imports"):
+    digests = dict((env, cache.digest(template, env)) for (template, env) in envs)
+  pending = []
+  for (template, env) in envs:
+    name = os.path.relpath(env, directory)
+    if not force and cache.hit(name, digests[env]):
+      print("*** {} is up to date".format(name), file=sys.stderr)
+    else:
+      pending.append((template, env))
+
+  print("*** rendering {} of {} environments with {}".format(len(pending), len(envs), engine), file=sys.stderr)
+  failures = []
+  if engine == "python":
+    # the python bindings hold the GIL, so envs are rendered in worker
+    # processes, which report their metrics along with their results
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=metrics.reset, initargs=(metrics.enabled,))
+    submit = lambda *args: executor.submit(profiled, render_env, *args)
+  else:
+    # jsonnet processes don't
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    submit = lambda *args: executor.submit(render_env, *args)
+  with metrics.phase("render"), executor:
+    futures = dict((submit(engine, template, env, libDirs), env) for (template, env) in pending)
+    for future in as_completed(futures):
+      env = futures[future]
+      name = os.path.relpath(env, directory)
+      try:
+        result = future.result()
+        (files, elapsed) = metrics.merge_result(result) if engine == "python" else result
+      except Exception as e:
+        failures.append((name, str(e)))
+        cache.record(name, None, {})
+        print("!!! failed to render", name, file=sys.stderr)
+        continue
+      metrics.observe("render.env", elapsed)
+      for (path, data) in files.items():
+        output.write(path, data)
+      cache.record(name, digests[env], files)
+      print("*** rendered {} in {:.3f}s".format(name, elapsed), file=sys.stderr)
+  cache.save()
+  output.flush()
+
+  print("### Rendered {} of {} environments into {} in {:.3f}s".format(
+    len(envs) - len(failures), len(envs), output.root, time.perf_counter() - start
+  ))
+  print("### Render cache: {hits} hits, {misses} misses".format(**cache.run))
+  for (name, error) in sorted(failures):
+    print(textwrap.indent("%s: %s" % (name, error.strip()), prefix='!!! '))
+  if len(failures):
+    raise RenderError("failed to render {} of {} environments".format(len(failures), len(envs)))
+
+def find_envs(directory):
+  """
+  Return (template, env file) pairs, for a bootstrap or a bootstrap-many directory.
+  """
+  envs = []
+  for envPath in sorted(glob.glob(os.path.join(directory, "envs", "*.jsonnet"))):
+    envs.append((os.path.join(directory, "template.jsonnet"), envPath))
+  for envPath in sorted(glob.glob(os.path.join(directory, "properties", "*", "envs", "*.jsonnet"))):
+    envs.append((os.path.join(os.path.dirname(os.path.dirname(envPath)), "template.jsonnet"), envPath))
+  return envs
+
+def get_engine(engine):
+  if engine in ("auto", "python"):
+    if importlib.util.find_spec("_jsonnet") is not None:
+      return "python"
+    if engine == "python":
+      raise RenderError("the python engine requires the jsonnet package, see `pip install jsonnet`")
+  if not shutil.which("jsonnet"):
+    raise RenderError("jsonnet not found on PATH; install it, or the jsonnet python package")
+  return "jsonnet"
+
+def render_env(engine, template, env, libDirs):
+  """
+  Render template for one env file; return the output files and the time it took.
+  """
+  start = time.perf_counter()
+  if engine == "python":
+    import _jsonnet
+    with open(env, "r") as fd:
+      code = fd.read()
+    with metrics.phase("jsonnet"):
+      manifest = _jsonnet.evaluate_file(template, jpathdir=libDirs, ext_codes=dict(env=code))
+    return (split_manifest(manifest), time.perf_counter() - start)
+  with metrics.phase("jsonnet"), tempfile.TemporaryDirectory(prefix="akamai-jsonnet-") as tmpdir:
+    command = ["jsonnet", "-c", "-m", tmpdir, "--ext-code-file", "env={}".format(env), template]
+    for libDir in libDirs:
+      command[1:1] = ["-J", libDir]
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+      raise RenderError(process.stderr)
+    # jsonnet lists the files it wrote
+    files = dict()
+    for path in process.stdout.splitlines():
+      with open(path, "r", encoding="utf-8") as fd:
+        files[os.path.relpath(path, tmpdir)] = fd.read()
+  return (files, time.perf_counter() - start)
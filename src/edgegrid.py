@@ -1,7 +1,12 @@
-import sys, pathlib
+import sys, time, pathlib
+from contextlib import nullcontext
 import requests
 from akamai.edgegrid import EdgeGridAuth, EdgeRc
 from .logging import logger
+from .metrics import metrics
+from .utils import progress
+from .transport import Transport
+from .ratelimit import DEFAULT_RETRIES, IDEMPOTENT_METHODS, retryable, retry_delay
 
 py3 = sys.version_info[0] >= 3
 if py3:
@@ -12,11 +17,40 @@ else:
 	# pylint: disable=import-error
 	import urlparse as parse
 
+DEFAULT_POOL_SIZE = 10
+
 class Session(requests.Session):
-	def __init__(self, edgerc, section, accountSwitchKey=None, **kwargs):
+	"""
+	A requests session signing calls with EdgeGrid.
+
+	Connections are kept alive and pooled, so a single session should be shared by
+	all the calls of a command to avoid repeating TLS handshakes.
+
+	Requests go through Session.transport, which can record the responses or
+	replay them offline, see main.configure_transport.
+
+	Throttled and failed requests are retried, and Session.limiter, if any,
+	spaces out the requests of all the sessions of a command.
+	"""
+	# shared by all sessions
+	transport = Transport()
+	limiter = None
+
+	def __init__(self, edgerc, section, accountSwitchKey=None, poolSize=DEFAULT_POOL_SIZE, **kwargs):
 		super(Session, self).__init__(**kwargs)
+		adapter = self.transport.adapter(poolSize)
+		self.mount("https://", adapter)
+		self.mount("http://", adapter)
+		self.headers.update({
+			"Accept-Encoding": "gzip, deflate",
+			"Connection": "keep-alive",
+		})
+
 		self.edgerc = EdgeRc(str(pathlib.Path(edgerc).expanduser()))
 		self.section = section
+		if self.transport.offline and not self.edgerc.has_section(section):
+			# replaying needs no credentials
+			self.edgerc.read_dict({section: dict(host="replay.invalid", client_token="", client_secret="", access_token="")})
 
 		self.accountSwitchKey = None
 		if self.edgerc.has_option(section, "account_key"):
@@ -31,9 +65,56 @@ class Session(requests.Session):
 		)
 
 	def request(self, method, url, params=None, **kwargs):
-		baseUrl = "https://{host}".format(host=self.edgerc.get(self.section, "host"))
+		host = self.edgerc.get(self.section, "host")
+		# a host with a scheme points at a test server, e.g. http://127.0.0.1:8080
+		baseUrl = host if "://" in host else "https://{host}".format(host=host)
 		url = parse.urljoin(baseUrl, url)
 		if self.accountSwitchKey:
 			params = params if params is not None else dict()
 			params.update(accountSwitchKey=self.accountSwitchKey)
-		return super(Session, self).request(method, url, params=params, **kwargs)
+		retries = 0 if self.transport.offline else self.limiter.retries if self.limiter is not None else DEFAULT_RETRIES
+		attempt = 0
+		while True:
+			(response, error) = self.send_once(method, url, params, **kwargs)
+			if error is not None and (attempt >= retries or method.upper() not in IDEMPOTENT_METHODS):
+				raise error
+			if response is not None and (attempt >= retries or not retryable(method, response)):
+				return response
+			delay = retry_delay(response, attempt)
+			if response is not None and response.status_code == 429 and self.limiter is not None:
+				# every worker is throttled, not just this one
+				self.limiter.pause(delay)
+			reason = "{} {}".format(response.status_code, response.reason) if response is not None else error.__class__.__name__
+			progress("*** retrying {} {} in {:.1f}s: {}".format(method, parse.urlsplit(url).path, delay, reason))
+			metrics.count("http.retries")
+			time.sleep(delay)
+			attempt += 1
+
+	def send_once(self, method, url, params=None, **kwargs):
+		"""
+		Return the response to a single attempt at a request, or the connection
+		error it failed with.
+		"""
+		with self.limiter.slot() if self.limiter is not None else nullcontext():
+			start = time.perf_counter()
+			with metrics.phase("http"):
+				try:
+					response = super(Session, self).request(method, url, params=params, **kwargs)
+				except (requests.ConnectionError, requests.Timeout) as e:
+					return (None, e)
+		if self.limiter is not None:
+			self.limiter.observe(response)
+		if metrics.enabled:
+			metrics.observe("http.latency", time.perf_counter() - start)
+			metrics.count("http.requests")
+			if not kwargs.get("stream"):
+				metrics.count("http.bytes", downloaded(response))
+		return (response, None)
+
+def downloaded(response):
+	"""
+	Return the number of bytes of a response read from the network, before
+	decompression; replayed responses have none.
+	"""
+	raw = response.raw
+	return raw.tell() if raw is not None and hasattr(raw, "tell") else 0
@@ -0,0 +1,551 @@
+import abc
+import os
+import re
+import shutil
+import tempfile
+from subprocess import Popen, PIPE, DEVNULL
+from ..metrics import metrics
+
+class FormatterError(RuntimeError):
+  pass
+
+KEYWORDS = frozenset((
+  "assert", "else", "error", "false", "for", "function", "if", "import", "importstr",
+  "importbin", "in", "local", "null", "tailstrict", "then", "self", "super", "true",
+))
+
+# keywords which behave like values, i.e. can be indexed or called
+VALUE_KEYWORDS = frozenset(("self", "super", "true", "false", "null"))
+
+OPENERS = {"{": "}", "[": "]", "(": ")"}
+CLOSERS = frozenset(OPENERS.values())
+UNARY_OPS = frozenset(("!", "-", "+", "~"))
+
+_IDENTIFIER = re.compile(r"[_a-zA-Z][_a-zA-Z0-9]*")
+_NUMBER = re.compile(r"[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?")
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_OPERATOR = re.compile(r"[!~+\-&|^=<>*/%]+")
+_DOUBLE = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+_SINGLE = re.compile(r"'(?:[^'\\]|\\.)*'", re.S)
+_VERBATIM = re.compile(r"""@"(?:[^"]|"")*"|@'(?:[^']|'')*'""", re.S)
+
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class Token:
+  __slots__ = ("kind", "text", "newlines", "lines")
+
+  def __init__(self, kind, text, newlines, lines=None):
+    self.kind = kind
+    self.text = text
+    # number of line breaks between the previous token and this one
+    self.newlines = newlines
+    # content lines of a text block
+    self.lines = lines
+
+  def __repr__(self):
+    return "Token(%r, %r)" % (self.kind, self.text)
+
+def tokenize(source):
+  """
+  Split jsonnet source into tokens, keeping track of line breaks.
+  """
+  tokens = []
+  pos = 0
+  end = len(source)
+  while True:
+    ws = _WHITESPACE.match(source, pos)
+    newlines = ws.group().count("\n")
+    pos = ws.end()
+    if pos >= end:
+      break
+    c = source[pos]
+    if source.startswith("|||", pos):
+      token, pos = _tokenize_text_block(source, pos, newlines)
+      tokens.append(token)
+      continue
+    if c == "#" or source.startswith("//", pos):
+      eol = source.find("\n", pos)
+      eol = end if eol < 0 else eol
+      text = source[pos:eol].rstrip()
+      if c == "#":
+        text = "//" + text[1:]
+      tokens.append(Token("comment", text, newlines))
+      pos = eol
+      continue
+    if source.startswith("/*", pos):
+      close = source.find("*/", pos + 2)
+      if close < 0:
+        raise FormatterError("unterminated comment")
+      tokens.append(Token("comment", source[pos:close + 2], newlines))
+      pos = close + 2
+      continue
+    m = None
+    kind = None
+    if c == '"':
+      m, kind = _DOUBLE.match(source, pos), "string"
+    elif c == "'":
+      m, kind = _SINGLE.match(source, pos), "string"
+    elif c == "@":
+      m, kind = _VERBATIM.match(source, pos), "verbatim"
+    elif c.isdigit():
+      m, kind = _NUMBER.match(source, pos), "number"
+    elif c == "_" or c.isalpha():
+      m, kind = _IDENTIFIER.match(source, pos), "identifier"
+    elif c == "$":
+      tokens.append(Token("identifier", c, newlines))
+      pos += 1
+      continue
+    elif c in "{}[](),;.":
+      tokens.append(Token("punctuation", c, newlines))
+      pos += 1
+      continue
+    elif c == ":":
+      colon = re.match(r":{1,3}", source[pos:]).group()
+      tokens.append(Token("colon", colon, newlines))
+      pos += len(colon)
+      continue
+    elif c == "+" and source.startswith("+:", pos):
+      colon = re.match(r"\+:{1,3}", source[pos:]).group()
+      tokens.append(Token("colon", colon, newlines))
+      pos += len(colon)
+      continue
+    else:
+      m, kind = _OPERATOR.match(source, pos), "operator"
+    if m is None:
+      raise FormatterError("unexpected character %r at offset %d" % (c, pos))
+    text = m.group()
+    if kind == "operator":
+      text = _split_operator(text)
+    tokens.append(Token(kind, text, newlines))
+    pos += len(text)
+  return tokens
+
+def _split_operator(text):
+  for op in ("==", "!=", "<=", ">=", "&&", "||", "<<", ">>"):
+    if text.startswith(op):
+      return op
+  return text[0]
+
+def _tokenize_text_block(source, pos, newlines):
+  header_end = source.find("\n", pos)
+  if header_end < 0:
+    raise FormatterError("unterminated text block")
+  header = source[pos:header_end].rstrip()
+  if header not in ("|||", "|||-"):
+    raise FormatterError("text block must be followed by a new line")
+  lines = []
+  indent = None
+  pos = header_end + 1
+  while True:
+    eol = source.find("\n", pos)
+    if eol < 0:
+      raise FormatterError("unterminated text block")
+    line = source[pos:eol]
+    if indent is None:
+      indent = line[:len(line) - len(line.lstrip(" \t"))]
+      if len(indent) == 0:
+        raise FormatterError("text block's first line must start with whitespace")
+    if line.strip(" \t") == "":
+      lines.append("")
+    elif line.startswith(indent):
+      lines.append(line[len(indent):].rstrip())
+    elif line.lstrip(" \t").startswith("|||"):
+      terminator = line.index("|||")
+      return Token("block", header, newlines, lines), pos + terminator + 3
+    else:
+      raise FormatterError("text block not terminated with |||")
+    pos = eol + 1
+
+def unescape(token):
+  """
+  Return the value of a single or double quoted string literal.
+  """
+  body = token[1:-1]
+  if "\\" not in body:
+    return body
+  out = []
+  i = 0
+  while i < len(body):
+    c = body[i]
+    if c != "\\":
+      out.append(c)
+      i += 1
+      continue
+    e = body[i + 1]
+    if e == "u":
+      code = int(body[i + 2:i + 6], 16)
+      i += 6
+      # combine utf-16 surrogate pairs as emitted by json.dumps
+      if 0xd800 <= code < 0xdc00 and body.startswith("\\u", i):
+        low = int(body[i + 2:i + 6], 16)
+        if 0xdc00 <= low < 0xe000:
+          code = 0x10000 + ((code - 0xd800) << 10) + (low - 0xdc00)
+          i += 6
+      out.append(chr(code))
+    elif e in _ESCAPES:
+      out.append(_ESCAPES[e])
+      i += 2
+    else:
+      raise FormatterError("invalid escape sequence \\%s" % e)
+  return "".join(out)
+
+def escape(value, quote):
+  out = [quote]
+  for c in value:
+    if c == quote or c == "\\":
+      out.append("\\" + c)
+    elif c == "\b":
+      out.append("\\b")
+    elif c == "\f":
+      out.append("\\f")
+    elif c == "\n":
+      out.append("\\n")
+    elif c == "\r":
+      out.append("\\r")
+    elif c == "\t":
+      out.append("\\t")
+    elif ord(c) < 0x20 or 0x7f <= ord(c) <= 0x9f:
+      out.append("\\u%04x" % ord(c))
+    else:
+      out.append(c)
+  out.append(quote)
+  return "".join(out)
+
+def normalize_string(token):
+  """
+  Prefer single quotes, unless that would require more escaping (same as jsonnetfmt).
+  """
+  value = unescape(token)
+  singles = "'" in value
+  doubles = '"' in value
+  if singles and doubles:
+    return token
+  return escape(value, '"' if singles else "'")
+
+class _Frame:
+  __slots__ = ("opener", "indent", "comprehension")
+
+  def __init__(self, opener, indent):
+    self.opener = opener
+    self.indent = indent
+    self.comprehension = False
+
+class Formatter(abc.ABC):
+  @abc.abstractmethod
+  def format(self, source):
+    """
+    Return source formatted, or raise FormatterError.
+    """
+
+  def format_many(self, sources):
+    """
+    Format several files at once; the default is to format them one by one.
+    Files which fail to format are returned as is.
+    """
+    results = []
+    for source in sources:
+      try:
+        results.append(self.format(source))
+      except FormatterError:
+        results.append(source)
+    return results
+
+class BuiltinFormatter(Formatter):
+  """
+  Formats jsonnet in-process, using the same conventions as jsonnetfmt's defaults
+  (2 spaces indentation, single quotes, padded objects, trailing commas on multiline
+  objects and arrays).
+
+  It only knows how to layout the subset of jsonnet that the converters generate:
+  line breaks are kept as they are, except that the elements of an object, array,
+  comprehension or parenthesized expression all go on their own line, along with the closing
+  delimiter, as soon as one of them does; otherwise only indentation and spacing
+  are adjusted.
+  """
+
+  name = "builtin"
+  max_blank_lines = 2
+
+  def format(self, source):
+    tokens = tokenize(source)
+    for (idx, token) in enumerate(tokens):
+      if token.kind == "string":
+        token.text = normalize_string(token.text)
+        nxt = tokens[idx + 1] if idx + 1 < len(tokens) else None
+        if nxt is not None and nxt.kind == "colon":
+          name = unescape(token.text)
+          if _IDENTIFIER.fullmatch(name) and name not in KEYWORDS:
+            token.kind, token.text = "identifier", name
+    tokens = self.fix_plus_object(tokens)
+    self.fix_newlines(tokens)
+    lines = self.layout(tokens)
+    return "".join(self.render_line(indent, line) for (indent, line) in lines)
+
+  def fix_plus_object(self, tokens):
+    """
+    Drop the + of a + { ... }, which is the same as a { ... } (same as jsonnetfmt).
+    """
+    result = []
+    for (idx, token) in enumerate(tokens):
+      nxt = tokens[idx + 1] if idx + 1 < len(tokens) else None
+      plus = token.kind == "operator" and token.text == "+" and len(result) and self.is_value_end(result[-1])
+      if plus and nxt is not None and nxt.kind == "punctuation" and nxt.text == "{":
+        nxt.newlines = max(nxt.newlines, token.newlines)
+        continue
+      result.append(token)
+    return result
+
+  def fix_newlines(self, tokens):
+    """
+    Break the lines of an object, array, comprehension or parenthesized
+    expression before each of its elements and before its closing delimiter, if there is a line
+    break before any of them (same as jsonnetfmt's FixNewlines pass).
+    """
+    # index of each opener -> indexes of the first tokens of its elements
+    elements = dict()
+    closers = dict()
+    comprehensions = set()
+    stack = []
+    for (idx, token) in enumerate(tokens):
+      if token.kind == "punctuation" and token.text in OPENERS:
+        stack.append(idx)
+        elements[idx] = [idx + 1]
+      elif not stack:
+        continue
+      elif token.kind == "punctuation" and token.text in CLOSERS:
+        closers[stack.pop()] = idx
+      elif token.kind == "punctuation" and token.text == ",":
+        elements[stack[-1]].append(idx + 1)
+      elif token.kind == "identifier" and (token.text == "for" or token.text == "if" and stack[-1] in comprehensions):
+        # the for and if specs of a comprehension are its elements too
+        comprehensions.add(stack[-1])
+        elements[stack[-1]].append(idx)
+    for (opener, starts) in elements.items():
+      closer = closers.get(opener)
+      if closer is None or closer == opener + 1 or self.is_index(tokens, opener, closer):
+        continue
+      # the fodder of an element runs from its first token, which may be a
+      # comment, to its first actual token; after a trailing comma, the last
+      # fodder is the closer's
+      fodders = []
+      for start in starts:
+        end = start
+        while end < closer and tokens[end].kind == "comment":
+          end += 1
+        fodders.append(range(start, end + 1))
+      if fodders[-1][-1] != closer:
+        fodders.append(range(closer, closer + 1))
+      broken = [any(tokens[idx].newlines for idx in fodder) for fodder in fodders]
+      if any(broken):
+        for (fodder, newline) in zip(fodders, broken):
+          if not newline:
+            tokens[fodder[0]].newlines = 1
+
+  def is_index(self, tokens, opener, closer):
+    """
+    Whether the brackets at opener and closer index a value or name a field, or
+    the parentheses list the arguments of a call or function, rather than
+    delimit an array or an expression.
+    """
+    if tokens[opener].text == "{":
+      return False
+    prev = tokens[opener - 1] if opener > 0 else None
+    if prev is not None and (self.is_value_end(prev) or prev.kind == "identifier" and prev.text == "function"):
+      return True
+    return tokens[opener].text == "[" and closer + 1 < len(tokens) and tokens[closer + 1].kind == "colon"
+
+  def layout(self, tokens):
+    """
+    Group tokens by line, computing each line's indentation and fixing up
+    trailing commas.
+    """
+    lines = []
+    stack = []
+    last = None # (line, index) of the last non-comment token
+    for token in tokens:
+      text = token.text
+      if token.newlines and token.kind == "punctuation" and text in ",;" and last is not None:
+        # a separator on its own line goes back to the end of the previous expression
+        last[0].insert(last[1] + 1, Token(token.kind, text, 0))
+        last = (last[0], last[1] + 1)
+        continue
+      if token.newlines or not lines:
+        if lines:
+          for _ in range(min(token.newlines - 1, self.max_blank_lines)):
+            lines.append((0, []))
+        if text in CLOSERS and token.kind == "punctuation" and stack:
+          indent = stack[-1].indent
+        else:
+          indent = stack[-1].indent + 2 if stack else 0
+        lines.append((indent, []))
+      (indent, line) = lines[-1]
+      if token.kind == "comment":
+        line.append(token)
+        continue
+      if token.kind == "punctuation" and text in CLOSERS:
+        if not stack or OPENERS[stack[-1].opener] != text:
+          raise FormatterError("unbalanced %r" % text)
+        frame = stack.pop()
+        if text != ")" and not frame.comprehension and last is not None:
+          prev = last[0][last[1]]
+          empty = prev.kind == "punctuation" and prev.text == frame.opener
+          if token.newlines and not empty and prev.text != ",":
+            last[0].insert(last[1] + 1, Token("punctuation", ",", 0))
+          elif not token.newlines and prev.text == "," and prev.kind == "punctuation":
+            del last[0][last[1]]
+      elif token.kind == "punctuation" and text in OPENERS:
+        stack.append(_Frame(text, indent))
+      elif token.kind == "identifier" and text == "for" and stack:
+        stack[-1].comprehension = True
+      line.append(token)
+      last = (line, len(line) - 1)
+    if stack:
+      raise FormatterError("unbalanced %r" % stack[-1].opener)
+    while lines and not lines[-1][1]:
+      lines.pop()
+    return lines
+
+  def render_line(self, indent, line):
+    if not line:
+      return "\n"
+    out = [" " * indent]
+    prev = None
+    unary = False
+    for token in line:
+      if prev is not None:
+        out.append(self.spacing(prev, token, unary))
+      unary = token.kind == "operator" and token.text in UNARY_OPS and self.is_unary_position(prev)
+      if token.kind == "block":
+        out.append(token.text + "\n")
+        for content in token.lines:
+          out.append(" " * (indent + 2) + content + "\n" if content else "\n")
+        out.append(" " * indent + "|||")
+      else:
+        out.append(token.text)
+      prev = token
+    return "".join(out).rstrip() + "\n"
+
+  @staticmethod
+  def is_unary_position(prev):
+    if prev is None:
+      return True
+    if prev.kind in ("operator", "colon"):
+      return True
+    if prev.kind == "punctuation":
+      return prev.text in "([{,;"
+    if prev.kind == "identifier":
+      return prev.text in KEYWORDS and prev.text not in VALUE_KEYWORDS
+    return False
+
+  @staticmethod
+  def is_value_end(token):
+    if token.kind in ("string", "verbatim", "number", "block"):
+      return True
+    if token.kind == "identifier":
+      return token.text not in KEYWORDS or token.text in VALUE_KEYWORDS
+    return token.kind == "punctuation" and token.text in CLOSERS
+
+  def spacing(self, prev, token, unary):
+    text = token.text
+    if token.kind == "comment":
+      # line comments are set apart from the code they follow
+      return "  " if text.startswith("//") else " "
+    if prev.kind == "comment":
+      return " "
+    if unary:
+      return ""
+    if prev.kind == "punctuation":
+      if prev.text in "([.":
+        return ""
+      if prev.text == "{":
+        return "" if text == "}" else " "
+    if token.kind == "punctuation":
+      if text in ",;)].":
+        return ""
+      if text == "}":
+        return " "
+      if text in "([":
+        if prev.kind == "identifier" and prev.text == "function":
+          return ""
+        return "" if self.is_value_end(prev) else " "
+      return " "
+    if token.kind == "colon":
+      return ""
+    return " "
+
+class JsonnetfmtFormatter(Formatter):
+  """
+  Formats jsonnet by piping it through the jsonnetfmt executable.
+
+  Use format_many whenever possible: it formats files in place, a few hundred
+  per jsonnetfmt process, instead of forking once per file.
+  """
+
+  name = "jsonnetfmt"
+  chunk_size = 200
+
+  def __init__(self, executable="jsonnetfmt"):
+    self.executable = executable
+
+  def format(self, source):
+    metrics.count("jsonnetfmt.processes")
+    try:
+      proc = Popen([self.executable, "-"], stdout=PIPE, stdin=PIPE)
+      out = proc.communicate(input=source.encode())[0]
+      if proc.returncode == 0:
+        return out.decode("utf-8")
+    except OSError:
+      pass
+    return source
+
+  def format_many(self, sources):
+    results = list(sources)
+    with tempfile.TemporaryDirectory(prefix="akamai-jsonnet-") as tmpdir:
+      paths = []
+      for (idx, source) in enumerate(results):
+        path = os.path.join(tmpdir, "{}.jsonnet".format(idx))
+        with open(path, "w", newline="\n") as fd:
+          fd.write(source)
+        paths.append(path)
+      for start in range(0, len(paths), self.chunk_size):
+        chunk = paths[start:start + self.chunk_size]
+        metrics.count("jsonnetfmt.processes")
+        try:
+          proc = Popen([self.executable, "-i"] + chunk, stdout=DEVNULL, stderr=PIPE)
+          proc.communicate()
+          ok = proc.returncode == 0
+        except OSError:
+          return results
+        if not ok:
+          # jsonnetfmt stops at the first file it can't parse; retry the chunk one
+          # file at a time so that the others still get formatted
+          for idx in range(start, start + len(chunk)):
+            results[idx] = self.format(results[idx])
+          continue
+        for (idx, path) in enumerate(chunk, start):
+          with open(path, "r") as fd:
+            results[idx] = fd.read()
+    return results
+
+class NullFormatter(Formatter):
+  """
+  Leaves jsonnet as generated.
+  """
+
+  name = "none"
+
+  def format(self, source):
+    return source
+
+FORMATTERS = {
+  BuiltinFormatter.name: BuiltinFormatter,
+  JsonnetfmtFormatter.name: JsonnetfmtFormatter,
+  NullFormatter.name: NullFormatter,
+}
+
+def get_formatter(name):
+  if name not in FORMATTERS:
+    raise FormatterError("unknown formatter: %s" % name)
+  if name == JsonnetfmtFormatter.name and shutil.which("jsonnetfmt") is None:
+    raise FormatterError("jsonnetfmt not found on PATH")
+  return FORMATTERS[name]()
@@ -0,0 +1,80 @@
+import os
+import hashlib
+from .formatter import tokenize, unescape, FormatterError
+
+class JsonnetImportError(RuntimeError):
+  pass
+
+def find_imports(source):
+  """
+  Return the (keyword, path) of the import, importstr and importbin expressions in source.
+  """
+  imports = []
+  tokens = tokenize(source)
+  for (token, nxt) in zip(tokens, tokens[1:]):
+    if token.kind != "identifier" or token.text not in ("import", "importstr", "importbin"):
+      continue
+    if nxt.kind == "string":
+      imports.append((token.text, unescape(nxt.text)))
+    elif nxt.kind == "verbatim":
+      quote = nxt.text[1]
+      imports.append((token.text, nxt.text[2:-1].replace(quote * 2, quote)))
+    else:
+      raise JsonnetImportError("{} must be followed by a string literal".format(token.text))
+  return imports
+
+class ImportGraph:
+  """
+  Digests of jsonnet files and of everything they import, transitively.
+
+  Files are read and scanned once, so computing the closures of many templates
+  sharing libraries is cheap.
+  """
+
+  def __init__(self, libDirs):
+    self.libDirs = libDirs
+    # (path, parse) -> (digest, resolved imports)
+    self.files = dict()
+    self.closures = dict()
+
+  def resolve(self, importer, path):
+    """
+    Find an imported file the way jsonnet does: next to the importer, then in the library directories.
+    """
+    candidates = [path] if os.path.isabs(path) else [os.path.join(os.path.dirname(importer), path)] + [os.path.join(libDir, path) for libDir in self.libDirs]
+    for candidate in candidates:
+      if os.path.isfile(candidate):
+        return os.path.realpath(candidate)
+    raise JsonnetImportError("{} imports {}, which can't be found".format(importer, path))
+
+  def scan(self, path, parse=True):
+    if (path, parse) not in self.files:
+      with open(path, "rb") as fd:
+        data = fd.read()
+      imports = []
+      # importstr and importbin targets are not jsonnet
+      if parse and b"import" in data:
+        try:
+          imports = [(keyword, self.resolve(path, target)) for (keyword, target) in find_imports(data.decode("utf-8"))]
+        except (FormatterError, UnicodeDecodeError) as e:
+          raise JsonnetImportError("can't scan {} for imports: {}".format(path, str(e)))
+      self.files[(path, parse)] = (hashlib.sha256(data).hexdigest(), imports)
+    return self.files[(path, parse)]
+
+  def closure(self, path):
+    """
+    Return the sorted (path, digest) pairs of path and of all the files it imports.
+    """
+    path = os.path.realpath(path)
+    if path not in self.closures:
+      seen = dict()
+      pending = [(path, True)]
+      while len(pending):
+        (current, parse) = pending.pop()
+        if current in seen:
+          continue
+        (digest, imports) = self.scan(current, parse)
+        seen[current] = digest
+        pending.extend((target, keyword == "import") for (keyword, target) in imports)
+      self.closures[path] = sorted(seen.items())
+    return self.closures[path]
@@ -1,5 +1,6 @@
 from .property import PropertyConverter
 from .hostnames import HostnamesConverter
-from .ruletree import RuleTreeConverter
+from .ruletree import RuleTreeConverter, StreamingRuleTreeConverter
 from .variables import VariablesConverter
-from .ruleformat import RuleFormatConverter
\ No newline at end of file
+from .ruleformat import RuleFormatConverter, SplitRuleFormatConverter, LIBRARY_LAYOUTS
+from .shared import SharedRules, CommonRules
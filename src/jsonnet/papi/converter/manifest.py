@@ -0,0 +1,110 @@
+import os, json, hashlib
+
+# bump whenever a change to the converters changes the generated files
+CONVERTER_VERSION = 1
+
+class RuleManifest:
+  """
+  Content hashes of the rule subtrees converted by a previous run, stored next
+  to the generated files.
+
+  Each entry maps the path of a rule's jsonnet file to the digest of the rule's
+  subtree, the files the rule wrote itself and the paths of its children. A rule
+  whose digest matches and whose files are all still on disk doesn't need to be
+  converted again.
+  """
+  filename = ".rules.manifest.json"
+
+  def __init__(self, output, dirname, context):
+    self.output = output
+    self.path = os.path.join(dirname, self.filename)
+    self.context = dict(context, version=CONVERTER_VERSION)
+    self.previous = dict()
+    self.entries = dict()
+    self.digests = dict()
+    self.valid = False
+    try:
+      with open(os.path.join(output.root, self.path), "r") as fd:
+        manifest = json.load(fd)
+      self.previous = manifest.get("rules", {})
+      # files generated by another converter or formatter may differ
+      self.valid = manifest.get("context") == self.context
+    except (OSError, ValueError, AttributeError):
+      pass
+
+  def index(self, rule):
+    """
+    Compute the digests of rule and all its descendants, bottom-up.
+    """
+    stack = [(rule, False)]
+    while len(stack):
+      (current, visited) = stack.pop()
+      children = current.get("children", [])
+      if not visited:
+        stack.append((current, True))
+        stack.extend((child, False) for child in children)
+        continue
+      self.index_fields(current, [self.digests[id(child)] for child in children])
+
+  def index_fields(self, rule, childDigests):
+    """
+    Compute the digest of rule from its fields other than children, and the digests of its children.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(dict((k, v) for (k, v) in rule.items() if k != "children"), sort_keys=True).encode())
+    for digest in childDigests:
+      h.update(digest.encode())
+    self.digests[id(rule)] = h.hexdigest()
+
+  def forget(self, rule):
+    """
+    Drop the digest of rule, before rule is released; return it.
+    """
+    return self.digests.pop(id(rule))
+
+  def digest(self, rule):
+    if not id(rule) in self.digests:
+      self.index(rule)
+    return self.digests[id(rule)]
+
+  def unchanged(self, path, rule):
+    """
+    Whether the files converted from rule at path by the previous run are up to date.
+    """
+    entry = self.previous.get(path)
+    if not self.valid or entry is None or entry.get("digest") != self.digest(rule):
+      return False
+    return all(os.path.exists(os.path.join(self.output.root, file)) for file in self.previous_files(path))
+
+  def previous_files(self, path):
+    paths = [path]
+    while len(paths):
+      entry = self.previous.get(paths.pop(), {})
+      yield from entry.get("files", [])
+      paths.extend(entry.get("children", []))
+
+  def keep(self, path):
+    """
+    Carry over the entries of an unchanged subtree.
+    """
+    paths = [path]
+    while len(paths):
+      current = paths.pop()
+      entry = self.previous.get(current)
+      if entry is not None:
+        self.entries[current] = entry
+        paths.extend(entry.get("children", []))
+
+  def record(self, path, rule, files, children):
+    self.entries[path] = dict(digest=self.digest(rule), files=sorted(set(files)), children=children)
+
+  def save(self):
+    """
+    Add the manifest to the output, and remove the files of rules that no longer exist.
+    """
+    current = set(file for entry in self.entries.values() for file in entry.get("files"))
+    previous = set(file for entry in self.previous.values() for file in entry.get("files", []))
+    for file in sorted(previous - current):
+      self.output.remove(file)
+    manifest = dict(context=self.context, rules=self.entries)
+    self.output.write(self.path, json.dumps(manifest, indent=2, sort_keys=True) + "\n")
@@ -1,14 +1,32 @@
 import os, json, pathlib
+from collections import Counter
 from ...writer import JsonnetWriter
 from .ruleformatentity import RuleFormatEntityConverter
 from .variables import VariablesConverter
-from ....utils import get_valid_filename, pushd
+from ....utils import get_valid_filename
 
 class RuleConverter(RuleFormatEntityConverter):
-  def __init__(self, ruleFormat, rule, parent=None):
+  def __init__(self, ruleFormat, rule, output, parent=None, dirname="", manifest=None, shared=None):
+    """
+    dirname is the directory of output containing the rule's jsonnet file; files
+    the rule depends on are written relative to it.
+
+    Children found unchanged in manifest are not converted again, and children
+    that are copies of a subtree in shared import its file instead.
+    """
     super(RuleConverter, self).__init__(ruleFormat)
     self.rule = rule
+    self.output = output
     self.parent = parent
+    self.dirname = dirname
+    self.manifest = manifest
+    self.shared = shared
+    # files written by the rule itself, and paths of its children's files
+    self.files = []
+    self.childPaths = []
+    self.nameCounter = Counter()
+    # converters of the children listed by convert(), see convert_descendants()
+    self.children = []
 
   @property
   def template(self):
@@ -27,20 +45,27 @@ class RuleConverter(RuleFormatEntityConverter):
   def filename(self):
     return "{}.jsonnet".format(self.normalizedName)
 
+  @property
+  def path(self):
+    return os.path.join(self.dirname, self.filename)
+
+  @property
+  def childrenDirname(self):
+    return os.path.join(self.dirname, self.normalizedName)
+
   def convert(self, writer):
     if self.ruleName != "default":
       self.convert_papi_import_statement(writer)
 
     writer.writeln('{} {{'.format(self.template))
-    writer.writeln('name: {},'.format(json.dumps(self.ruleName)))
+    self.convert_name(writer)
 
     if len(self.rule.get("comments", "")) > 0:
       writer.write('comments: ')
       writer.writeMultilineString(self.rule.get("comments", ""))
       writer.writeln(',')
 
-    if "uuid" in self.rule:
-      writer.writeln('uuid: {},'.format(json.dumps(self.rule.get('uuid'))))
+    self.convert_uuid(writer)
 
     if "options" in self.rule:
       if len(self.rule.get("options")):
@@ -53,7 +78,8 @@ class RuleConverter(RuleFormatEntityConverter):
       variablesWriter = JsonnetWriter()
       variablesConverter = VariablesConverter(self.ruleFormat, self.rule.get("variables"))
       variablesConverter.convert(variablesWriter)
-      variablesWriter.dump('pmvariables.jsonnet')
+      self.output.dump(os.path.join(self.dirname, 'pmvariables.jsonnet'), variablesWriter)
+      self.files.append(os.path.join(self.dirname, 'pmvariables.jsonnet'))
       writer.writeln("variables: import 'pmvariables.jsonnet',")
 
     self.convert_criteria(writer)
@@ -71,13 +97,19 @@ class RuleConverter(RuleFormatEntityConverter):
     if "advancedOverride" in self.rule:
       xml = self.rule.get("advancedOverride")
       advancedOverridePath = "advancedOverride.xml"
-      with open(advancedOverridePath, "w") as fd:
-        print(advancedOverridePath)
-        fd.write(xml)
+      self.output.write(os.path.join(self.dirname, advancedOverridePath), xml)
+      self.files.append(os.path.join(self.dirname, advancedOverridePath))
       writer.writeln("advancedOverride: importstr 'advancedOverride.xml',")
 
     writer.writeln('}')
 
+  def convert_name(self, writer):
+    writer.writeln('name: {},'.format(json.dumps(self.ruleName)))
+
+  def convert_uuid(self, writer):
+    if "uuid" in self.rule:
+      writer.writeln('uuid: {},'.format(json.dumps(self.rule.get('uuid'))))
+
   def convert_criteria(self, writer):
     self.convert_criteria_or_behaviors("criteria", writer)
     if len(self.rule.get("criteria", [])):
@@ -88,32 +120,117 @@ class RuleConverter(RuleFormatEntityConverter):
   def convert_behaviors(self, writer):
     self.convert_criteria_or_behaviors("behaviors", writer)
 
+  def unique_child_name(self, name):
+    """
+    Return name, suffixed with a number if a previous child has the same name.
+    """
+    name_key = name.lower()
+    self.nameCounter[name_key] += 1
+    if self.nameCounter[name_key] > 1:
+      return "{} {}".format(name, self.nameCounter[name_key])
+    return name
+
   def convert_children(self, writer):
-    children = []
-    from collections import Counter
-    nameCounter = Counter()
+    """
+    Import the children's files; they are converted by convert_descendants().
+    """
+    imports = []
     for child in self.rule.get("children", []):
-      name_key = child["name"].lower()
-      nameCounter[name_key] += 1
-      if nameCounter[name_key] > 1:
-        child["name"] = "{} {}".format(child["name"], nameCounter[name_key])
-      children.append(RuleConverter(self.ruleFormat, child, self))
-    if len(children):
-      with pushd(self.normalizedName):
-        writer.writeln("children: [")
-        for child in children:
-          childWriter = JsonnetWriter()
-          child.convert(childWriter)
-          childWriter.dump(child.filename)
-          # use PurePosixPath to ensure paths use / regardless of platform
-          writer.writeln("import '{}',".format(pathlib.PurePosixPath(self.normalizedName, child.filename)))
-        writer.writeln("],")
+      child["name"] = self.unique_child_name(child["name"])
+      sharedPath = self.shared.path(child) if self.shared is not None else None
+      if sharedPath is None:
+        converter = RuleConverter(self.ruleFormat, child, self.output, self, self.childrenDirname, self.manifest, self.shared)
+        self.children.append(converter)
+        self.childPaths.append(converter.path)
+        imports.append(self.child_import(converter.filename))
+        continue
+      imports.append(self.shared_import(sharedPath, child))
+      if self.shared.tracked:
+        self.childPaths.append(sharedPath)
+      if self.shared.claim(sharedPath):
+        self.children.append(SharedRuleConverter(self.ruleFormat, child, self.output, sharedPath, self.manifest if self.shared.tracked else None, self.shared))
+    self.convert_children_imports(writer, imports)
+
+  def convert_descendants(self):
+    """
+    Convert the descendants of the rule to their own files, once convert() has
+    listed its children.
+
+    Rules are taken from a work queue rather than converted recursively, so
+    the depth of the tree isn't bounded by the recursion limit, and each rule's
+    writer is released as soon as its file has been added to the output.
+    """
+    pending = [self]
+    while len(pending):
+      current = pending.pop()
+      (children, current.children) = (current.children, [])
+      for child in reversed(children):
+        if self.convert_file(child):
+          pending.append(child)
+
+  def convert_file(self, rule):
+    """
+    Convert rule to its own file, unless it is unchanged since the previous run;
+    return whether it was converted.
+    """
+    if rule.manifest is not None and rule.manifest.unchanged(rule.path, rule.rule):
+      rule.manifest.keep(rule.path)
+      return False
+    writer = JsonnetWriter()
+    rule.convert(writer)
+    self.output.dump(rule.path, writer)
+    if rule.manifest is not None:
+      rule.manifest.record(rule.path, rule.rule, [rule.path] + rule.files, rule.childPaths)
+    return True
+
+  def child_import(self, filename):
+    # use PurePosixPath to ensure paths use / regardless of platform
+    return "import '{}'".format(pathlib.PurePosixPath(self.normalizedName, filename))
+
+  def shared_import(self, sharedPath, child):
+    """
+    Import a shared subtree, with the name and uuid of child.
+    """
+    path = pathlib.PurePath(self.shared.import_path(sharedPath, self.dirname)).as_posix()
+    overrides = "name: {},".format(json.dumps(child.get("name")))
+    if "uuid" in child:
+      overrides += " uuid: {},".format(json.dumps(child.get("uuid")))
+    return "(import '{}') {{ {} }}".format(path, overrides)
+
+  def convert_children_imports(self, writer, imports):
+    if len(imports):
+      writer.writeln("children: [")
+      for expression in imports:
+        writer.writeln("{},".format(expression))
+      writer.writeln("],")
 
   def convert_criteria_or_behaviors(self, ns, writer):
+    if not len(self.rule.get(ns, [])):
+      return
+    commonPath = self.shared.atoms_path(self.rule, ns) if self.shared is not None else None
+    if commonPath is None:
+      writer.write("{}: ".format(ns))
+      self.convert_atoms(ns, writer)
+      writer.writeln(",")
+      return
+    writer.writeln("{}: import '{}',".format(ns, pathlib.PurePath(self.shared.import_path(commonPath, self.dirname)).as_posix()))
+    if self.shared.claim(commonPath):
+      self.convert_atoms_file(ns, commonPath)
+
+  def convert_atoms_file(self, ns, path):
+    """
+    Convert the criteria or behaviors of the rule to their own file.
+    """
+    atomsWriter = JsonnetWriter()
+    self.convert_papi_import_statement(atomsWriter)
+    self.convert_atoms(ns, atomsWriter)
+    atomsWriter.writeln("")
+    self.output.dump(path, atomsWriter)
+
+  def convert_atoms(self, ns, writer):
     results = []
     for atom in self.rule.get(ns, []):
-      options_ruleFormat_ptr = "/definitions/catalog/{}/{}/properties/options/properties".format(ns, atom.get("name"))
-      options_ruleFormat = self.ruleFormat.resolve_pointer(options_ruleFormat_ptr)
+      options_ruleFormat = self.ruleFormat.get_options(ns, atom.get("name"))
       converted = dict(name=atom.get("name"), options=dict())
       for (name, option) in atom.get("options", {}).items():
         if name in options_ruleFormat:
@@ -122,19 +239,106 @@ class RuleConverter(RuleFormatEntityConverter):
           # trouble when we try to render the template back to json
           converted["options"][name] = option
       results.append(converted)
-    if len(results):
-      writer.writeln("{}: [".format(ns))
-      for atom in results:
-        writer.write("papi.{}.{}".format(ns, atom.get("name")))
-        # The uuid is normally stored at the root of the atom, e.g. {name: 'caching', uuid: 'xyz', options: {...}}
-        # Because we are generated simplified syntax, we output it as part of the body along with the options
-        # e.g. papi.behaviors.caching { uuid: 'xyz', ... }
-        if "uuid" in atom:
-          if not "options" in atom:
-            atom["options"] = {}
-          atom["options"]["uuid"] = atom.get("uuid")
-        if len(atom.get("options")):
-          writer.write(" ")
-          writer.write(json.dumps(atom.get("options"), indent="  "))
-        writer.writeln(",")
-      writer.writeln("],")
+    writer.writeln("[")
+    for atom in results:
+      writer.write("papi.{}.{}".format(ns, atom.get("name")))
+      # The uuid is normally stored at the root of the atom, e.g. {name: 'caching', uuid: 'xyz', options: {...}}
+      # Because we are generated simplified syntax, we output it as part of the body along with the options
+      # e.g. papi.behaviors.caching { uuid: 'xyz', ... }
+      if "uuid" in atom:
+        if not "options" in atom:
+          atom["options"] = {}
+        atom["options"]["uuid"] = atom.get("uuid")
+      if len(atom.get("options")):
+        writer.write(" ")
+        writer.write(json.dumps(atom.get("options"), indent="  "))
+      writer.writeln(",")
+    writer.write("]")
+
+class StreamedRuleConverter(RuleConverter):
+  def __init__(self, ruleFormat, output, parent=None, dirname="", manifest=None):
+    """
+    Converter of a rule read from a JsonStream with parse(). Each child is
+    converted as soon as it has been parsed, and then released, so only the
+    rules from the root down to the current one are held in memory.
+    """
+    super(StreamedRuleConverter, self).__init__(ruleFormat, dict(), output, parent, dirname, manifest)
+    self.childFilenames = []
+    self.childDigests = []
+    # the children array being read, if any
+    self.items = None
+
+  def parse(self, stream):
+    """
+    Read the rule from stream, converting its descendants along the way. The
+    rules being read are kept on a stack, rather than parsed recursively.
+    """
+    stack = [(self, stream.object())]
+    while len(stack):
+      (current, keys) = stack[-1]
+      if current.items is not None:
+        if next(current.items, True) is None:
+          child = StreamedRuleConverter(self.ruleFormat, self.output, current, current.childrenDirname, self.manifest)
+          stack.append((child, stream.object()))
+          continue
+        current.items = None
+      key = next(keys, None)
+      if key is None:
+        stack.pop()
+        current.parsed()
+        if len(stack):
+          stack[-1][0].convert_streamed_child(current)
+      elif key == "name" and isinstance(current.parent, RuleConverter):
+        current.rule["name"] = current.parent.unique_child_name(stream.value())
+      elif key == "children" and "name" in current.rule:
+        current.items = stream.array()
+      else:
+        # children listed before the name of their parent can't be given a
+        # path, so they are read whole and converted along with their parent
+        current.rule[key] = stream.value()
+
+  def parsed(self):
+    if self.manifest is not None:
+      childDigests = self.childDigests + [self.manifest.digest(child) for child in self.rule.get("children", [])]
+      self.manifest.index_fields(self.rule, childDigests)
+
+  def convert_streamed_child(self, child):
+    self.childPaths.append(child.path)
+    self.childFilenames.append(child.filename)
+    if self.convert_file(child):
+      child.convert_descendants()
+    if self.manifest is not None:
+      self.childDigests.append(self.manifest.forget(child.rule))
+
+  def convert_children(self, writer):
+    if "children" in self.rule:
+      return super(StreamedRuleConverter, self).convert_children(writer)
+    self.convert_children_imports(writer, [self.child_import(filename) for filename in self.childFilenames])
+
+class SharedRuleConverter(RuleConverter):
+  def __init__(self, ruleFormat, rule, output, path, manifest=None, shared=None):
+    """
+    Converter of a subtree copied under several rules, to path. The name and
+    uuid of the rule are left to the copies.
+    """
+    super(SharedRuleConverter, self).__init__(ruleFormat, rule, output, None, os.path.dirname(path), manifest, shared)
+    self.sharedPath = path
+
+  @property
+  def template(self):
+    return "papi.rule"
+
+  @property
+  def normalizedName(self):
+    return os.path.splitext(os.path.basename(self.sharedPath))[0]
+
+  @property
+  def filename(self):
+    return os.path.basename(self.sharedPath)
+
+  def convert_name(self, writer):
+    pass
+
+  def convert_uuid(self, writer):
+    pass
+
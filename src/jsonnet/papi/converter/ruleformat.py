@@ -1,12 +1,52 @@
-import json
+import os, json, pathlib
 from .base import BaseConverter
+from ..ruleformat import RuleFormatError
+from ...writer import JsonnetWriter
+
+LIBRARY_LAYOUTS = ("single", "split")
 
 class RuleFormatConverter(BaseConverter):
-  def __init__(self, ruleFormat):
+  def __init__(self, ruleFormat, atoms=None):
+    """
+    atoms maps "behaviors" and "criteria" to the names of the atoms to include,
+    see collect_atoms; by default, the library includes the whole catalog.
+    """
     super(RuleFormatConverter, self).__init__()
     self.ruleFormat = ruleFormat
+    self.atoms = atoms
+
+  @staticmethod
+  def collect_atoms(ruleTree, atoms=None):
+    """
+    Add the names of the behaviors and criteria used by ruleTree to atoms.
+    """
+    atoms = atoms if atoms is not None else dict(behaviors=set(), criteria=set())
+    rules = [ruleTree.get("rules", {})]
+    while len(rules):
+      rule = rules.pop()
+      for ns in ("behaviors", "criteria"):
+        atoms[ns].update(atom.get("name") for atom in rule.get(ns, []))
+      rules.extend(rule.get("children", []))
+    return atoms
+
+  @staticmethod
+  def allow_atoms(ruleFormat, names, atoms):
+    """
+    Add atoms named either "name" or "<behaviors|criteria>.name" to atoms.
+    """
+    for name in names:
+      (ns, _, atom) = name.rpartition(".")
+      namespaces = [ns] if ns else ["behaviors", "criteria"]
+      found = [ns for ns in namespaces if atom in ruleFormat.catalog.get(ns, {})]
+      if len(found) == 0:
+        raise RuleFormatError("{} is not in rule format {} {}".format(name, ruleFormat.product, ruleFormat.ruleFormat))
+      for ns in found:
+        atoms[ns].add(atom)
+    return atoms
 
   def convert(self, writer):
+    if self.atoms is not None:
+      writer.writeln("// trimmed to the behaviors and criteria used by the template")
     self.convert_locals(writer)
     writer.writeln("{")
     self.convert_meta_fields(writer)
@@ -69,22 +109,31 @@ class RuleFormatConverter(BaseConverter):
     )
 
   def convert_behaviors(self, writer):
-    behaviors = self.ruleFormat.resolve_pointer("/definitions/catalog/behaviors")
-    self.convert_atoms(writer, behaviors.items())
+    self.convert_atoms(writer, "behaviors", self.get_atoms("behaviors"))
 
   def convert_criteria(self, writer):
-    criteria = self.ruleFormat.resolve_pointer("/definitions/catalog/criteria")
-    self.convert_atoms(writer, criteria.items())
+    self.convert_atoms(writer, "criteria", self.get_atoms("criteria"))
+
+  def get_atoms(self, ns):
+    atoms = self.ruleFormat.catalog.get(ns).items()
+    if self.atoms is None:
+      return atoms
+    return [(name, options) for (name, options) in atoms if name in self.atoms.get(ns)]
+
+  def convert_atoms(self, writer, ns, atoms):
+    for (name, options) in atoms:
+      self.convert_atom(writer, ns, name, options)
 
-  def convert_atoms(self, writer, atoms):
-    for (name, atom) in atoms:
-      self.convert_atom(writer, name, atom)
+  def convert_atom(self, writer, ns, name, options):
+    writer.write("{name}: ".format(name=name))
+    self.convert_atom_body(writer, name, options)
+    writer.writeln(",")
 
-  def convert_atom(self, writer, name, atom):
-    options = self.get_atom_options(atom)
+  def convert_atom_body(self, writer, name, options):
+    options = self.get_atom_options(options)
     optionNames = [option.get("name") for option in options]
 
-    writer.writeln("{name}: {{".format(name=name))
+    writer.writeln("{")
     writer.writeln("local _ = self,")
     writer.writeln("name: {name},".format(name=json.dumps(name)))
 
@@ -113,16 +162,36 @@ class RuleFormatConverter(BaseConverter):
     # writer.write("assert std.length(std.setDiff(std.objectFieldsAll(_), {validNames})) == 0".format(validNames=json.dumps(validNames)))
     # writer.writeln(": 'unexpected fields {}',")
 
-    writer.writeln("},")
+    writer.write("}")
 
-  def get_atom_options(self, atom):
-    options = atom.get("properties").get("options").get("properties")
-    return list(map(lambda item: self.get_atom_option(atom, *item), options.items()))
+  def get_atom_options(self, options):
+    return list(map(lambda item: self.get_atom_option(*item), options.items()))
 
-  def get_atom_option(self, atom, name, option):
-    if "$ref" in option:
-      option.update(self.ruleFormat.resolve_pointer(option.get("$ref")))
+  def get_atom_option(self, name, option):
+    # $refs are already resolved in the rule format's catalog
     return {
       "name": name,
       "default": option.get("default", None)
     }
+
+class SplitRuleFormatConverter(RuleFormatConverter):
+  def __init__(self, ruleFormat, output, dirname, atoms=None):
+    """
+    Write each atom to its own file under {dirname}/{ruleFormat}/ in output, and
+    only import them from the library; as jsonnet imports lazily, rendering a
+    template only parses the files of the atoms it uses.
+
+    dirname is the directory of output the library will be written to.
+    """
+    super(SplitRuleFormatConverter, self).__init__(ruleFormat, atoms)
+    self.output = output
+    self.dirname = dirname
+
+  def convert_atom(self, writer, ns, name, options):
+    # use PurePosixPath to ensure paths use / regardless of platform
+    importPath = pathlib.PurePosixPath(self.ruleFormat.ruleFormat, ns, "{}.libsonnet".format(name))
+    atomWriter = JsonnetWriter()
+    self.convert_atom_body(atomWriter, name, options)
+    atomWriter.writeln()
+    self.output.dump(os.path.join(self.dirname, *importPath.parts), atomWriter)
+    writer.writeln("{name}: import '{path}',".format(name=name, path=importPath))
@@ -1,11 +1,37 @@
 import json
 from .ruleformatentity import RuleFormatEntityConverter
-from .rule import RuleConverter
+from .rule import RuleConverter, StreamedRuleConverter, SharedRuleConverter
+from .manifest import RuleManifest
+from .shared import SharedRules
+from ....jsonstream import JsonStreamError
 
 class RuleTreeConverter(RuleFormatEntityConverter):
-  def __init__(self, ruleFormat, ruleTree):
+  def __init__(self, ruleFormat, ruleTree, output, dirname="", incremental=False, dedup=False, common=None):
+    """
+    dirname is the directory of output the rule tree's jsonnet file will be written to.
+
+    If incremental, rules that haven't changed since the previous conversion to
+    the same directory, according to its manifest, are not converted again.
+
+    If dedup, rule subtrees copied under several parents are converted once,
+    see SharedRules. common is the CommonRules of ruleTree, to import what it
+    has in common with other properties from lib/common instead.
+    """
     super(RuleTreeConverter, self).__init__(ruleFormat)
     self.ruleTree = ruleTree
+    self.output = output
+    self.dirname = dirname
+    self.manifest = None
+    self.shared = common
+    if common is None and dedup:
+      self.shared = SharedRules(ruleTree, dirname)
+    if incremental:
+      from ...writer import JsonnetWriter
+      formatter = output.formatter if output.formatter is not None else JsonnetWriter.formatter
+      # "latest" changes whenever a rule format is released, so the schema identifies it
+      context = dict(productId=ruleFormat.product, ruleFormat=ruleFormat.ruleFormat, schema=ruleFormat.digest, formatter=formatter.name,
+        shared=self.shared.context if self.shared is not None else None)
+      self.manifest = RuleManifest(output, dirname, context)
 
   def convert(self, writer):
     self.convert_papi_import_statement(writer)
@@ -17,6 +43,52 @@ class RuleTreeConverter(RuleFormatEntityConverter):
     if 'groupId' in self.ruleTree:
       writer.writeln('groupId: {},'.format(json.dumps(self.ruleTree.get('groupId'))))
     writer.write('rules: ')
-    defaultRule = RuleConverter(self.ruleFormat, self.ruleTree.get("rules"), self)
+    defaultRule = self.get_default_rule()
     defaultRule.convert(writer)
     writer.writeln('}')
+    defaultRule.convert_descendants()
+    if self.shared is not None:
+      self.convert_remaining(defaultRule)
+    if self.manifest is not None:
+      self.manifest.record(defaultRule.path, defaultRule.rule, [defaultRule.path] + defaultRule.files, defaultRule.childPaths)
+      self.manifest.save()
+
+  def convert_remaining(self, defaultRule):
+    """
+    Convert the shared files no rule of the tree has converted.
+    """
+    for (kind, path, value) in self.shared.remaining():
+      if kind == "rules":
+        converter = SharedRuleConverter(self.ruleFormat, value, self.output, path, None, self.shared)
+        defaultRule.convert_file(converter)
+        converter.convert_descendants()
+      else:
+        converter = RuleConverter(self.ruleFormat, {kind: value}, self.output, shared=self.shared)
+        converter.convert_atoms_file(kind, path)
+
+  def get_default_rule(self):
+    return RuleConverter(self.ruleFormat, self.ruleTree.get("rules"), self.output, self, self.dirname, self.manifest, self.shared)
+
+class StreamingRuleTreeConverter(RuleTreeConverter):
+  def __init__(self, ruleFormat, stream, output, dirname="", incremental=False):
+    """
+    Convert the rule tree read from a JsonStream, converting rules while they
+    are parsed; see StreamedRuleConverter.
+    """
+    super(StreamingRuleTreeConverter, self).__init__(ruleFormat, dict(), output, dirname, incremental)
+    self.stream = stream
+    self.defaultRule = None
+
+  def convert(self, writer):
+    for key in self.stream.object():
+      if key == "rules":
+        self.defaultRule = StreamedRuleConverter(self.ruleFormat, self.output, self, self.dirname, self.manifest)
+        self.defaultRule.parse(self.stream)
+      else:
+        self.ruleTree[key] = self.stream.value()
+    if self.defaultRule is None:
+      raise JsonStreamError("not a rule tree, rules is missing")
+    super(StreamingRuleTreeConverter, self).convert(writer)
+
+  def get_default_rule(self):
+    return self.defaultRule
@@ -0,0 +1,193 @@
+import os, json, hashlib
+from collections import Counter
+
+def digest_json(value, digests=()):
+  h = hashlib.sha256()
+  h.update(json.dumps(value, sort_keys=True).encode())
+  for digest in digests:
+    h.update(digest.encode())
+  return h.hexdigest()
+
+def index_rules(rule, salt=""):
+  """
+  Yield each rule of the subtree bottom-up, along with the digest of its subtree
+  leaving out its own name and uuid.
+  """
+  fullDigests = dict()
+  stack = [(rule, False)]
+  while len(stack):
+    (current, visited) = stack.pop()
+    children = current.get("children", [])
+    if not visited:
+      stack.append((current, True))
+      stack.extend((child, False) for child in children)
+      continue
+    fields = dict((k, v) for (k, v) in current.items() if k not in ("name", "uuid", "children"))
+    digest = digest_json([salt, fields], [fullDigests.pop(id(child)) for child in children])
+    fullDigests[id(current)] = digest_json([digest, current.get("name"), current.get("uuid")])
+    yield (current, digest)
+
+def shareable(rule):
+  # the default rule can't be a child, and rules writing files next to their
+  # own would clash in the shared directory
+  return rule.get("name") != "default" and not "variables" in rule and not "advancedOverride" in rule
+
+class SharedRules:
+  """
+  Rule subtrees occurring more than once in a rule tree, apart from the name and
+  uuid of their root.
+
+  Each of them is converted once to _shared/<digest>.libsonnet, next to the rule
+  tree's jsonnet file, and its copies import that file and override the name
+  and uuid.
+  """
+  dirname = "_shared"
+  # whether the shared files belong to the rule tree, and go in its manifest
+  tracked = True
+  # changes to the files the rule tree is converted to
+  context = "dedup"
+
+  def __init__(self, ruleTree, dirname=""):
+    self.root = os.path.join(dirname, self.dirname)
+    # id(rule) -> digest of the rule without its name and uuid
+    self.digests = dict()
+    self.uses = Counter()
+    # paths of the shared files converted so far
+    self.converted = set()
+    self.index(ruleTree.get("rules", {}))
+
+  def index(self, rule):
+    """
+    Hash all the subtrees, then count the copies of each one that remain once
+    the shared subtrees are only converted once.
+    """
+    counts = Counter()
+    for (current, digest) in index_rules(rule):
+      if shareable(current):
+        self.digests[id(current)] = digest
+        counts[digest] += 1
+    expanded = set()
+    pending = [rule]
+    while len(pending):
+      for child in pending.pop().get("children", []):
+        digest = self.digests.get(id(child))
+        if digest is not None and counts[digest] > 1:
+          self.uses[digest] += 1
+          if digest in expanded:
+            continue
+          expanded.add(digest)
+        pending.append(child)
+
+  def path(self, rule):
+    """
+    Return the path of the shared file rule is a copy of, or None.
+    """
+    digest = self.digests.get(id(rule))
+    if digest is None or self.uses[digest] < 2:
+      return None
+    return os.path.join(self.root, "{}.libsonnet".format(digest[:16]))
+
+  def atoms_path(self, rule, ns):
+    return None
+
+  def import_path(self, path, dirname):
+    """
+    Return how a file in dirname imports the shared file at path.
+    """
+    return os.path.relpath(path, dirname or ".")
+
+  def claim(self, path):
+    """
+    Whether the caller is to convert the shared file at path, i.e. it hasn't been yet.
+    """
+    if path in self.converted:
+      return False
+    self.converted.add(path)
+    return True
+
+  def remaining(self):
+    """
+    Yield the (kind, path, rule or atoms) left to convert once the rule tree has been.
+    """
+    return iter(())
+
+class CommonRules(SharedRules):
+  """
+  Rules, criteria and behaviors found in several properties of a fleet, written
+  once to lib/common/<kind>/<digest>.libsonnet and imported by the properties
+  through the library path.
+
+  The properties' rule trees are hashed first with analyze(); then each common
+  file is converted by a single property, its owner.
+  """
+  dirname = os.path.join("lib", "common")
+  tracked = False
+
+  def __init__(self, ruleTree, salt, common, owned, key):
+    """
+    salt identifies the rule format of ruleTree, which the files depend on.
+    common and owned are sets of (kind, digest) as returned by analyze(), and
+    key is the key() of common.
+    """
+    self.root = self.dirname
+    self.context = "common:{}".format(key)
+    self.digests = dict()
+    self.atoms = dict()
+    self.converted = set()
+    self.owned = dict()
+    for (kind, digest, value) in self.walk(ruleTree, salt):
+      if (kind, digest) not in common:
+        continue
+      if kind == "rules":
+        self.digests[id(value)] = digest
+      else:
+        self.atoms[id(value)] = digest
+      if (kind, digest) in owned:
+        self.owned.setdefault(self.common_path(kind, digest), (kind, value))
+
+  @staticmethod
+  def walk(ruleTree, salt):
+    """
+    Yield the kind, digest and value of the rules, criteria and behaviors of ruleTree.
+    """
+    for (rule, digest) in index_rules(ruleTree.get("rules", {}), salt):
+      if shareable(rule):
+        yield ("rules", digest[:16], rule)
+      for ns in ("criteria", "behaviors"):
+        if len(rule.get(ns, [])):
+          yield (ns, digest_json([salt, ns, rule.get(ns)])[:16], rule.get(ns))
+
+  @staticmethod
+  def analyze(ruleTree, salt):
+    return set((kind, digest) for (kind, digest, value) in CommonRules.walk(ruleTree, salt))
+
+  @staticmethod
+  def key(common):
+    """
+    Return a digest of the set of common files.
+    """
+    return digest_json(sorted(common))[:16]
+
+  @classmethod
+  def common_path(cls, kind, digest):
+    return os.path.join(cls.dirname, kind, "{}.libsonnet".format(digest))
+
+  def path(self, rule):
+    digest = self.digests.get(id(rule))
+    return self.common_path("rules", digest) if digest is not None else None
+
+  def atoms_path(self, rule, ns):
+    digest = self.atoms.get(id(rule.get(ns)))
+    return self.common_path(ns, digest) if digest is not None else None
+
+  def import_path(self, path, dirname):
+    # lib is on the library path of the templates
+    return os.path.relpath(path, "lib")
+
+  def claim(self, path):
+    return path in self.owned and super(CommonRules, self).claim(path)
+
+  def remaining(self):
+    for (path, (kind, value)) in sorted(self.owned.items()):
+      if self.claim(path):
+        yield (kind, path, value)
@@ -1,16 +1,44 @@
 from ..writer import JsonnetWriter
-import sys
-from ...edgegrid import Session
+import json
+from concurrent.futures import ThreadPoolExecutor
+from ...utils import gather, progress
+from ...metrics import metrics
 
 class PropertyError(Exception):
   pass
 
+# fields of the properties listed by the API kept in the catalog
+CATALOG_FIELDS = ("propertyId", "contractId", "groupId", "latestVersion", "stagingVersion", "productionVersion")
+
+# catalogs loaded by this process, by cache key: (digest, properties)
+_catalogs = dict()
+
 class Property:
   @staticmethod
-  def getHostnames(edgerc, section, name, version="latest", accountSwitchKey=None):
-    session = Session(edgerc, section, accountSwitchKey)
+  def find(session, name, version="latest", cache=None):
+    """
+    Resolve a property name to its id, contract and group, and "latest" to an
+    actual version number.
+
+    Specific versions are immutable, so the lookup is cached and later ones don't
+    need to search the API.
+    """
+    cacheKey = "properties/{}/{}/{}".format(session.edgerc.get(session.section, "host"), session.accountSwitchKey, name)
+    if version != "latest" and cache is not None:
+      cached = cache.load(cacheKey)
+      if cached is not None:
+        return dict(json.loads(cached.decode("utf-8")), propertyVersion=version)
 
-    print("*** searching for property...", name, file=sys.stderr)
+    # the catalog may be older than the latest version, which is asked to the API
+    listed = Property.loadCatalog(session, cache).get(name) if cache is not None else None
+    if listed is not None:
+      found = dict((k, listed.get(k)) for k in ("propertyId", "contractId", "groupId"))
+      if version == "latest":
+        version = Property.latestVersion(session, found)
+        progress("*** Latest is v%s" % version)
+      return dict(found, propertyVersion=version)
+
+    progress("*** searching for property... %s" % name)
     response = session.post("/papi/v1/search/find-by-value", json={"propertyName": name})
     if not response.ok:
       raise PropertyError(
@@ -25,14 +53,21 @@ class Property:
     if len(versions) == 0:
       raise PropertyError("not found: %s" % name)
 
-    pid = next(version.get("propertyId") for version in versions)
+    found = dict((k, versions[0].get(k)) for k in ("propertyId", "contractId", "groupId"))
+    if cache is not None:
+      cache.put(cacheKey, json.dumps(found).encode())
     if version == "latest":
       version = max(v.get("propertyVersion") for v in versions)
-      print("*** Latest is v%s" % version, file=sys.stderr)
+      progress("*** Latest is v%s" % version)
+    return dict(found, propertyVersion=version)
 
-    print("*** retrieving property hostnames for", name, version, file=sys.stderr)
-    url = "/papi/v1/properties/{}/versions/{}/hostnames".format(pid, version)
-    response = session.get(url)
+  @staticmethod
+  def latestVersion(session, found):
+    """
+    Return the latest version of a property found by id, contract and group.
+    """
+    url = "/papi/v1/properties/{}".format(found.get("propertyId"))
+    response = session.get(url, params=dict(contractId=found.get("contractId"), groupId=found.get("groupId")))
     if not response.ok:
       raise PropertyError(
         (
@@ -41,40 +76,72 @@ class Property:
           "%s\n"
         ) % (url, response.status_code, response.reason, response.text)
       )
-    hostnames = response.json().get('hostnames').get('items')
-    return hostnames
+    return response.json().get("properties").get("items")[0].get("latestVersion")
 
   @staticmethod
-  def get(edgerc, section, name, version="latest", ruleFormat=None, accountSwitchKey=None):
-    session = Session(edgerc, section, accountSwitchKey)
-
-    print("*** searching for property...", name, file=sys.stderr)
-    response = session.post("/papi/v1/search/find-by-value", json={"propertyName": name})
+  def list(session, maxWorkers=8):
+    """
+    List the properties of all the contracts and groups the credentials have access to.
+    """
+    response = session.get("/papi/v1/groups")
     if not response.ok:
       raise PropertyError(
         (
-          "Endpoint /papi/v1/search/find-by-value said:\n"
+          "Endpoint /papi/v1/groups said:\n"
           "%s %s\n"
           "%s\n"
         ) % (response.status_code, response.reason, response.text)
       )
+    groups = response.json().get("groups").get("items")
+    pairs = [(contractId, group.get("groupId")) for group in groups for contractId in group.get("contractIds", [])]
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+      results = gather(*(executor.submit(Property.listGroup, session, contractId, groupId) for (contractId, groupId) in pairs))
+    properties = dict()
+    for items in results:
+      for item in items:
+        properties.setdefault(item.get("propertyId"), item)
+    return list(properties.values())
 
-    versions = response.json().get("versions").get("items")
-    if len(versions) == 0:
-      raise PropertyError("not found: %s" % name)
+  @staticmethod
+  def catalogKey(session):
+    return "catalog/{}/{}".format(session.edgerc.get(session.section, "host"), session.accountSwitchKey)
 
-    pid = next(version.get("propertyId") for version in versions)
-    if version == "latest":
-      version = max(v.get("propertyVersion") for v in versions)
-      print("*** Latest is v%s" % version, file=sys.stderr)
+  @staticmethod
+  def syncCatalog(session, cache, maxWorkers=8):
+    """
+    List all the properties of the account, and save them to the cache by name,
+    for find() to resolve names without searching the API.
+    """
+    properties = dict()
+    for item in Property.list(session, maxWorkers):
+      properties.setdefault(item.get("propertyName"), dict((k, item.get(k)) for k in CATALOG_FIELDS))
+    cache.put(Property.catalogKey(session), json.dumps(dict(properties=properties)).encode())
+    return properties
 
-    print("*** retrieving property rule tree for", name, pid, version, file=sys.stderr)
-    headers = {}
-    if ruleFormat is not None:
-      accept = "application/vnd.akamai.papirules.{}+json".format(ruleFormat.ruleFormat)
-      headers["Accept"] = accept
-    url = "/papi/v1/properties/{}/versions/{}/rules".format(pid, version)
-    response = session.get(url, headers=headers, params=dict(validateRules=False, validateMode="fast"))
+  @staticmethod
+  def loadCatalog(session, cache):
+    """
+    Return the properties saved by syncCatalog(), by name; the catalog is only
+    read once by each process, unless it is synced again.
+    """
+    cacheKey = Property.catalogKey(session)
+    entry = cache.get(cacheKey)
+    if entry is None:
+      return dict()
+    (digest, properties) = _catalogs.get(cacheKey, (None, None))
+    if digest != entry.get("digest"):
+      try:
+        with metrics.phase("json"):
+          properties = json.loads(cache.read(entry).decode("utf-8")).get("properties")
+      except OSError:
+        return dict()
+      _catalogs[cacheKey] = (entry.get("digest"), properties)
+    return properties
+
+  @staticmethod
+  def listGroup(session, contractId, groupId):
+    url = "/papi/v1/properties"
+    response = session.get(url, params=dict(contractId=contractId, groupId=groupId))
     if not response.ok:
       raise PropertyError(
         (
@@ -83,11 +150,21 @@ class Property:
           "%s\n"
         ) % (url, response.status_code, response.reason, response.text)
       )
-    ruleTree = response.json()
+    return response.json().get("properties").get("items")
 
-    print("*** retrieving property hostnames for", name, version, file=sys.stderr)
-    url = "/papi/v1/properties/{}/versions/{}/hostnames".format(pid, version)
-    response = session.get(url)
+  @staticmethod
+  def fetch(session, url, cacheKey=None, cache=None, **kwargs):
+    """
+    GET a property version's sub-resource, from the cache if possible.
+    """
+    if cacheKey is not None and cache is not None:
+      cached = cache.load(cacheKey)
+      if cached is not None:
+        progress("*** using cached %s" % url)
+        with metrics.phase("json"):
+          return json.loads(cached.decode("utf-8"))
+
+    response = session.get(url, **kwargs)
     if not response.ok:
       raise PropertyError(
         (
@@ -96,7 +173,57 @@ class Property:
           "%s\n"
         ) % (url, response.status_code, response.reason, response.text)
       )
-    hostnames = response.json().get('hostnames').get('items')
+    if cacheKey is not None and cache is not None:
+      cache.put(cacheKey, response.content)
+    with metrics.phase("json"):
+      return response.json()
+
+  @staticmethod
+  def getHostnames(session, name, version="latest", cache=None):
+    found = Property.find(session, name, version, cache)
+    return Property.fetchHostnames(session, name, found.get("propertyId"), found.get("propertyVersion"), cache)
+
+  @staticmethod
+  def fetchHostnames(session, name, pid, version, cache=None):
+    progress("*** retrieving property hostnames for %s %s" % (name, version))
+    url = "/papi/v1/properties/{}/versions/{}/hostnames".format(pid, version)
+    cacheKey = "properties/{}/versions/{}/hostnames".format(pid, version)
+    return Property.fetch(session, url, cacheKey, cache).get('hostnames').get('items')
+
+  @staticmethod
+  def fetchRules(session, name, pid, version, ruleFormat=None, cache=None, schemaDigest=None):
+    """
+    ruleFormat is the name of the rule format, e.g. "v2023-01-05"; by default
+    the rule tree is returned in the version's own rule format.
+
+    schemaDigest is the digest of the schema "latest" currently resolves to;
+    rule trees requested as "latest" are only cached along with it.
+    """
+    progress("*** retrieving property rule tree for %s %s %s" % (name, pid, version))
+    headers = {}
+    cacheKey = "properties/{}/versions/{}/rules".format(pid, version)
+    if ruleFormat is not None:
+      accept = "application/vnd.akamai.papirules.{}+json".format(ruleFormat)
+      headers["Accept"] = accept
+      if ruleFormat != "latest":
+        cacheKey = "{}/{}".format(cacheKey, ruleFormat)
+      elif schemaDigest is not None:
+        # rule trees requested as "latest" change whenever a new rule format is released
+        cacheKey = "{}/latest/{}".format(cacheKey, schemaDigest)
+      else:
+        cacheKey = None
+    url = "/papi/v1/properties/{}/versions/{}/rules".format(pid, version)
+    return Property.fetch(session, url, cacheKey, cache, headers=headers, params=dict(validateRules=False, validateMode="fast"))
+
+  @staticmethod
+  def get(session, name, version="latest", ruleFormat=None, cache=None):
+    found = Property.find(session, name, version, cache)
+    (pid, version) = (found.get("propertyId"), found.get("propertyVersion"))
+    if ruleFormat is not None:
+      ruleTree = Property.fetchRules(session, name, pid, version, ruleFormat.ruleFormat, cache, ruleFormat.digest)
+    else:
+      ruleTree = Property.fetchRules(session, name, pid, version, None, cache)
+    hostnames = Property.fetchHostnames(session, name, pid, version, cache)
     return Property(name, pid, ruleTree, hostnames)
 
   def __init__(self, name, id, ruleTree, hostnames):
@@ -111,4 +238,4 @@ class Property:
 
   @property
   def contractId(self):
-    return self.ruleTree.get('contractId')
\ No newline at end of file
+    return self.ruleTree.get('contractId')
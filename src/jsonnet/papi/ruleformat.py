@@ -1,18 +1,67 @@
+import json
+import hashlib
+import threading
 from jsonpointer import resolve_pointer
-from ...edgegrid import Session
+from ...metrics import metrics
+from ...utils import progress
+
+# bump whenever the structure of RuleFormat.catalog changes
+CATALOG_VERSION = 1
 
 class RuleFormatError(RuntimeError):
   pass
 
+class FrozenDict(dict):
+  """
+  Read-only dict; unlike MappingProxyType it can be pickled and encoded as json.
+  """
+  def _readonly(self, *args, **kwargs):
+    raise TypeError("FrozenDict is read-only")
+
+  __setitem__ = __delitem__ = __ior__ = _readonly
+  clear = pop = popitem = setdefault = update = _readonly
+
+  def __reduce__(self):
+    return (FrozenDict, (dict(self),))
+
+def freeze(value):
+  """
+  Return a read-only deep copy of a json value.
+  """
+  if isinstance(value, dict):
+    return FrozenDict((k, freeze(v)) for (k, v) in value.items())
+  if isinstance(value, list):
+    return tuple(freeze(v) for v in value)
+  return value
+
 class RuleFormat:
   @staticmethod
-  def get(edgerc, section, product, ruleFormat="latest", accountSwitchKey=None):
-    session = Session(edgerc, section, accountSwitchKey)
+  def get(session, product, ruleFormat="latest", cache=None):
+    # schemas only depend on the product and rule format, not on the account
+    cacheKey = "schemas/{product}/{ruleFormat}".format(product=product, ruleFormat=ruleFormat)
+    cached = cache.get(cacheKey) if cache is not None else None
+    if cached is not None and ruleFormat != "latest":
+      # pinned rule formats never change
+      loaded = RuleFormat.load(cache, cacheKey, cached, product, ruleFormat)
+      if loaded is not None:
+        progress("*** using cached rule format %s %s" % (product, ruleFormat))
+        return loaded
+      cached = None
+
     url = "/papi/v1/schemas/products/{product}/{ruleFormat}".format(
       product=product,
       ruleFormat=ruleFormat
     )
-    response = session.get(url)
+    headers = {}
+    if cached is not None and cached.get("etag"):
+      headers["If-None-Match"] = cached.get("etag")
+    response = session.get(url, headers=headers)
+    if response.status_code == 304:
+      loaded = RuleFormat.load(cache, cacheKey, cached, product, ruleFormat)
+      if loaded is not None:
+        progress("*** rule format %s %s is up to date" % (product, ruleFormat))
+        return loaded
+      response = session.get(url)
     if not response.ok:
       raise RuleFormatError(
         (
@@ -21,14 +70,136 @@ class RuleFormat:
           "%s\n"
         ) % (url, response.status_code, response.reason, response.text)
       )
-    schema = response.json()
-    return RuleFormat(schema, product, ruleFormat)
+    with metrics.phase("json"):
+      ruleFormat = RuleFormat(response.json(), product, ruleFormat, digest=hashlib.sha256(response.content).hexdigest())
+    if cache is not None:
+      entry = cache.put(cacheKey, response.content, etag=response.headers.get("ETag"))
+      RuleFormat.save_catalog(cache, cacheKey, entry, ruleFormat.catalog)
+    return ruleFormat
+
+  @staticmethod
+  def load(cache, cacheKey, entry, product, ruleFormat):
+    """
+    Load a cached schema, along with its catalog index if that was cached too.
+
+    Return None if the schema was evicted since entry was looked up, e.g. by
+    another process.
+    """
+    catalog = None
+    catalogEntry = cache.get(cacheKey + "/catalog")
+    if catalogEntry is not None and catalogEntry.get("schema") == entry.get("digest") and catalogEntry.get("version") == CATALOG_VERSION:
+      try:
+        catalog = freeze(json.loads(cache.read(catalogEntry).decode("utf-8")))
+      except OSError:
+        pass
+    try:
+      ruleFormat = RuleFormat(cache.read(entry), product, ruleFormat, catalog, entry.get("digest"))
+    except OSError:
+      return None
+    if catalog is None:
+      RuleFormat.save_catalog(cache, cacheKey, entry, ruleFormat.catalog)
+    return ruleFormat
+
+  @staticmethod
+  def save_catalog(cache, cacheKey, entry, catalog):
+    # the catalog is only valid for the exact schema it was built from
+    cache.put(cacheKey + "/catalog", json.dumps(catalog).encode(), schema=entry.get("digest"), version=CATALOG_VERSION)
 
-  def __init__(self, schema, product, ruleFormat):
-    self.schema = schema
+  def __init__(self, schema, product, ruleFormat, catalog=None, digest=None):
+    """
+    schema is the parsed json schema, or its raw bytes to be parsed on first use;
+    with a catalog from the cache, most conversions never need it.
+
+    digest is the sha256 of the schema as downloaded, if known.
+    """
+    self._schema = schema
+    self._catalog = catalog
+    self._digest = digest
+    # resolved $refs, by ref
+    self._refs = dict()
+    self._lock = threading.RLock()
     self.product = product
     self.ruleFormat = ruleFormat
 
+  def __getstate__(self):
+    state = dict(self.__dict__)
+    del state["_lock"]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.RLock()
+
+  @property
+  def schema(self):
+    if isinstance(self._schema, bytes):
+      with self._lock:
+        if isinstance(self._schema, bytes):
+          with metrics.phase("json"):
+            self._schema = json.loads(self._schema.decode("utf-8"))
+    return self._schema
+
+  @property
+  def digest(self):
+    """
+    Digest identifying the schema, which "latest" resolves to.
+    """
+    if self._digest is None:
+      schema = self._schema if isinstance(self._schema, bytes) else json.dumps(self._schema, sort_keys=True).encode()
+      self._digest = hashlib.sha256(schema).hexdigest()
+    return self._digest
+
+  @property
+  def catalog(self):
+    """
+    Read-only index of the options of each behavior and criterion, by namespace
+    and name, with the $refs of the options resolved.
+    """
+    if self._catalog is None:
+      with self._lock:
+        if self._catalog is None:
+          self._catalog = self.build_catalog()
+    return self._catalog
+
+  def build_catalog(self):
+    with metrics.phase("schema"):
+      catalog = dict()
+      for ns in ("behaviors", "criteria"):
+        atoms = self.resolve_pointer("/definitions/catalog/{}".format(ns))
+        catalog[ns] = dict((name, self.resolve_options(atom)) for (name, atom) in atoms.items())
+      return freeze(catalog)
+
+  def resolve_options(self, atom):
+    options = dict()
+    for (name, option) in atom.get("properties").get("options").get("properties").items():
+      if "$ref" in option:
+        option = dict(option, **self.resolve_ref(option.get("$ref")))
+      options[name] = option
+    return options
+
+  def resolve_ref(self, ref):
+    """
+    Return a read-only copy of the target of ref; each ref is only resolved once,
+    and the schema itself is never modified.
+    """
+    resolved = self._refs.get(ref)
+    if resolved is None:
+      with self._lock:
+        resolved = self._refs.get(ref)
+        if resolved is None:
+          resolved = freeze(self.resolve_pointer(ref))
+          self._refs[ref] = resolved
+    return resolved
+
+  def get_options(self, ns, name):
+    """
+    Return the options of the behavior or criterion name, ns being "behaviors" or "criteria".
+    """
+    options = self.catalog.get(ns, {}).get(name)
+    if options is None:
+      raise RuleFormatError("{} {} is not in rule format {} {}".format(ns, name, self.product, self.ruleFormat))
+    return options
+
   def resolve_pointer(self, ptr):
     return resolve_pointer(self.schema, ptr.lstrip("#"))
 
@@ -38,6 +209,6 @@ class RuleFormat:
     defaults = {}
     for (name, prop) in atom.get("properties", {}).items():
       if "$ref" in prop:
-        prop = self.resolve_pointer(prop.get("$ref"))
+        prop = self.resolve_ref(prop.get("$ref"))
       defaults[name] = prop.get("default", None)
     return defaults
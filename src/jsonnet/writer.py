@@ -1,4 +1,3 @@
-import os
 import textwrap
 import sys
 import json
@@ -9,9 +8,12 @@ if py3:
 else:
   from StringIO import StringIO
 
-from subprocess import Popen, PIPE
+from .formatter import BuiltinFormatter, FormatterError
 
 class JsonnetWriter(StringIO):
+  # shared by all writers, see main.init_formatter
+  formatter = BuiltinFormatter()
+
   def __init__(self):
     super(JsonnetWriter, self).__init__()
 
@@ -25,23 +27,16 @@ class JsonnetWriter(StringIO):
       wrapped = "\n".join(textwrap.wrap(s, width=80, initial_indent="    ", subsequent_indent="    "))
       self.write('|||\n{}\n|||'.format(wrapped))
 
+  def getsource(self):
+    """
+    Return the jsonnet as written, without formatting.
+    """
+    return super(JsonnetWriter, self).getvalue()
+
   def getvalue(self):
-    val = super(JsonnetWriter, self).getvalue()
+    val = self.getsource()
     try:
-      proc = Popen(["jsonnetfmt", "-"], stdout=PIPE, stdin=PIPE)
-      out = proc.communicate(input=val.encode())[0]
-      if proc.returncode == 0:
-        val = out.decode("utf-8")
-    except:
+      val = self.formatter.format(val)
+    except FormatterError:
       pass
     return val
-
-  def dump(self, path):
-    data = self.getvalue()
-    dirname = os.path.dirname(path)
-    if len(dirname):
-      os.makedirs(dirname, exist_ok=True)
-    with open(path, "w", newline='\n') as fd:
-      fd.write(data)
-    print(os.path.realpath(path), file=sys.stderr)
-
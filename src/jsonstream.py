@@ -0,0 +1,113 @@
+import re
+import json
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+# characters that may continue a number
+_NUMBER_CHARS = "0123456789.eE+-"
+
+class JsonStreamError(ValueError):
+  pass
+
+class JsonStream:
+  """
+  Pull parser reading json from a text file a chunk at a time.
+
+  The caller walks the document with object() and array(), and reads the values
+  it wants whole with value(), which uses the C decoder. Only the current chunk
+  and the value being decoded are ever held in memory:
+
+      for key in stream.object():
+        if key == "items":
+          for _ in stream.array():
+            handle(stream.value())
+        else:
+          stream.value()
+  """
+
+  def __init__(self, fd, chunkSize=DEFAULT_CHUNK_SIZE):
+    self.fd = fd
+    self.chunkSize = chunkSize
+    self.buffer = ""
+    self.pos = 0
+    self.decoder = json.JSONDecoder()
+
+  def _fill(self, size):
+    data = self.fd.read(size)
+    if not data:
+      return False
+    self.buffer = self.buffer[self.pos:] + data
+    self.pos = 0
+    return True
+
+  def _peek(self):
+    """
+    Skip whitespace and return the next character, or None at the end of the file.
+    """
+    while True:
+      self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+      if self.pos < len(self.buffer):
+        return self.buffer[self.pos]
+      if not self._fill(self.chunkSize):
+        return None
+
+  def _expect(self, chars):
+    c = self._peek()
+    if c is None or c not in chars:
+      raise JsonStreamError("expecting one of {} at {!r}".format(" ".join(chars), self.buffer[self.pos:self.pos + 20]))
+    self.pos += 1
+    return c
+
+  def value(self):
+    """
+    Read the next value whole.
+    """
+    self._peek()
+    size = self.chunkSize
+    while True:
+      try:
+        (value, end) = self.decoder.raw_decode(self.buffer, self.pos)
+      except json.JSONDecodeError as e:
+        # the value probably continues in the next chunk; read larger and
+        # larger chunks, so that huge values are decoded a few times at most
+        if not self._fill(size):
+          raise JsonStreamError(str(e))
+        size *= 2
+        continue
+      # so might a number, even when its start decodes, e.g. "6." or "6e"
+      if (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARS) and self._fill(size):
+        continue
+      self.pos = end
+      return value
+
+  def object(self):
+    """
+    Iterate over the keys of the next object; the caller must consume the value
+    of each key before asking for the next one.
+    """
+    self._expect("{")
+    if self._peek() == "}":
+      self.pos += 1
+      return
+    while True:
+      key = self.value()
+      if not isinstance(key, str):
+        raise JsonStreamError("expecting a string key, got {!r}".format(key))
+      self._expect(":")
+      yield key
+      if self._expect(",}") == "}":
+        return
+
+  def array(self):
+    """
+    Iterate over the items of the next array; the caller must consume each item.
+    """
+    self._expect("[")
+    if self._peek() == "]":
+      self.pos += 1
+      return
+    while True:
+      yield
+      if self._expect(",]") == "]":
+        return
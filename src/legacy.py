@@ -1,4 +1,3 @@
-from .utils import pushd
 import re, os.path
 
 # def resolveIncludes(json):
@@ -8,12 +8,21 @@ def main():
   parser = argparse.ArgumentParser(prog="akamai-jsonnet", description="Akamai Jsonnet utilities.")
   init_defaults(parser)
   init_edgerc(parser)
+  init_formatter(parser)
+  init_cache(parser)
+  init_profile(parser)
+  init_transport(parser)
+  init_rate_limit(parser)
   subparsers = parser.add_subparsers(title="Commands")
   init_papi(subparsers)
+  init_render(subparsers)
   args = parser.parse_args()
 
   try:
-    args.func(args)
+    configure_formatter(args.formatter)
+    configure_transport(args)
+    configure_rate_limit(args)
+    run_profiled(args)
   except Exception as e:
     if args.verbose:
       traceback.print_exc(file=sys.stderr)
@@ -21,6 +30,30 @@ def main():
       print(textwrap.indent("%s: %s" % (e.__class__.__name__, str(e)), prefix='!!! '), file=sys.stderr)
     sys.exit(1)
 
+def run_profiled(args):
+  """
+  Run the command, collecting metrics and profiling it if asked to; they are
+  reported even if the command fails.
+  """
+  from .metrics import metrics
+
+  metrics.reset(args.profile or args.metricsJson is not None or args.profileDump is not None)
+  profiler = None
+  if args.profileDump is not None:
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+  try:
+    args.func(args)
+  finally:
+    if profiler is not None:
+      profiler.disable()
+      profiler.dump_stats(args.profileDump)
+    if args.metricsJson is not None:
+      metrics.dump(args.metricsJson)
+    if args.profile:
+      metrics.report()
+
 def init_defaults(parser):
   parser.add_argument("--verbose", required=False, action='store_true', default=False, help="be more verbose")
   parser.set_defaults(func=lambda args: parser.print_help())
@@ -37,6 +70,102 @@ def init_edgerc(parser):
   default_edgerc_section = env_edgerc_section if env_edgerc_section else "default"
   parser.add_argument("--section", help="Edgerc section", default=default_edgerc_section)
   parser.add_argument("--accountkey", default=None, required=False, help="[Akamai Internal] account switch key")
+  from .edgegrid import DEFAULT_POOL_SIZE
+  parser.add_argument("--pool-size", dest="poolSize", type=int, default=DEFAULT_POOL_SIZE,
+    help="maximum number of HTTP connections kept alive to the API; default to %(default)s")
+
+def init_formatter(parser):
+  from .jsonnet.formatter import FORMATTERS
+
+  env_formatter = os.getenv("AKAMAI_JSONNET_FORMATTER")
+  default_formatter = env_formatter if env_formatter else "builtin"
+  parser.add_argument("--formatter", choices=sorted(FORMATTERS.keys()), default=default_formatter,
+    help="how to format generated jsonnet; 'jsonnetfmt' requires the executable on your PATH")
+
+def init_archive(parser):
+  from .output import ARCHIVE_FORMATS
+  parser.add_argument("--archive", required=False, choices=ARCHIVE_FORMATS, help="write the generated files to stdout as an archive instead of the out directory")
+
+def init_trim(parser):
+  parser.add_argument("--trim", required=False, action="store_true", default=False, help="only include the behaviors and criteria used by the properties in the rule format library")
+  parser.add_argument("--allow", required=False, nargs="+", metavar="NAME", help="behaviors and criteria to include in a trimmed library anyway, as NAME or behaviors.NAME/criteria.NAME")
+
+def init_layout(parser):
+  from .jsonnet.papi.converter import LIBRARY_LAYOUTS
+  parser.add_argument("--layout", required=False, choices=LIBRARY_LAYOUTS, default="single", help="write the rule format library as a single file, or split with one file per behavior and criterion")
+
+def init_incremental(parser):
+  parser.add_argument("--full", required=False, action="store_true", default=False, help="convert all rules, even those unchanged since the previous run")
+
+def init_dedup(parser):
+  parser.add_argument("--dedup", required=False, action="store_true", default=False, help="convert rule subtrees copied under several parents once, to shared files")
+
+def init_profile(parser):
+  parser.add_argument("--profile", required=False, action="store_true", default=False,
+    help="print the time spent in each phase, request latencies and other counters to stderr")
+  parser.add_argument("--profile-dump", dest="profileDump", required=False, metavar="FILE",
+    help="profile the command with cProfile, and write the stats to FILE for pstats or snakeviz")
+  parser.add_argument("--metrics-json", dest="metricsJson", required=False, metavar="FILE",
+    help="write the metrics collected by --profile to FILE as json")
+
+def init_cache(parser):
+  env_cache_dir = os.getenv("AKAMAI_JSONNET_CACHE_DIR")
+  parser.add_argument("--cache-dir", dest="cacheDir", default=env_cache_dir,
+    help="where to cache downloaded rule formats; default to ~/.cache/akamai-jsonnet")
+  parser.add_argument("--cache-size", dest="cacheSize", type=int, default=None,
+    help="maximum size of the cache in MB; default to 512")
+  parser.add_argument("--no-cache", dest="noCache", action='store_true', default=False,
+    help="always download from the API")
+
+def init_transport(parser):
+  group = parser.add_mutually_exclusive_group()
+  group.add_argument("--record", required=False, metavar="DIR",
+    help="save the API responses to DIR, to be replayed with --replay; implies --no-cache")
+  group.add_argument("--replay", required=False, metavar="DIR",
+    help="answer API requests from the responses recorded to DIR, without any network access")
+
+def configure_transport(args):
+  from .edgegrid import Session
+  from .transport import Transport
+
+  if args.record is not None:
+    # responses served from the cache wouldn't be recorded
+    args.noCache = True
+  Session.transport = Transport(args.record, args.replay)
+
+def init_rate_limit(parser):
+  from .ratelimit import DEFAULT_RETRIES
+  parser.add_argument("--rate-limit", dest="rateLimit", type=float, default=None, metavar="RPS",
+    help="maximum number of API requests per second, across all workers")
+  parser.add_argument("--max-concurrency", dest="maxConcurrency", type=int, default=None, metavar="N",
+    help="maximum number of API requests in flight, across all workers")
+  parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+    help="how many times to retry throttled or failed API requests, with backoff; default to %(default)s")
+
+def configure_rate_limit(args):
+  from .edgegrid import Session
+  from .ratelimit import RateLimiter
+
+  Session.limiter = RateLimiter(args.rateLimit, concurrency=args.maxConcurrency, retries=args.retries)
+
+def configure_formatter(name):
+  from .jsonnet.formatter import get_formatter
+  from .jsonnet.writer import JsonnetWriter
+
+  JsonnetWriter.formatter = get_formatter(name)
+
+def init_render(parent):
+  from .commands.render import render, RENDER_ENGINES
+
+  parser = parent.add_parser("render", help="render all the environments of a bootstrapped directory, in parallel")
+  init_defaults(parser)
+  parser.add_argument("directory", nargs="?", default=".", help="directory created by papi bootstrap or bootstrap-many; default to the current directory")
+  parser.add_argument("--out", required=False, help="output directory; default to {directory}/dist")
+  parser.add_argument("--jobs", type=int, required=False, default=os.cpu_count(), help="number of environments rendered in parallel")
+  parser.add_argument("--engine", required=False, choices=RENDER_ENGINES, default="auto",
+    help="render with the jsonnet python package in worker processes, or with jsonnet processes; auto prefers python")
+  parser.add_argument("--force", required=False, action="store_true", default=False, help="render all environments, even those whose inputs haven't changed since the previous render")
+  parser.set_defaults(func=lambda args: render(**vars(args)))
 
 def init_papi(parent):
   parser = parent.add_parser("papi", description="Akamai Jsonnet utilities for PAPI.")
@@ -44,9 +173,11 @@ def init_papi(parent):
   subparsers = parser.add_subparsers(title="Commands")
   init_papi_products(subparsers)
   init_papi_bootstrap(subparsers)
+  init_papi_bootstrap_many(subparsers)
   init_papi_ruleformat(subparsers)
   init_papi_ruletree(subparsers)
   init_papi_hostnames(subparsers)
+  init_papi_sync_catalog(subparsers)
 
 def init_papi_products(parent):
   from .commands.papi import products
@@ -63,6 +194,12 @@ def init_papi_ruleformat(parent):
   init_defaults(parser)
   parser.add_argument("--productId", required=True)
   parser.add_argument("--ruleFormat", required=False, default="latest")
+  init_trim(parser)
+  parser.add_argument("--propertyNames", required=False, nargs="+", help="properties whose atoms to keep with --trim")
+  parser.add_argument("--propertyVersion", required=False, default="latest")
+  parser.add_argument("--files", required=False, nargs="+", help="files containing json rule trees whose atoms to keep with --trim")
+  init_layout(parser)
+  parser.add_argument("--out", required=False, help="library directory to write papi/{productId}/{ruleFormat}.libsonnet to, instead of stdout")
   parser.set_defaults(func=lambda args: ruleformat(**vars(args)))
 
 def init_papi_ruletree(parent):
@@ -76,6 +213,9 @@ def init_papi_ruletree(parent):
   parser.add_argument("--propertyVersion", required=False, default="latest")
   parser.add_argument("--file", required=False, help="file containing a json rule tree")
   parser.add_argument("--out", required=False, help="output directory for the template entrypoint; default to {propertyName}")
+  init_archive(parser)
+  init_incremental(parser)
+  init_dedup(parser)
   parser.set_defaults(func=lambda args: ruletree(**vars(args)))
 
 def init_papi_hostnames(parent):
@@ -87,6 +227,13 @@ def init_papi_hostnames(parent):
   parser.add_argument("--propertyVersion", required=False, default="latest")
   parser.set_defaults(func=lambda args: hostnames(**vars(args)))
 
+def init_papi_sync_catalog(parent):
+  from .commands.papi import sync_catalog
+
+  parser = parent.add_parser("sync-catalog", help="index all the properties of the account in the cache, so that property names are resolved without searching the API")
+  init_defaults(parser)
+  parser.set_defaults(func=lambda args: sync_catalog(**vars(args)))
+
 def init_papi_bootstrap(parent: argparse.ArgumentParser):
   from .commands.papi import bootstrap
 
@@ -100,4 +247,34 @@ def init_papi_bootstrap(parent: argparse.ArgumentParser):
   deployers = parser.add_mutually_exclusive_group()
   deployers.add_argument("--bossman", required=False, action='store_true', default=False, help="create Bossman configuration?")
   deployers.add_argument("--terraform", required=False, action='store_true', default=False, help="create Terraform configuration?")
+  init_archive(parser)
+  init_incremental(parser)
+  init_dedup(parser)
+  init_trim(parser)
+  init_layout(parser)
   parser.set_defaults(func=lambda args: bootstrap(**vars(args)))
+
+def init_papi_bootstrap_many(parent: argparse.ArgumentParser):
+  from .commands.papi import bootstrap_many
+
+  parser = parent.add_parser("bootstrap-many", help="bootstrap many properties as templates in a single multi-env setup")
+  init_defaults(parser)
+  parser.add_argument("--productId", required=True, help="product of the properties, unless given in the manifest")
+  parser.add_argument("--ruleFormat", required=False, default="latest")
+  parser.add_argument("--propertyVersion", required=False, default="latest")
+  properties = parser.add_mutually_exclusive_group(required=True)
+  properties.add_argument("--propertyNames", nargs="+", help="names of the properties to bootstrap")
+  properties.add_argument("--pattern", help="regular expression matching the names of the properties to bootstrap")
+  properties.add_argument("--manifest", help="json file listing property names, or objects with a propertyName and optionally propertyVersion, productId and ruleFormat")
+  parser.add_argument("--out", required=True, help="output directory")
+  parser.add_argument("--jobs", type=int, required=False, default=os.cpu_count(), help="number of properties converted in parallel")
+  deployers = parser.add_mutually_exclusive_group()
+  deployers.add_argument("--bossman", required=False, action='store_true', default=False, help="create Bossman configuration?")
+  deployers.add_argument("--terraform", required=False, action='store_true', default=False, help="create Terraform configuration?")
+  init_archive(parser)
+  init_incremental(parser)
+  init_dedup(parser)
+  parser.add_argument("--common", required=False, action="store_true", default=False, help="move the rules, criteria and behaviors found in several properties to lib/common")
+  init_trim(parser)
+  init_layout(parser)
+  parser.set_defaults(func=lambda args: bootstrap_many(**vars(args)))
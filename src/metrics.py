@@ -0,0 +1,130 @@
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+class Metrics:
+  """
+  Wall and CPU time spent in each phase of a command, along with counters and
+  latencies, collected with --profile or --metrics-json.
+
+  Phases nest, e.g. "http" within "fetch", and their times are inclusive. CPU
+  time is measured per thread, so phases running in thread pools add up to
+  more than the wall time of the command. Worker processes collect their own
+  metrics, which the parent adds with merge().
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self, enabled=False):
+    self.enabled = enabled
+    self.started = time.perf_counter()
+    # name -> [count, wall, cpu]
+    self.phases = dict()
+    self.counters = dict()
+    # name -> list of seconds
+    self.latencies = dict()
+
+  @contextmanager
+  def phase(self, name):
+    if not self.enabled:
+      yield
+      return
+    (wall, cpu) = (time.perf_counter(), time.thread_time())
+    try:
+      yield
+    finally:
+      (wall, cpu) = (time.perf_counter() - wall, time.thread_time() - cpu)
+      with self.lock:
+        phase = self.phases.setdefault(name, [0, 0.0, 0.0])
+        phase[0] += 1
+        phase[1] += wall
+        phase[2] += cpu
+
+  def count(self, name, value=1):
+    if self.enabled:
+      with self.lock:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+  def observe(self, name, seconds):
+    if self.enabled:
+      with self.lock:
+        self.latencies.setdefault(name, []).append(seconds)
+
+  def collect(self):
+    """
+    Return the metrics collected so far, to be merged into another process's,
+    and start over.
+    """
+    if not self.enabled:
+      return None
+    with self.lock:
+      collected = (self.phases, self.counters, self.latencies)
+      (self.phases, self.counters, self.latencies) = (dict(), dict(), dict())
+    return collected
+
+  def merge_result(self, result):
+    """
+    Merge the metrics returned by profiled() and return the result of the function.
+    """
+    (result, collected) = result
+    self.merge(collected)
+    return result
+
+  def merge(self, collected):
+    if collected is None or not self.enabled:
+      return
+    (phases, counters, latencies) = collected
+    with self.lock:
+      for (name, (count, wall, cpu)) in phases.items():
+        phase = self.phases.setdefault(name, [0, 0.0, 0.0])
+        phase[0] += count
+        phase[1] += wall
+        phase[2] += cpu
+      for (name, value) in counters.items():
+        self.counters[name] = self.counters.get(name, 0) + value
+      for (name, samples) in latencies.items():
+        self.latencies.setdefault(name, []).extend(samples)
+
+  def to_dict(self):
+    with self.lock:
+      return dict(
+        wall=time.perf_counter() - self.started,
+        phases=dict((name, dict(count=count, wall=wall, cpu=cpu)) for (name, (count, wall, cpu)) in sorted(self.phases.items())),
+        counters=dict(sorted(self.counters.items())),
+        latencies=dict((name, summarize(samples)) for (name, samples) in sorted(self.latencies.items())),
+      )
+
+  def report(self, file=sys.stderr):
+    metrics = self.to_dict()
+    print("### Profile: {:.3f}s".format(metrics.get("wall")), file=file)
+    for (name, phase) in metrics.get("phases").items():
+      print("    {:<24} {count:>8} calls {wall:>10.3f}s wall {cpu:>10.3f}s cpu".format(name, **phase), file=file)
+    for (name, value) in metrics.get("counters").items():
+      print("    {:<24} {:>8}".format(name, value), file=file)
+    for (name, latency) in metrics.get("latencies").items():
+      print("    {:<24} {count:>8} samples {p50:>8.3f}s p50 {p90:>8.3f}s p90 {max:>8.3f}s max".format(name, **latency), file=file)
+
+  def dump(self, path):
+    with open(path, "w") as fd:
+      json.dump(self.to_dict(), fd, indent=2)
+      fd.write("\n")
+
+def profiled(func, *args, **kwargs):
+  """
+  Call func in a worker process, and return its result along with the metrics
+  it collected, see Metrics.merge_result().
+  """
+  result = func(*args, **kwargs)
+  return (result, metrics.collect())
+
+def summarize(samples):
+  ordered = sorted(samples)
+  def percentile(p):
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+  return dict(count=len(ordered), total=sum(ordered), p50=percentile(0.5), p90=percentile(0.9), max=ordered[-1])
+
+metrics = Metrics()
@@ -0,0 +1,174 @@
+import io
+import os
+import sys
+import pathlib
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics
+
+ARCHIVE_FORMATS = ("tar", "zip")
+
+class OutputFile:
+  __slots__ = ("data", "mode", "jsonnet")
+
+  def __init__(self, data, mode=None, jsonnet=False):
+    self.data = data
+    self.mode = mode
+    # jsonnet files are formatted in bulk before being written
+    self.jsonnet = jsonnet
+
+  def encode(self):
+    return self.data.encode("utf-8") if isinstance(self.data, str) else self.data
+
+class OutputTree:
+  """
+  In-memory map of the files produced by a command, relative to root.
+
+  Nothing touches the filesystem until flush(), which formats all jsonnet files
+  in a single pass and writes the files that changed using a few threads.
+  Alternatively, archive() streams the files as a tar or zip archive.
+
+  With a spillSize, files are flushed early whenever their total size reaches
+  it, to bound memory usage; archive() is not available then.
+  """
+
+  def __init__(self, root, formatter=None, spillSize=None):
+    self.root = root
+    self.formatter = formatter
+    self.files = dict()
+    self.removed = set()
+    self.spillSize = spillSize
+    self.pendingSize = 0
+    # paths of the files flushed early
+    self.spilled = set()
+
+  def write(self, path, data, mode=None):
+    self.add(path, OutputFile(data, mode))
+
+  def dump(self, path, writer, mode=None):
+    """
+    Add the contents of a JsonnetWriter, to be formatted later.
+    """
+    self.add(path, OutputFile(writer.getsource(), mode, jsonnet=True))
+
+  def add(self, path, file):
+    self.files[os.path.normpath(path)] = file
+    if self.spillSize is not None:
+      self.pendingSize += len(file.data)
+      if self.pendingSize >= self.spillSize:
+        self.spill()
+
+  def spill(self):
+    """
+    Flush the files added so far and release them, except for removals.
+    """
+    self.write_files()
+    self.spilled.update(self.files.keys())
+    self.files = dict()
+    self.pendingSize = 0
+
+  def remove(self, path):
+    """
+    Delete a previously generated file on flush, unless it is written again.
+    """
+    self.removed.add(os.path.normpath(path))
+
+  def merge(self, files, prefix=""):
+    for (path, file) in files.items():
+      self.files[os.path.normpath(os.path.join(prefix, path))] = file
+
+  def format(self):
+    from .jsonnet.writer import JsonnetWriter
+
+    formatter = self.formatter if self.formatter is not None else JsonnetWriter.formatter
+    pending = [file for file in self.files.values() if file.jsonnet]
+    if not len(pending):
+      return
+    metrics.count("format.calls")
+    metrics.count("format.files", len(pending))
+    with metrics.phase("format"):
+      for (file, data) in zip(pending, formatter.format_many([file.data for file in pending])):
+        file.data = data
+        file.jsonnet = False
+
+  def flush(self, maxWorkers=8):
+    """
+    Write all files under root, skipping those whose contents haven't changed.
+    Return the number of files written.
+    """
+    written = self.write_files(maxWorkers)
+    for path in sorted(self.removed - set(self.files.keys()) - self.spilled):
+      self._remove_file(path)
+    return written
+
+  def write_files(self, maxWorkers=8):
+    self.format()
+    with metrics.phase("write"), ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+      written = list(executor.map(lambda item: self._write_file(*item), self.files.items()))
+    metrics.count("files.written", sum(written))
+    metrics.count("files.unchanged", len(written) - sum(written))
+    for (path, changed) in zip(self.files.keys(), written):
+      if changed:
+        print(os.path.realpath(os.path.join(self.root, path)), file=sys.stderr)
+    return sum(written)
+
+  def _remove_file(self, path):
+    path = os.path.join(self.root, path)
+    try:
+      os.unlink(path)
+    except OSError:
+      return
+    print("*** removed", os.path.realpath(path), file=sys.stderr)
+    # clean up the directories left empty, up to root
+    dirname = os.path.dirname(path)
+    while os.path.realpath(dirname) != os.path.realpath(self.root):
+      try:
+        os.rmdir(dirname)
+      except OSError:
+        break
+      dirname = os.path.dirname(dirname)
+
+  def _write_file(self, path, file):
+    path = os.path.join(self.root, path)
+    data = file.encode()
+    changed = True
+    try:
+      with open(path, "rb") as fd:
+        changed = fd.read() != data
+    except OSError:
+      os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if changed:
+      with open(path, "wb") as fd:
+        fd.write(data)
+      metrics.count("bytes.written", len(data))
+    if file.mode is not None:
+      os.chmod(path, mode=file.mode)
+    return changed
+
+  def archive(self, fileobj, format="tar"):
+    """
+    Write all files to fileobj as a tar or zip archive.
+    """
+    if len(self.spilled):
+      raise RuntimeError("files were already flushed to {}".format(self.root))
+    self.format()
+    now = time.time()
+    items = sorted((pathlib.PurePath(path).as_posix(), file) for (path, file) in self.files.items())
+    if format == "zip":
+      with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+        for (name, file) in items:
+          info = zipfile.ZipInfo(name, time.localtime(now)[:6])
+          info.external_attr = (file.mode if file.mode is not None else 0o644) << 16
+          info.compress_type = zipfile.ZIP_DEFLATED
+          archive.writestr(info, file.encode())
+    else:
+      with tarfile.open(fileobj=fileobj, mode="w|") as archive:
+        for (name, file) in items:
+          data = file.encode()
+          info = tarfile.TarInfo(name)
+          info.size = len(data)
+          info.mtime = now
+          info.mode = file.mode if file.mode is not None else 0o644
+          archive.addfile(info, io.BytesIO(data))
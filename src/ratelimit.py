@@ -0,0 +1,136 @@
+import time
+import random
+import datetime
+import multiprocessing
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+DEFAULT_RETRIES = 5
+# bounds of the exponential backoff, in seconds
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+# longest wait accepted from Retry-After or the rate limit headers
+MAX_RETRY_DELAY = 300.0
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+class RateLimiter:
+  """
+  Limits on the requests of all the sessions of a command, in all its threads
+  and worker processes: a token bucket of rate requests per second, at most
+  concurrency requests in flight, and pauses of all requests once the API says
+  its rate limit is reached.
+
+  Its state lives in shared memory, so it must be created by the main process
+  and passed to the workers when they start, like Session.transport.
+  """
+
+  def __init__(self, rate=None, burst=None, concurrency=None, retries=DEFAULT_RETRIES):
+    self.rate = rate
+    self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+    self.retries = retries
+    # tokens left, time of the last refill and end of the current pause, on
+    # the time.monotonic() clock which all processes share
+    self.state = multiprocessing.Array("d", [self.burst, time.monotonic(), 0.0])
+    self.slots = multiprocessing.BoundedSemaphore(concurrency) if concurrency else None
+
+  @contextmanager
+  def slot(self):
+    """
+    Wait until a request may be sent, and hold a slot while it is in flight.
+    """
+    if self.slots is not None:
+      self.slots.acquire()
+    try:
+      self.acquire()
+      yield
+    finally:
+      if self.slots is not None:
+        self.slots.release()
+
+  def acquire(self):
+    while True:
+      with self.state.get_lock():
+        now = time.monotonic()
+        (tokens, updated, pausedUntil) = self.state[:]
+        wait = pausedUntil - now
+        if wait <= 0:
+          if self.rate is None:
+            return
+          tokens = min(self.burst, tokens + (now - updated) * self.rate)
+          if tokens >= 1:
+            self.state[:] = [tokens - 1, now, pausedUntil]
+            return
+          self.state[:] = [tokens, now, pausedUntil]
+          wait = (1 - tokens) / self.rate
+      time.sleep(wait)
+
+  def pause(self, seconds):
+    """
+    Hold all requests for seconds.
+    """
+    with self.state.get_lock():
+      self.state[2] = max(self.state[2], time.monotonic() + seconds)
+
+  def observe(self, response):
+    """
+    Pause all requests until the API's rate limit resets, once it is reached.
+    """
+    if response.headers.get("Akamai-RateLimit-Remaining") == "0":
+      delay = rate_limit_delay(response)
+      if delay is not None:
+        self.pause(delay)
+
+def retryable(method, response):
+  if response.status_code not in RETRY_STATUSES:
+    return False
+  # a throttled request wasn't processed at all
+  return response.status_code == 429 or method.upper() in IDEMPOTENT_METHODS
+
+def retry_delay(response, attempt):
+  """
+  Return how long to wait before retrying a request: as long as the API asks,
+  or an exponential backoff with full jitter.
+  """
+  delay = retry_after(response)
+  if delay is None and response is not None and response.status_code == 429:
+    delay = rate_limit_delay(response)
+  if delay is not None:
+    return min(delay, MAX_RETRY_DELAY)
+  return backoff(attempt)
+
+def backoff(attempt):
+  return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def retry_after(response):
+  """
+  Return the delay of the Retry-After header, given in seconds or as a date.
+  """
+  value = response.headers.get("Retry-After") if response is not None else None
+  if not value:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  try:
+    return max(0.0, (parsedate_to_datetime(value) - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+  except (TypeError, ValueError):
+    return None
+
+def rate_limit_delay(response):
+  """
+  Return the delay until the time of Akamai-RateLimit-Next, when the API
+  accepts requests again, e.g. 2023-05-17T09:40:07.230Z.
+  """
+  value = response.headers.get("Akamai-RateLimit-Next")
+  if not value:
+    return None
+  try:
+    resets = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+  except ValueError:
+    return None
+  if resets.tzinfo is None:
+    resets = resets.replace(tzinfo=datetime.timezone.utc)
+  return max(0.0, (resets - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
@@ -0,0 +1,170 @@
+import os
+import gzip
+import json
+import base64
+import hashlib
+import tempfile
+import datetime
+from urllib import parse
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from .metrics import metrics
+
+# headers describing the transfer rather than the response
+HOP_HEADERS = ("connection", "content-encoding", "content-length", "keep-alive", "transfer-encoding")
+
+class TransportError(RuntimeError):
+  pass
+
+def request_key(request):
+  """
+  Return the digest identifying a prepared request in a recording.
+
+  The host and the signature are left out, so that recordings can be replayed
+  with any credentials, and so are conditional headers, see ReplayAdapter.
+  """
+  url = parse.urlsplit(request.url)
+  body = request.body
+  if isinstance(body, bytes):
+    body = body.decode("utf-8", "replace")
+  key = [
+    request.method,
+    url.path,
+    sorted(parse.parse_qsl(url.query, keep_blank_values=True)),
+    request.headers.get("Accept"),
+    body,
+  ]
+  return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+class Recording:
+  """
+  Directory of API responses, one gzipped json file per distinct request.
+
+  Files are named after request_key() and written atomically, so several
+  processes can record to the same directory; a request made again replaces
+  the previous response.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def _path(self, key):
+    return os.path.join(self.directory, key[:2], key + ".json.gz")
+
+  def save(self, request, response):
+    url = parse.urlsplit(request.url)
+    entry = dict(
+      method=request.method,
+      url=parse.urlunsplit(("", "", url.path, url.query, "")),
+      status=response.status_code,
+      reason=response.reason,
+      headers=dict((k, v) for (k, v) in response.headers.items() if k.lower() not in HOP_HEADERS),
+    )
+    try:
+      entry["body"] = response.content.decode("utf-8")
+    except UnicodeDecodeError:
+      entry["body64"] = base64.b64encode(response.content).decode("ascii")
+    path = self._path(request_key(request))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+      with os.fdopen(fd, "wb") as out:
+        out.write(gzip.compress(json.dumps(entry).encode("utf-8")))
+      os.replace(tmp, path)
+    except:
+      os.unlink(tmp)
+      raise
+
+  def load(self, request):
+    """
+    Return the entry recorded for request, or None.
+    """
+    try:
+      with open(self._path(request_key(request)), "rb") as fd:
+        return json.loads(gzip.decompress(fd.read()).decode("utf-8"))
+    except FileNotFoundError:
+      return None
+
+class RecordingAdapter(HTTPAdapter):
+  """
+  Send requests to the API, and save their responses to a Recording.
+  """
+
+  def __init__(self, recording, **kwargs):
+    super(RecordingAdapter, self).__init__(**kwargs)
+    self.recording = recording
+
+  def send(self, request, **kwargs):
+    response = super(RecordingAdapter, self).send(request, **kwargs)
+    # a 304 has no body to replay; ReplayAdapter derives it from the full response
+    if response.status_code != 304:
+      self.recording.save(request, response)
+      metrics.count("http.recorded")
+    return response
+
+class ReplayAdapter(BaseAdapter):
+  """
+  Answer requests from a Recording, without any network access.
+  """
+
+  def __init__(self, recording):
+    super(ReplayAdapter, self).__init__()
+    self.recording = recording
+
+  def send(self, request, **kwargs):
+    entry = self.recording.load(request)
+    if entry is None:
+      raise TransportError("no recorded response for {} {} in {}".format(request.method, request.url, self.recording.directory))
+    metrics.count("http.replayed")
+    response = Response()
+    response.request = request
+    response.url = request.url
+    response.status_code = entry.get("status")
+    response.reason = entry.get("reason")
+    response.headers = CaseInsensitiveDict(entry.get("headers"))
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.elapsed = datetime.timedelta(0)
+    if "body64" in entry:
+      response._content = base64.b64decode(entry.get("body64"))
+    else:
+      response._content = entry.get("body").encode("utf-8")
+    etag = response.headers.get("ETag")
+    if etag is not None and request.headers.get("If-None-Match") == etag:
+      (response.status_code, response.reason, response._content) = (304, "Not Modified", b"")
+    return response
+
+  def close(self):
+    pass
+
+class Transport:
+  """
+  Where the sessions of a command send their requests: to the API while
+  recording the responses to a directory, or to a previous recording.
+
+  It is passed to worker processes, which then record to, or replay from, the
+  same directory.
+  """
+
+  def __init__(self, record=None, replay=None):
+    if record is not None and replay is not None:
+      raise TransportError("can't both record to and replay from a directory")
+    self.record = record
+    self.replay = replay
+
+  @property
+  def offline(self):
+    return self.replay is not None
+
+  def adapter(self, poolSize):
+    """
+    Return the requests adapter to mount on a session.
+    """
+    if self.replay is not None:
+      if not os.path.isdir(self.replay):
+        raise TransportError("no recording in {}".format(self.replay))
+      return ReplayAdapter(Recording(self.replay))
+    if self.record is not None:
+      return RecordingAdapter(Recording(self.record), pool_connections=poolSize, pool_maxsize=poolSize)
+    return HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
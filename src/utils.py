@@ -1,6 +1,6 @@
-import contextlib
-import os
 import re
+import sys
+from concurrent.futures import wait, FIRST_EXCEPTION
 
 def get_valid_filename(filename):
   """
@@ -16,15 +16,25 @@ def get_valid_filename(filename):
   s = filename.strip().replace(' ', '_')
   return re.sub(r'(?u)[^-\w.]', '', s)
 
-@contextlib.contextmanager
-def pushd(new_dir):
-    previous_dir = os.getcwd()
-    os.makedirs(new_dir, exist_ok=True)
-    os.chdir(new_dir)
-    try:
-        yield
-    finally:
-        os.chdir(previous_dir)
+def gather(*futures):
+  """
+  Wait for all futures and return their results; as soon as one fails, cancel
+  the ones that haven't started yet and raise its exception.
+  """
+  done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+  for future in futures:
+    if future in done and future.exception() is not None:
+      for other in pending:
+        other.cancel()
+      raise future.exception()
+  return [future.result() for future in futures]
+
+def progress(message):
+  """
+  Print a progress message to stderr with a single write, so that the messages
+  of concurrent threads don't interleave.
+  """
+  sys.stderr.write(message + "\n")
 
 GITIGNORE_TERRAFORM = """
 # Local .terraform directories
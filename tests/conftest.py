@@ -0,0 +1,98 @@
+import os
+import sys
+import glob
+import copy
+import json
+import pytest
+from os.path import dirname, join, abspath
+sys.path.append(abspath(join(dirname(__file__), "..")))
+sys.path.append(abspath(join(dirname(__file__), "..", "bench")))
+
+from src.jsonnet.writer import JsonnetWriter
+from src.jsonnet.formatter import BuiltinFormatter
+from src.edgegrid import Session
+from src.commands import papi
+from synthetic import synthetic_schema, synthetic_rule_tree, synthetic_hostnames
+from stub import StubPapi
+
+PRODUCT = "prd_Synthetic"
+RULE_FORMAT = "v2023-01-05"
+# properties served by the fleet fixture
+NAMES = ["alpha", "bravo", "charlie"]
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+  """
+  Run each test with the default formatter, transport and rate limiter.
+  """
+  monkeypatch.setattr(JsonnetWriter, "formatter", BuiltinFormatter())
+  monkeypatch.setattr(Session, "transport", Session.transport)
+  monkeypatch.setattr(Session, "limiter", Session.limiter)
+
+@pytest.fixture(scope="session")
+def schema():
+  return synthetic_schema(behaviors=30, criteria=8, options=4)
+
+@pytest.fixture(scope="session")
+def ruleTree(schema):
+  return synthetic_rule_tree(schema, rules=60, depth=3, fanout=4, advancedOverride=200)
+
+@pytest.fixture(scope="session")
+def hostnames():
+  return synthetic_hostnames(3)
+
+@pytest.fixture
+def stub(schema, ruleTree, hostnames, tmp_path):
+  """
+  A stub PAPI server, and the edgerc to reach it.
+  """
+  stub = StubPapi(schema, ruleTree, hostnames).start()
+  stub.edgerc = stub.write_edgerc(str(tmp_path / "edgerc"))
+  yield stub
+  stub.stop()
+
+@pytest.fixture
+def fleet(schema, hostnames, tmp_path):
+  """
+  A stub PAPI server with properties sharing some of their rules.
+  """
+  ruleTrees = dict((name, synthetic_rule_tree(schema, rules=20, depth=2, fanout=4, seed=seed)) for (seed, name) in enumerate(NAMES))
+  (alpha, bravo, charlie) = (ruleTrees.get(name).get("rules") for name in NAMES)
+  bravo["children"][0] = copy.deepcopy(alpha["children"][0])
+  charlie["children"][1] = copy.deepcopy(alpha["children"][0])
+  charlie["children"][2] = copy.deepcopy(bravo["children"][2])
+  charlie["behaviors"] = copy.deepcopy(bravo["behaviors"])
+  stub = StubPapi(schema, None, hostnames, ruleTrees=ruleTrees).start()
+  stub.edgerc = stub.write_edgerc(str(tmp_path / "edgerc"))
+  yield stub
+  stub.stop()
+
+def bootstrap_many(stub, out, names=NAMES, **kwargs):
+  papi.bootstrap_many(stub.edgerc, "default", PRODUCT, str(out), propertyNames=names, ruleFormat=RULE_FORMAT, jobs=2, noCache=True, **kwargs)
+
+def evaluate(directory):
+  """
+  Render every environment of a bootstrap or bootstrap-many directory with the
+  jsonnet python package, and return the rendered files by path.
+  """
+  _jsonnet = pytest.importorskip("_jsonnet")
+  results = dict()
+  for env in sorted(glob.glob(join(directory, "envs", "*.jsonnet")) + glob.glob(join(directory, "properties", "*", "envs", "*.jsonnet"))):
+    with open(env, "r") as fd:
+      code = fd.read()
+    template = join(dirname(dirname(env)), "template.jsonnet")
+    rendered = _jsonnet.evaluate_file(template, jpathdir=[join(directory, "lib")], ext_codes=dict(env=code))
+    results.update(json.loads(rendered))
+  return results
+
+def read_tree(directory):
+  """
+  Return the contents of the files under directory by relative path.
+  """
+  files = dict()
+  for (dirpath, _, filenames) in os.walk(directory):
+    for filename in filenames:
+      path = join(dirpath, filename)
+      with open(path, "rb") as fd:
+        files[os.path.relpath(path, directory)] = fd.read()
+  return files
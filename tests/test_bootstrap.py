@@ -0,0 +1,42 @@
+import time
+import pytest
+from src.edgegrid import Session
+from src.commands import papi
+from src.jsonnet.papi.ruleformat import RuleFormat, RuleFormatError
+from src.jsonnet.papi.property import Property, PropertyError
+from conftest import PRODUCT, RULE_FORMAT
+
+def test_fetch_bootstrap_inputs(stub):
+  session = Session(stub.edgerc, "default")
+  (ruleFormat, property, edgeHostnames) = papi.fetch_bootstrap_inputs(session, None, PRODUCT, RULE_FORMAT, "synthetic", "latest")
+  assert (ruleFormat.ruleFormat, property.id, len(property.hostnames), len(edgeHostnames)) == (RULE_FORMAT, "prp_1", 3, 3)
+
+def test_schema_failure(stub, monkeypatch):
+  def get(*args):
+    raise RuleFormatError("no such rule format")
+  def find(*args):
+    time.sleep(2)
+    return dict(propertyId="prp_1", propertyVersion=1)
+  monkeypatch.setattr(RuleFormat, "get", staticmethod(get))
+  monkeypatch.setattr(Property, "find", staticmethod(find))
+  session = Session(stub.edgerc, "default")
+  start = time.perf_counter()
+  with pytest.raises(RuleFormatError):
+    papi.fetch_bootstrap_inputs(session, None, PRODUCT, RULE_FORMAT, "synthetic", "latest")
+  # without waiting for the property lookup
+  assert time.perf_counter() - start < 1
+
+def test_lookup_failure(stub, monkeypatch):
+  def get(*args):
+    time.sleep(2)
+    return RuleFormat(dict(), PRODUCT, RULE_FORMAT)
+  def find(*args):
+    raise PropertyError("not found: synthetic")
+  monkeypatch.setattr(RuleFormat, "get", staticmethod(get))
+  monkeypatch.setattr(Property, "find", staticmethod(find))
+  session = Session(stub.edgerc, "default")
+  start = time.perf_counter()
+  with pytest.raises(PropertyError):
+    papi.fetch_bootstrap_inputs(session, None, PRODUCT, RULE_FORMAT, "synthetic", "latest")
+  # without waiting for the schema
+  assert time.perf_counter() - start < 1
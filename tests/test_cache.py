@@ -0,0 +1,68 @@
+import os
+import json
+from src.cache import Cache
+from src.edgegrid import Session
+from src.jsonnet.papi.ruleformat import RuleFormat
+from conftest import PRODUCT, RULE_FORMAT
+
+def objects(cache):
+  return sorted(path for (_, _, path) in cache._objects())
+
+def test_put_load(tmp_path):
+  cache = Cache(str(tmp_path))
+  entry = cache.put("a", b"payload", etag="x")
+  assert (entry.get("size"), entry.get("etag")) == (7, "x")
+  assert cache.load("a") == b"payload"
+  assert cache.load("b") is None
+  # payloads are stored once
+  cache.put("b", b"payload")
+  assert len(objects(cache)) == 1
+  assert cache.size() == 7
+
+def test_evict(tmp_path):
+  cache = Cache(str(tmp_path), maxSize=30)
+  for (idx, key) in enumerate(("a", "b", "c")):
+    cache.put(key, key.encode() * 10)
+    os.utime(cache._object_path(cache.get(key).get("digest")), (idx, idx))
+  assert len(objects(cache)) == 3
+  # a is used again, so b is the least recently used
+  os.utime(cache._object_path(cache.get("a").get("digest")), (5, 5))
+  cache.put("d", b"d" * 10)
+  assert [cache.load(key) is not None for key in ("a", "b", "c", "d")] == [True, False, True, True]
+  assert cache.size() == 30
+  # refs to evicted payloads are removed
+  assert sum(len(filenames) for (_, _, filenames) in os.walk(os.path.join(tmp_path, "refs"))) == 3
+
+def test_size_is_tracked(tmp_path, monkeypatch):
+  cache = Cache(str(tmp_path))
+  cache.put("a", b"a" * 10)
+  def walk(self):
+    raise AssertionError("objects walked under the size limit")
+  monkeypatch.setattr(Cache, "_objects", walk)
+  cache.put("b", b"b" * 10)
+  assert cache.size() == 20
+
+def test_size_without_index(tmp_path):
+  cache = Cache(str(tmp_path))
+  cache.put("a", b"a" * 10)
+  os.unlink(os.path.join(tmp_path, "index.json"))
+  cache.put("b", b"b" * 10)
+  with open(os.path.join(tmp_path, "index.json"), "r") as fd:
+    assert json.load(fd) == dict(size=20)
+
+def test_ruleformat_evicted(stub, tmp_path, monkeypatch):
+  session = Session(stub.edgerc, "default")
+  cache = Cache(str(tmp_path))
+  RuleFormat.get(session, PRODUCT, RULE_FORMAT, cache)
+  requests = stub.requests
+  assert RuleFormat.get(session, PRODUCT, RULE_FORMAT, cache).catalog is not None
+  assert stub.requests == requests
+  # another process evicts the schema between get() and read()
+  read = Cache.read
+  def evicted(self, entry):
+    os.unlink(self._object_path(entry.get("digest")))
+    return read(self, entry)
+  monkeypatch.setattr(Cache, "read", evicted)
+  ruleFormat = RuleFormat.get(session, PRODUCT, RULE_FORMAT, cache)
+  assert stub.requests == requests + 1
+  assert len(ruleFormat.catalog.get("behaviors"))
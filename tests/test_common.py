@@ -0,0 +1,62 @@
+import os
+import tempfile
+import pytest
+from src.commands import papi
+from src.jsonnet.papi.property import Property, PropertyError
+from conftest import NAMES, evaluate, read_tree, bootstrap_many
+
+def common_files(out):
+  return sorted(path for path in read_tree(str(out)) if path.startswith(os.path.join("lib", "common")))
+
+def test_same_json(fleet, tmp_path):
+  bootstrap_many(fleet, tmp_path / "plain")
+  bootstrap_many(fleet, tmp_path / "common", common=True)
+  assert len(common_files(tmp_path / "common"))
+  assert evaluate(str(tmp_path / "common")) == evaluate(str(tmp_path / "plain"))
+
+def test_subset_keeps_common_files(fleet, tmp_path):
+  bootstrap_many(fleet, tmp_path / "plain")
+  bootstrap_many(fleet, tmp_path / "common", common=True)
+  files = common_files(tmp_path / "common")
+  # alpha has nothing in common with itself, but the others still import its files
+  bootstrap_many(fleet, tmp_path / "common", names=["alpha"], common=True)
+  assert common_files(tmp_path / "common") == files
+  assert evaluate(str(tmp_path / "common")) == evaluate(str(tmp_path / "plain"))
+
+def test_stale_common_files(fleet, tmp_path):
+  bootstrap_many(fleet, tmp_path, common=True)
+  files = common_files(tmp_path)
+  stale = os.path.join("lib", "common", "rules", "0000000000000000")
+  os.makedirs(os.path.join(tmp_path, stale))
+  for path in (stale + ".libsonnet", os.path.join(stale, "child.jsonnet")):
+    with open(os.path.join(tmp_path, path), "w") as fd:
+      fd.write("{}\n")
+  bootstrap_many(fleet, tmp_path, common=True)
+  assert common_files(tmp_path) == files
+
+def test_owner_failure(fleet, tmp_path, monkeypatch):
+  bootstrap_many(fleet, tmp_path / "plain", names=NAMES[1:])
+  fetchHostnames = Property.fetchHostnames
+  def failing(session, name, *args, **kwargs):
+    if name == "alpha":
+      raise PropertyError("no hostnames")
+    return fetchHostnames(session, name, *args, **kwargs)
+  # workers are forked, and inherit the patch
+  monkeypatch.setattr(Property, "fetchHostnames", staticmethod(failing))
+  with pytest.raises(papi.BootstrapError):
+    bootstrap_many(fleet, tmp_path / "common", common=True)
+  # alpha owned the files it has in common with bravo and charlie
+  assert not os.path.exists(os.path.join(tmp_path, "common", "properties", "alpha"))
+  assert evaluate(str(tmp_path / "common")) == evaluate(str(tmp_path / "plain"))
+
+def test_spool_cleanup(fleet, tmp_path, monkeypatch):
+  monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+  os.makedirs(tempfile.tempdir)
+  def failing(executor, specs, spool):
+    raise KeyboardInterrupt()
+  monkeypatch.setattr(papi, "analyze_common", failing)
+  # the traceback keeps the spool referenced, so it isn't finalized instead
+  with pytest.raises(KeyboardInterrupt) as excinfo:
+    bootstrap_many(fleet, tmp_path / "common", common=True)
+  assert os.listdir(tempfile.tempdir) == []
+  assert excinfo.traceback
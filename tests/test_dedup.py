@@ -0,0 +1,49 @@
+import os
+import copy
+import pytest
+from src.commands import papi
+from synthetic import synthetic_rule_tree
+from stub import StubPapi
+from conftest import PRODUCT, RULE_FORMAT, evaluate, read_tree
+
+@pytest.fixture
+def repeated(schema, hostnames, tmp_path):
+  """
+  A stub PAPI server with a property copying a subtree of its rules under
+  several parents, twice under the same name in one of them.
+  """
+  ruleTree = synthetic_rule_tree(schema, rules=30, depth=3, fanout=3, seed=5)
+  children = ruleTree.get("rules").get("children")
+  for (idx, parent) in enumerate([children[1], children[2], children[2]]):
+    subtree = copy.deepcopy(children[0])
+    subtree["name"] = "Copy {}".format(min(idx, 1))
+    subtree["uuid"] = "uuid-{}".format(idx)
+    parent["children"].append(subtree)
+  stub = StubPapi(schema, ruleTree, hostnames).start()
+  stub.edgerc = stub.write_edgerc(str(tmp_path / "edgerc"))
+  yield stub
+  stub.stop()
+
+def bootstrap(stub, out, **kwargs):
+  papi.bootstrap(stub.edgerc, "default", PRODUCT, "synthetic", ruleFormat=RULE_FORMAT, out=str(out), noCache=True, **kwargs)
+
+def shared_files(out):
+  return [path for path in read_tree(str(out)) if "_shared" in path.split(os.sep)]
+
+def test_same_json(repeated, tmp_path):
+  bootstrap(repeated, tmp_path / "plain")
+  bootstrap(repeated, tmp_path / "dedup", dedup=True)
+  assert len(shared_files(tmp_path / "dedup"))
+  assert len(read_tree(str(tmp_path / "dedup"))) < len(read_tree(str(tmp_path / "plain")))
+  assert evaluate(str(tmp_path / "dedup")) == evaluate(str(tmp_path / "plain"))
+
+def test_switch(repeated, tmp_path):
+  # the manifest of the previous run doesn't apply once the layout changes
+  bootstrap(repeated, tmp_path / "plain")
+  bootstrap(repeated, tmp_path / "out")
+  bootstrap(repeated, tmp_path / "out", dedup=True)
+  assert len(shared_files(tmp_path / "out"))
+  assert evaluate(str(tmp_path / "out")) == evaluate(str(tmp_path / "plain"))
+  bootstrap(repeated, tmp_path / "out")
+  assert shared_files(tmp_path / "out") == []
+  assert evaluate(str(tmp_path / "out")) == evaluate(str(tmp_path / "plain"))
@@ -0,0 +1,130 @@
+import os
+import sys
+import shutil
+import textwrap
+import pytest
+from src.jsonnet.writer import JsonnetWriter
+from src.jsonnet.formatter import Formatter, BuiltinFormatter, JsonnetfmtFormatter, NullFormatter, get_formatter
+from src.jsonnet.papi.ruleformat import RuleFormat
+from src.jsonnet.papi.property import Property
+from src.output import OutputTree
+from src.commands import papi
+from conftest import PRODUCT, evaluate
+
+JSONNETFMT = shutil.which("jsonnetfmt")
+
+@pytest.mark.parametrize(("source", "expected"), [
+  # an element on its own line puts them all on their own line
+  ("{a: 1,\nb: 2}", "{\n  a: 1,\n  b: 2,\n}\n"),
+  ("{a: [1,\n2, 3], b: {c: 1}}", "{ a: [\n  1,\n  2,\n  3,\n], b: { c: 1 } }\n"),
+  ("[x for x in [1,\n2]\nif x > 1]", "[\n  x\n  for x in [\n    1,\n    2,\n  ]\n  if x > 1\n]\n"),
+  ("{a: 1, // one\nb: 2}", "{\n  a: 1,  // one\n  b: 2,\n}\n"),
+  # a + { ... } is a { ... }
+  ("local x = {a: 1};\nx + {b: 2}", "local x = { a: 1 };\nx { b: 2 }\n"),
+  # calls and indexes are left alone
+  ("f(1,\n2)[0]", "f(1,\n  2)[0]\n"),
+])
+def test_builtin(source, expected):
+  assert BuiltinFormatter().format(source) == expected
+
+def convert(schema, ruleTree, hostnames):
+  """
+  Return the unformatted sources of a rule format library, the template of a
+  property and its env.
+  """
+  formatter = JsonnetWriter.formatter
+  JsonnetWriter.formatter = NullFormatter()
+  try:
+    output = OutputTree("/nonexistent")
+    ruleFormat = RuleFormat(schema, PRODUCT, ruleTree.get("ruleFormat"))
+    papi.write_ruleformat(output, ruleFormat)
+    papi.write_ruleformat(output, ruleFormat, layout="split", libDir="split")
+    property = Property("synthetic", "prp_1", ruleTree, hostnames)
+    papi.write_property(output, property, ruleFormat, dict(), None, None, terraform=True, dedup=True)
+    return dict((path, file.data) for (path, file) in output.files.items() if file.jsonnet)
+  finally:
+    JsonnetWriter.formatter = formatter
+
+@pytest.mark.skipif(JSONNETFMT is None, reason="jsonnetfmt not found on PATH")
+def test_same_as_jsonnetfmt(schema, ruleTree, hostnames):
+  sources = convert(schema, ruleTree, hostnames)
+  paths = sorted(sources)
+  builtin = BuiltinFormatter().format_many([sources[path] for path in paths])
+  jsonnetfmt = JsonnetfmtFormatter(JSONNETFMT).format_many([sources[path] for path in paths])
+  for (path, ours, theirs) in zip(paths, builtin, jsonnetfmt):
+    assert ours == theirs, path
+
+@pytest.mark.parametrize("formatter", ["none", "jsonnetfmt"])
+def test_same_json(formatter, stub, tmp_path):
+  if formatter == "jsonnetfmt" and JSONNETFMT is None:
+    pytest.skip("jsonnetfmt not found on PATH")
+  results = dict()
+  for name in ("builtin", formatter):
+    JsonnetWriter.formatter = dict(builtin=BuiltinFormatter, none=NullFormatter, jsonnetfmt=JsonnetfmtFormatter)[name]()
+    out = tmp_path / name
+    papi.bootstrap(stub.edgerc, "default", PRODUCT, "synthetic", ruleFormat="v2023-01-05", out=str(out), noCache=True)
+    results[name] = evaluate(str(out))
+  assert len(results["builtin"])
+  assert results[formatter] == results["builtin"]
+
+@pytest.fixture
+def fake_jsonnetfmt(tmp_path, monkeypatch):
+  """
+  Put a jsonnetfmt on PATH that upper-cases files, fails on those containing
+  "error", and logs its arguments; return the path of the log.
+  """
+  bindir = tmp_path / "bin"
+  os.makedirs(bindir)
+  log = str(tmp_path / "jsonnetfmt.log")
+  with open(bindir / "jsonnetfmt", "w") as fd:
+    fd.write("#!{}\n".format(sys.executable) + textwrap.dedent(
+      """
+      import sys
+      with open(%r, "a") as fd:
+        fd.write("{} {}\\n".format(sys.argv[1], len(sys.argv) - 2))
+      def format(source):
+        if "error" in source:
+          sys.exit(1)
+        return source.upper()
+      if sys.argv[1] == "-":
+        sys.stdout.write(format(sys.stdin.read()))
+      else:
+        for path in sys.argv[2:]:
+          with open(path, "r") as fd:
+            source = fd.read()
+          with open(path, "w") as fd:
+            fd.write(format(source))
+      """ % log
+    ))
+  os.chmod(bindir / "jsonnetfmt", 0o755)
+  monkeypatch.setenv("PATH", str(bindir) + os.pathsep + os.environ.get("PATH", ""))
+  return log
+
+def read_log(log):
+  with open(log, "r") as fd:
+    return [tuple(line.split()) for line in fd.read().splitlines()]
+
+def test_jsonnetfmt_chunks(fake_jsonnetfmt):
+  sources = ["{{ a: {} }}\n".format(idx) for idx in range(250)]
+  assert get_formatter("jsonnetfmt").format_many(sources) == [source.upper() for source in sources]
+  # one process per chunk of files
+  assert read_log(fake_jsonnetfmt) == [("-i", "200"), ("-i", "50")]
+
+def test_jsonnetfmt_failed_chunk(fake_jsonnetfmt):
+  sources = ["{{ a: {} }}\n".format(idx) for idx in range(250)]
+  sources[210] = "{ a: error }\n"
+  results = JsonnetfmtFormatter().format_many(sources)
+  # the files of the failed chunk are formatted one at a time, except the failing one
+  assert results[210] == sources[210]
+  assert results[:210] + results[211:] == [source.upper() for source in sources[:210] + sources[211:]]
+  assert read_log(fake_jsonnetfmt) == [("-i", "200"), ("-i", "50")] + [("-", "0")] * 50
+
+def test_jsonnetfmt_missing(tmp_path):
+  sources = ["{ a: 1 }\n"]
+  assert JsonnetfmtFormatter(str(tmp_path / "nonexistent")).format_many(sources) == sources
+
+def test_format_required():
+  class Incomplete(Formatter):
+    name = "incomplete"
+  with pytest.raises(TypeError):
+    Incomplete()
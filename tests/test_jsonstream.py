@@ -0,0 +1,66 @@
+import io
+import json
+import pytest
+from src.jsonstream import JsonStream, JsonStreamError
+
+DOCUMENT = {
+  "name": "default",
+  "options": {"is_secure": True, "ttl": 12345678, "ratio": -2.5e-3},
+  "children": [
+    {"name": "a \"quoted\" name, with [brackets] and {braces}", "children": []},
+    {"name": "été \\ 😀", "children": [{"name": "leaf", "children": []}]},
+  ],
+  "empty": {},
+}
+
+def walk(stream):
+  """
+  Read a rule and its descendants as the converter does: the children with
+  array(), everything else whole with value().
+  """
+  rule = dict()
+  for key in stream.object():
+    if key == "children":
+      rule[key] = [walk(stream) for _ in stream.array()]
+    else:
+      rule[key] = stream.value()
+  return rule
+
+@pytest.mark.parametrize("chunkSize", [1, 2, 7, 1024])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_walk(chunkSize, indent):
+  stream = JsonStream(io.StringIO(json.dumps(DOCUMENT, indent=indent)), chunkSize)
+  assert walk(stream) == DOCUMENT
+  # nothing is left but whitespace
+  assert stream._peek() is None
+
+@pytest.mark.parametrize("chunkSize", [1, 3])
+def test_numbers(chunkSize):
+  # a number may continue in the next chunk
+  stream = JsonStream(io.StringIO("[12345, 6.25e10, 7]"), chunkSize)
+  assert [stream.value() for _ in stream.array()] == [12345, 6.25e10, 7]
+
+def test_empty():
+  stream = JsonStream(io.StringIO(" { } [ ] "))
+  assert list(stream.object()) == []
+  assert list(stream.array()) == []
+
+@pytest.mark.parametrize("text", [
+  '{"a": 1',
+  '{"a" 1}',
+  '{1: 2}',
+  '{"a": 1 "b": 2}',
+  '[1, 2',
+  '"unterminated',
+])
+def test_errors(text):
+  stream = JsonStream(io.StringIO(text), 4)
+  with pytest.raises(JsonStreamError):
+    if text.startswith("{"):
+      for _ in stream.object():
+        stream.value()
+    elif text.startswith("["):
+      for _ in stream.array():
+        stream.value()
+    else:
+      stream.value()
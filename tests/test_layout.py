@@ -0,0 +1,38 @@
+import os
+from src.commands import papi
+from conftest import PRODUCT, RULE_FORMAT, evaluate, bootstrap_many
+
+def atom_files(out):
+  atomsDir = os.path.join(out, "lib", "papi", PRODUCT, RULE_FORMAT)
+  return sorted(
+    os.path.join(ns, filename)
+    for ns in ("behaviors", "criteria") if os.path.isdir(os.path.join(atomsDir, ns))
+    for filename in os.listdir(os.path.join(atomsDir, ns))
+  )
+
+def test_same_json(stub, tmp_path):
+  results = dict()
+  for layout in ("single", "split"):
+    out = tmp_path / layout
+    papi.bootstrap(stub.edgerc, "default", PRODUCT, "synthetic", ruleFormat=RULE_FORMAT, out=str(out), noCache=True, layout=layout)
+    results[layout] = evaluate(str(out))
+  assert len(atom_files(tmp_path / "split")) > 0
+  assert len(results["single"])
+  assert results["split"] == results["single"]
+
+def test_stale_atoms(fleet, tmp_path):
+  out = tmp_path / "out"
+  bootstrap_many(fleet, out, layout="split")
+  full = atom_files(out)
+  # atoms left out of a trimmed library are removed
+  bootstrap_many(fleet, out, layout="split", trim=True)
+  trimmed = atom_files(out)
+  assert 0 < len(trimmed) < len(full)
+  expected = evaluate(str(out))
+  bootstrap_many(fleet, out, names=["alpha"], layout="split", trim=True)
+  assert atom_files(out) == trimmed
+  # and all of them once the library isn't split
+  bootstrap_many(fleet, out, layout="single")
+  assert atom_files(out) == []
+  assert not os.path.exists(os.path.join(out, "lib", "papi", PRODUCT, RULE_FORMAT))
+  assert evaluate(str(out)) == expected
@@ -0,0 +1,78 @@
+import os
+import copy
+import json
+import pytest
+from src.jsonnet.writer import JsonnetWriter
+from src.jsonnet.papi.ruleformat import RuleFormat
+from src.jsonnet.papi.converter import RuleTreeConverter
+from src.jsonnet.papi.converter.manifest import RuleManifest
+from src.output import OutputTree
+from src.commands import papi
+from conftest import PRODUCT
+
+def convert(out, ruleFormat, ruleTree, incremental=True, dedup=False):
+  """
+  Convert ruleTree into out, and return the files that were converted.
+  """
+  output = OutputTree(str(out))
+  papi.write_ruleformat(output, ruleFormat)
+  writer = JsonnetWriter()
+  RuleTreeConverter(ruleFormat, ruleTree, output, incremental=incremental, dedup=dedup).convert(writer)
+  output.dump("rules.jsonnet", writer)
+  output.flush()
+  return set(path for path in output.files if not path.startswith("lib") and path != RuleManifest.filename)
+
+# files of the default rule, which is always converted
+ROOT = set(["rules.jsonnet", "pmvariables.jsonnet", "advancedOverride.xml"])
+
+def evaluate(out):
+  _jsonnet = pytest.importorskip("_jsonnet")
+  return json.loads(_jsonnet.evaluate_file(os.path.join(out, "rules.jsonnet"), jpathdir=[os.path.join(out, "lib")]))
+
+@pytest.fixture
+def ruleFormat(schema, ruleTree):
+  return RuleFormat(schema, PRODUCT, ruleTree.get("ruleFormat"))
+
+def test_unchanged(ruleFormat, ruleTree, tmp_path):
+  converted = convert(tmp_path, ruleFormat, ruleTree)
+  assert len(converted) > 10
+  assert convert(tmp_path, ruleFormat, ruleTree) == ROOT
+
+def test_changed_rule(ruleFormat, ruleTree, tmp_path):
+  convert(tmp_path / "incremental", ruleFormat, ruleTree)
+  changed = copy.deepcopy(ruleTree)
+  (parent, rule) = (changed["rules"]["children"][1], changed["rules"]["children"][1]["children"][0])
+  rule["comments"] = "changed"
+  # a rule, and the ancestors whose digest includes it, are converted again
+  converted = convert(tmp_path / "incremental", ruleFormat, changed)
+  assert converted == ROOT | set([
+    os.path.join("rules", "{}.jsonnet".format(parent["name"].replace(" ", "_"))),
+    os.path.join("rules", parent["name"].replace(" ", "_"), "{}.jsonnet".format(rule["name"].replace(" ", "_"))),
+  ])
+  convert(tmp_path / "full", ruleFormat, changed, incremental=False)
+  assert evaluate(tmp_path / "incremental") == evaluate(tmp_path / "full")
+
+def test_removed_rule(ruleFormat, ruleTree, tmp_path):
+  convert(tmp_path / "incremental", ruleFormat, ruleTree)
+  changed = copy.deepcopy(ruleTree)
+  del changed["rules"]["children"][0]
+  convert(tmp_path / "incremental", ruleFormat, changed)
+  convert(tmp_path / "full", ruleFormat, changed, incremental=False)
+  assert not os.path.exists(os.path.join(tmp_path, "incremental", "rules", "Rule_1.jsonnet"))
+  assert evaluate(tmp_path / "incremental") == evaluate(tmp_path / "full")
+
+def test_schema_changed(schema, ruleFormat, ruleTree, tmp_path):
+  convert(tmp_path, ruleFormat, ruleTree)
+  # the same rule format name, e.g. "latest", with another schema
+  changed = copy.deepcopy(schema)
+  changed["definitions"]["catalog"]["behaviors"]["behavior0"]["properties"]["options"]["properties"]["added"] = {"type": "string"}
+  latest = RuleFormat(changed, PRODUCT, ruleFormat.ruleFormat)
+  assert latest.digest != ruleFormat.digest
+  assert len(convert(tmp_path, latest, ruleTree)) > 10
+
+def test_same_json(ruleFormat, ruleTree, tmp_path):
+  for dedup in (False, True):
+    convert(tmp_path / "incremental", ruleFormat, ruleTree, dedup=dedup)
+    convert(tmp_path / "incremental", ruleFormat, ruleTree, dedup=dedup)
+    convert(tmp_path / "full", ruleFormat, ruleTree, incremental=False, dedup=dedup)
+    assert evaluate(tmp_path / "incremental") == evaluate(tmp_path / "full")
@@ -0,0 +1,87 @@
+import io
+import os
+import sys
+import gzip
+import json
+import pstats
+import pytest
+import urllib3
+import requests
+from src import main
+from src.metrics import Metrics, metrics
+from src.edgegrid import downloaded
+from conftest import PRODUCT, RULE_FORMAT, NAMES, read_tree
+
+@pytest.fixture(autouse=True)
+def disabled():
+  """
+  Leave the metrics of the process disabled after each test, as main() enables them.
+  """
+  yield
+  metrics.reset()
+
+def run(monkeypatch, *argv):
+  monkeypatch.setattr(sys, "argv", ["akamai-jsonnet"] + list(argv))
+  main.main()
+
+def test_merge():
+  (parent, worker) = (Metrics(), Metrics())
+  parent.reset(True)
+  worker.reset(True)
+  for m in (parent, worker):
+    with m.phase("http"):
+      pass
+    m.count("http.requests", 2)
+    m.observe("http.latency", 0.5)
+  worker.count("files.written")
+  parent.merge(worker.collect())
+  merged = parent.to_dict()
+  assert merged.get("phases").get("http").get("count") == 2
+  assert merged.get("counters") == {"files.written": 1, "http.requests": 4}
+  assert merged.get("latencies").get("http.latency").get("count") == 2
+  # collecting starts over
+  assert worker.collect() == (dict(), dict(), dict())
+  # nothing is collected or merged while disabled
+  worker.reset()
+  assert worker.collect() is None
+  worker.merge(parent.collect())
+  assert worker.to_dict().get("counters") == dict()
+
+def test_metrics_json(fleet, tmp_path, monkeypatch):
+  (out, metricsJson, profileDump) = (tmp_path / "out", tmp_path / "metrics.json", tmp_path / "profile")
+  run(monkeypatch,
+    "--edgerc", fleet.edgerc, "--no-cache", "--metrics-json", str(metricsJson), "--profile-dump", str(profileDump),
+    "papi", "bootstrap-many", "--productId", PRODUCT, "--ruleFormat", RULE_FORMAT, "--propertyNames", *NAMES, "--out", str(out), "--jobs", "2")
+  with open(metricsJson, "r") as fd:
+    dumped = json.load(fd)
+  assert {"http", "json", "schema", "convert", "format", "write"} <= set(dumped.get("phases"))
+  counters = dumped.get("counters")
+  # the requests and files of the worker processes are reported too
+  assert counters.get("http.requests") == fleet.requests
+  assert counters.get("files.written") == len(read_tree(str(out)))
+  assert dumped.get("latencies").get("http.latency").get("count") == fleet.requests
+  assert pstats.Stats(str(profileDump)).total_calls > 0
+
+def test_render_workers(tmp_path, monkeypatch):
+  pytest.importorskip("_jsonnet")
+  for name in ("a", "b"):
+    os.makedirs(tmp_path / "envs", exist_ok=True)
+    with open(tmp_path / "envs" / "{}.jsonnet".format(name), "w") as fd:
+      fd.write("{ name: '%s' }\n" % name)
+  with open(tmp_path / "template.jsonnet", "w") as fd:
+    fd.write("local env = std.extVar('env');\n{ [env.name + '.json']: env }\n")
+  run(monkeypatch, "--metrics-json", str(tmp_path / "metrics.json"), "render", str(tmp_path), "--engine", "python", "--jobs", "2")
+  with open(tmp_path / "metrics.json", "r") as fd:
+    dumped = json.load(fd)
+  # phases of the worker processes
+  assert dumped.get("phases").get("jsonnet").get("count") == 2
+  assert dumped.get("latencies").get("render.env").get("count") == 2
+
+def test_downloaded():
+  body = gzip.compress(b'{"a": 1}' * 100)
+  response = requests.Response()
+  response.raw = urllib3.HTTPResponse(io.BytesIO(body), headers={"Content-Encoding": "gzip"}, preload_content=False)
+  # the compressed body is counted, not the decoded one
+  assert len(response.content) == 800
+  assert downloaded(response) == len(body)
+  assert downloaded(requests.Response()) == 0
@@ -0,0 +1,90 @@
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from src.output import OutputTree
+from src.jsonnet.writer import JsonnetWriter
+from conftest import read_tree
+
+def test_archive_tar():
+  output = OutputTree("out")
+  output.write("b/c.txt", "c\n")
+  output.write("a.sh", "#!/bin/sh\n", mode=0o750)
+  fileobj = io.BytesIO()
+  output.archive(fileobj, "tar")
+  fileobj.seek(0)
+  with tarfile.open(fileobj=fileobj, mode="r") as archive:
+    members = archive.getmembers()
+    assert [(m.name, m.mode) for m in members] == [("a.sh", 0o750), ("b/c.txt", 0o644)]
+    assert archive.extractfile("b/c.txt").read() == b"c\n"
+
+def test_archive_zip():
+  output = OutputTree("out")
+  output.write("b/c.txt", "c\n")
+  output.write("a.sh", "#!/bin/sh\n", mode=0o750)
+  fileobj = io.BytesIO()
+  output.archive(fileobj, "zip")
+  with zipfile.ZipFile(fileobj, "r") as archive:
+    assert [(info.filename, info.external_attr >> 16) for info in archive.infolist()] == [("a.sh", 0o750), ("b/c.txt", 0o644)]
+    assert archive.read("a.sh") == b"#!/bin/sh\n"
+
+def test_archive_jsonnet(tmp_path):
+  output = OutputTree(str(tmp_path))
+  writer = JsonnetWriter()
+  writer.write("{a:1}")
+  output.dump("a.jsonnet", writer)
+  fileobj = io.BytesIO()
+  output.archive(fileobj, "zip")
+  # jsonnet files are formatted, and nothing is written to root
+  with zipfile.ZipFile(fileobj, "r") as archive:
+    assert archive.read("a.jsonnet") == b"{ a: 1 }\n"
+  assert os.listdir(str(tmp_path)) == []
+
+def test_flush_unchanged(tmp_path):
+  output = OutputTree(str(tmp_path))
+  output.write("a.txt", "a\n")
+  output.write("b/b.txt", "b\n")
+  assert output.flush() == 2
+  os.utime(tmp_path / "a.txt", (0, 0))
+  output = OutputTree(str(tmp_path))
+  output.write("a.txt", "a\n")
+  output.write("b/b.txt", "changed\n")
+  assert output.flush() == 1
+  # unchanged files aren't written again
+  assert os.stat(tmp_path / "a.txt").st_mtime == 0
+  assert read_tree(str(tmp_path)) == {"a.txt": b"a\n", os.path.join("b", "b.txt"): b"changed\n"}
+
+def test_flush_removed(tmp_path):
+  output = OutputTree(str(tmp_path))
+  output.write("a.txt", "a\n")
+  output.write("b/c/stale.txt", "stale\n")
+  output.write("b/kept.txt", "kept\n")
+  output.flush()
+  output = OutputTree(str(tmp_path))
+  output.remove("a.txt")
+  output.remove("b/c/stale.txt")
+  output.remove("b/kept.txt")
+  output.remove("missing.txt")
+  # files written again are kept
+  output.write("a.txt", "again\n")
+  output.flush()
+  # and directories left empty are removed
+  assert read_tree(str(tmp_path)) == {"a.txt": b"again\n"}
+  assert sorted(os.listdir(str(tmp_path))) == ["a.txt"]
+
+def test_spill(tmp_path):
+  output = OutputTree(str(tmp_path), spillSize=10)
+  output.write("a.txt", "aaaaaa")
+  assert not os.path.exists(tmp_path / "a.txt")
+  output.write("b.txt", "bbbbbb")
+  # the files added so far are flushed once they reach spillSize, and released
+  assert read_tree(str(tmp_path)) == {"a.txt": b"aaaaaa", "b.txt": b"bbbbbb"}
+  assert (output.files, output.pendingSize) == (dict(), 0)
+  output.write("c.txt", "c")
+  # spilled files aren't removed on flush
+  output.remove("a.txt")
+  output.flush()
+  assert sorted(read_tree(str(tmp_path))) == ["a.txt", "b.txt", "c.txt"]
+  with pytest.raises(RuntimeError):
+    output.archive(io.BytesIO())
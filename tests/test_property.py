@@ -0,0 +1,46 @@
+import json
+from src.cache import open_cache
+from src.edgegrid import Session
+from src.jsonnet.papi.property import Property
+from src.jsonnet.papi.ruleformat import RuleFormat
+from conftest import PRODUCT
+
+def test_find(stub, tmp_path):
+  session = Session(stub.edgerc, "default")
+  cache = open_cache(str(tmp_path / "cache"))
+  assert Property.find(session, "synthetic", "latest", cache) == dict(propertyId="prp_1", contractId="ctr_X", groupId="grp_X", propertyVersion=1)
+  stub.latestVersion = 3
+  assert Property.find(session, "synthetic", "latest", cache).get("propertyVersion") == 3
+  # specific versions don't need the API once the property was found
+  requests = stub.requests
+  assert Property.find(session, "synthetic", 2, cache).get("propertyVersion") == 2
+  assert stub.requests == requests
+
+def test_catalog(stub, tmp_path):
+  session = Session(stub.edgerc, "default")
+  cache = open_cache(str(tmp_path / "cache"))
+  assert Property.syncCatalog(session, cache).get("synthetic").get("propertyId") == "prp_1"
+  requests = stub.requests
+  assert Property.find(session, "synthetic", 1, cache).get("propertyId") == "prp_1"
+  assert stub.requests == requests
+  # the latest version is asked to the API, not to the catalog
+  stub.latestVersion = 2
+  assert Property.find(session, "synthetic", "latest", cache).get("propertyVersion") == 2
+  assert stub.requests == requests + 1
+
+def test_rules_latest_format(stub, tmp_path):
+  session = Session(stub.edgerc, "default")
+  cache = open_cache(str(tmp_path / "cache"))
+  def get():
+    ruleFormat = RuleFormat.get(session, PRODUCT, "latest", cache)
+    return Property.get(session, "synthetic", 1, ruleFormat, cache)
+  get()
+  # only the latest schema is revalidated
+  requests = stub.requests
+  assert get().ruleTree.get("propertyName") == "synthetic"
+  assert stub.requests == requests + 1
+  # a new rule format is released
+  stub.bodies["schema"] = json.dumps(dict(json.loads(stub.bodies.get("schema")), title="next")).encode()
+  requests = stub.requests
+  get()
+  assert stub.requests == requests + 2
@@ -0,0 +1,116 @@
+import time
+import datetime
+import threading
+import pytest
+import requests
+from email.utils import format_datetime
+from src.edgegrid import Session
+from src.ratelimit import RateLimiter, MAX_RETRY_DELAY, BACKOFF_CAP, retryable, retry_delay, retry_after, rate_limit_delay
+from conftest import evaluate, bootstrap_many
+
+def response(status, **headers):
+  response = requests.Response()
+  response.status_code = status
+  response.headers.update(headers)
+  return response
+
+def timestamp(seconds):
+  resets = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+  return resets.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def test_token_bucket():
+  limiter = RateLimiter(rate=20, burst=5)
+  start = time.monotonic()
+  for _ in range(5):
+    limiter.acquire()
+  assert time.monotonic() - start < 0.1
+  # the next 10 requests wait for tokens at 20 per second
+  for _ in range(10):
+    limiter.acquire()
+  assert 0.45 <= time.monotonic() - start < 1.0
+
+def test_unlimited():
+  limiter = RateLimiter()
+  start = time.monotonic()
+  for _ in range(1000):
+    limiter.acquire()
+  assert time.monotonic() - start < 0.5
+
+def test_pause():
+  limiter = RateLimiter()
+  limiter.pause(0.3)
+  # a shorter pause doesn't cut the current one
+  limiter.pause(0.1)
+  start = time.monotonic()
+  limiter.acquire()
+  assert 0.25 <= time.monotonic() - start < 1.0
+
+def test_concurrency():
+  limiter = RateLimiter(concurrency=2)
+  (lock, active, highest) = (threading.Lock(), [0], [0])
+  def request():
+    with limiter.slot():
+      with lock:
+        active[0] += 1
+        highest[0] = max(highest[0], active[0])
+      time.sleep(0.05)
+      with lock:
+        active[0] -= 1
+  threads = [threading.Thread(target=request) for _ in range(6)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert highest[0] == 2
+
+def test_observe():
+  limiter = RateLimiter()
+  limiter.observe(response(200, **{"Akamai-RateLimit-Remaining": "3", "Akamai-RateLimit-Next": timestamp(10)}))
+  assert limiter.state[2] == 0.0
+  limiter.observe(response(200, **{"Akamai-RateLimit-Remaining": "0", "Akamai-RateLimit-Next": timestamp(10)}))
+  assert 9 < limiter.state[2] - time.monotonic() <= 10
+
+@pytest.mark.parametrize(("method", "status", "expected"), [
+  ("GET", 503, True),
+  ("get", 500, True),
+  ("GET", 404, False),
+  ("POST", 500, False),
+  # throttled requests weren't processed
+  ("POST", 429, True),
+])
+def test_retryable(method, status, expected):
+  assert retryable(method, response(status)) == expected
+
+def test_retry_after():
+  assert retry_after(response(503, **{"Retry-After": "2.5"})) == 2.5
+  assert retry_after(response(503, **{"Retry-After": "-1"})) == 0.0
+  later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=60)
+  assert 55 < retry_after(response(503, **{"Retry-After": format_datetime(later, usegmt=True)})) <= 60
+  assert retry_after(response(503, **{"Retry-After": "soon"})) is None
+  assert retry_after(response(503)) is None
+  assert retry_after(None) is None
+
+def test_rate_limit_delay():
+  assert 4 < rate_limit_delay(response(429, **{"Akamai-RateLimit-Next": timestamp(5)})) <= 5
+  assert rate_limit_delay(response(429, **{"Akamai-RateLimit-Next": timestamp(-5)})) == 0.0
+  assert rate_limit_delay(response(429, **{"Akamai-RateLimit-Next": "tomorrow"})) is None
+  assert rate_limit_delay(response(429)) is None
+
+def test_retry_delay():
+  # Retry-After first, then the rate limit headers of a 429, then backoff
+  headers = {"Retry-After": "2", "Akamai-RateLimit-Next": timestamp(20)}
+  assert retry_delay(response(429, **headers), 0) == 2.0
+  assert 19 < retry_delay(response(429, **{"Akamai-RateLimit-Next": timestamp(20)}), 0) <= 20
+  assert retry_delay(response(503, **{"Retry-After": "3600"}), 0) == MAX_RETRY_DELAY
+  assert 0 <= retry_delay(response(503, **{"Akamai-RateLimit-Next": timestamp(20)}), 1) <= 1.0
+  assert 0 <= retry_delay(None, 100) <= BACKOFF_CAP
+
+def test_throttled_bootstrap(fleet, tmp_path, monkeypatch):
+  bootstrap_many(fleet, tmp_path / "plain")
+  fleet.rateLimit = 5
+  # retry the 429s right away, rather than when the rate limit resets
+  monkeypatch.setattr("src.edgegrid.retry_delay", lambda response, attempt: 0.05)
+  monkeypatch.setattr(Session, "limiter", RateLimiter(retries=50))
+  bootstrap_many(fleet, tmp_path / "throttled")
+  assert fleet.throttled > 0
+  assert evaluate(str(tmp_path / "throttled")) == evaluate(str(tmp_path / "plain"))
@@ -0,0 +1,73 @@
+import os
+import json
+import shutil
+import pytest
+from src.commands import render
+from conftest import PRODUCT, RULE_FORMAT, evaluate, read_tree
+from src.commands import papi
+
+_jsonnet = pytest.importorskip("_jsonnet")
+
+@pytest.fixture
+def bootstrapped(stub, tmp_path):
+  out = str(tmp_path / "out")
+  papi.bootstrap(stub.edgerc, "default", PRODUCT, "synthetic", ruleFormat=RULE_FORMAT, out=out, noCache=True)
+  return out
+
+def test_render(bootstrapped):
+  render.render(bootstrapped, engine="python")
+  files = read_tree(os.path.join(bootstrapped, "dist"))
+  expected = evaluate(bootstrapped)
+  assert sorted(expected) == sorted(path for path in files if path != render.RenderCache.filename)
+  for (path, value) in expected.items():
+    # each file is manifested as jsonnet would
+    assert files[path] == _jsonnet.evaluate_snippet(path, json.dumps(value)).encode("utf-8")
+
+def write_env(directory, template, env="{ name: 'test' }"):
+  os.makedirs(os.path.join(directory, "envs"), exist_ok=True)
+  with open(os.path.join(directory, "envs", "test.jsonnet"), "w") as fd:
+    fd.write(env + "\n")
+  with open(os.path.join(directory, "template.jsonnet"), "w") as fd:
+    fd.write(template + "\n")
+
+def test_multiline_strings(tmp_path):
+  write_env(tmp_path, "local env = std.extVar('env');\n{ [env.name + '/a.json']: { text: 'one\\n   \"two\": 2\\n' }, [env.name + '/b.json']: ['x'] }")
+  render.render(str(tmp_path), engine="python")
+  with open(tmp_path / "dist" / "test" / "a.json", "r") as fd:
+    assert fd.read() == '{\n   "text": "one\\n   \\"two\\": 2\\n"\n}\n'
+  with open(tmp_path / "dist" / "test" / "b.json", "r") as fd:
+    assert fd.read() == '[\n   "x"\n]\n'
+
+def test_same_as_jsonnet(tmp_path):
+  write_env(tmp_path, "local env = std.extVar('env');\n{ [env.name + '/a.json']: { a: {}, b: [], c: { d: [1, {}], e: 'x,' } }, [env.name + '/b.json']: {}, [env.name + '/c.json']: [] }")
+  render.render(str(tmp_path), engine="python")
+  files = read_tree(str(tmp_path / "dist"))
+  assert files[os.path.join("test", "a.json")] == b'{\n   "a": { },\n   "b": [ ],\n   "c": {\n      "d": [\n         1,\n         { }\n      ],\n      "e": "x,"\n   }\n}\n'
+  assert files[os.path.join("test", "b.json")] == b"{ }\n"
+  assert files[os.path.join("test", "c.json")] == b"[ ]\n"
+
+@pytest.mark.skipif(shutil.which("jsonnet") is None, reason="jsonnet not found on PATH")
+def test_same_as_jsonnet_engine(bootstrapped, tmp_path):
+  render.render(bootstrapped, out=str(tmp_path / "python"), engine="python")
+  render.render(bootstrapped, out=str(tmp_path / "jsonnet"), engine="jsonnet")
+  assert read_tree(str(tmp_path / "python")) == read_tree(str(tmp_path / "jsonnet"))
+
+def test_not_an_object(tmp_path):
+  write_env(tmp_path, "[]")
+  with pytest.raises(render.RenderError):
+    render.render(str(tmp_path), engine="python")
+
+def test_cache(tmp_path, capsys):
+  write_env(tmp_path, "local env = std.extVar('env');\n{ [env.name + '/a.json']: import 'a.libsonnet' }")
+  os.makedirs(tmp_path / "lib")
+  with open(tmp_path / "lib" / "a.libsonnet", "w") as fd:
+    fd.write("{ a: 1 }\n")
+  render.render(str(tmp_path), engine="python")
+  render.render(str(tmp_path), engine="python")
+  assert "1 hits, 0 misses" in capsys.readouterr().out
+  with open(tmp_path / "lib" / "a.libsonnet", "w") as fd:
+    fd.write("{ a: 2 }\n")
+  render.render(str(tmp_path), engine="python")
+  assert "0 hits, 1 misses" in capsys.readouterr().out
+  with open(tmp_path / "dist" / "test" / "a.json", "r") as fd:
+    assert json.load(fd) == {"a": 2}
@@ -0,0 +1,104 @@
+import copy
+import json
+import pickle
+import pytest
+from src.cache import Cache
+from src.edgegrid import Session
+from src.jsonnet.papi.ruleformat import RuleFormat, FrozenDict, freeze
+from conftest import PRODUCT, RULE_FORMAT
+
+def test_freeze():
+  frozen = freeze({"a": [{"b": 1}], "c": {"d": "e"}})
+  assert isinstance(frozen.get("c"), FrozenDict)
+  assert frozen.get("a") == ({"b": 1},)
+  for mutate in (
+    lambda: frozen.__setitem__("a", 1),
+    lambda: frozen.get("c").__delitem__("d"),
+    lambda: frozen.update(a=1),
+    lambda: frozen.setdefault("f", 1),
+    lambda: frozen.pop("a"),
+    lambda: frozen.clear(),
+  ):
+    with pytest.raises(TypeError):
+      mutate()
+  # frozen values still go to worker processes and to the cache
+  assert pickle.loads(pickle.dumps(frozen)) == frozen
+  assert isinstance(pickle.loads(pickle.dumps(frozen)), FrozenDict)
+  assert json.loads(json.dumps(frozen)) == {"a": [{"b": 1}], "c": {"d": "e"}}
+
+def test_catalog_keeps_schema(schema):
+  copied = copy.deepcopy(schema)
+  catalog = RuleFormat(copied, PRODUCT, RULE_FORMAT).catalog
+  assert isinstance(catalog.get("behaviors"), FrozenDict)
+  # options are resolved in the catalog, not in the schema
+  assert copied == schema
+  refs = 0
+  for (name, atom) in schema.get("definitions").get("catalog").get("behaviors").items():
+    for (option, value) in atom.get("properties").get("options").get("properties").items():
+      if "$ref" in value:
+        target = schema.get("definitions").get(value.get("$ref").split("/")[-1])
+        assert catalog.get("behaviors").get(name).get(option) == freeze(dict(value, **target))
+        refs += 1
+  assert refs > 0
+
+def test_cached_catalog(stub, tmp_path, monkeypatch):
+  session = Session(stub.edgerc, "default")
+  cache = Cache(str(tmp_path))
+  built = RuleFormat.get(session, PRODUCT, RULE_FORMAT, cache)
+  cacheKey = "schemas/{}/{}".format(PRODUCT, RULE_FORMAT)
+  # the catalog is saved along with the schema it was built from
+  assert cache.get(cacheKey + "/catalog").get("schema") == cache.get(cacheKey).get("digest")
+  def build_catalog(self):
+    raise AssertionError("catalog built again")
+  monkeypatch.setattr(RuleFormat, "build_catalog", build_catalog)
+  loaded = RuleFormat.get(session, PRODUCT, RULE_FORMAT, cache)
+  assert loaded.catalog == built.catalog
+  assert isinstance(loaded.catalog.get("behaviors"), FrozenDict)
+  # the schema itself is only parsed when needed
+  assert isinstance(loaded._schema, bytes)
+
+def test_cached_catalog_other_schema(stub, tmp_path):
+  session = Session(stub.edgerc, "default")
+  cache = Cache(str(tmp_path))
+  RuleFormat.get(session, PRODUCT, "latest", cache)
+  catalogKey = "schemas/{}/latest/catalog".format(PRODUCT)
+  digest = cache.get(catalogKey).get("schema")
+  # a new rule format is released; its catalog replaces the previous one
+  schema = dict(json.loads(stub.bodies.get("schema")), title="next")
+  schema.get("definitions").get("catalog").get("behaviors").popitem()
+  stub.bodies["schema"] = json.dumps(schema).encode()
+  ruleFormat = RuleFormat.get(session, PRODUCT, "latest", cache)
+  assert cache.get(catalogKey).get("schema") != digest
+  assert ruleFormat.catalog == RuleFormat(schema, PRODUCT, "latest").catalog
+
+def test_resolve_ref(schema, monkeypatch):
+  ruleFormat = RuleFormat(copy.deepcopy(schema), PRODUCT, RULE_FORMAT)
+  resolved = ruleFormat.resolve_ref("#/definitions/option_0")
+  assert resolved == freeze(schema.get("definitions").get("option_0"))
+  assert isinstance(resolved, FrozenDict)
+  # each ref is resolved once
+  def resolve_pointer(self, ptr):
+    raise AssertionError("{} resolved again".format(ptr))
+  monkeypatch.setattr(RuleFormat, "resolve_pointer", resolve_pointer)
+  assert ruleFormat.resolve_ref("#/definitions/option_0") is resolved
+  with pytest.raises(TypeError):
+    resolved["type"] = "number"
+  assert ruleFormat.schema == schema
+
+def test_digest(schema):
+  raw = json.dumps(schema).encode()
+  assert RuleFormat(raw, PRODUCT, "latest").digest == RuleFormat(raw, PRODUCT, "latest").digest
+  # parsed schemas are digested as canonical json
+  reordered = dict(reversed(list(schema.items())))
+  assert RuleFormat(reordered, PRODUCT, "latest").digest == RuleFormat(schema, PRODUCT, "latest").digest
+  changed = copy.deepcopy(schema)
+  changed.get("definitions").get("catalog").get("behaviors").popitem()
+  assert RuleFormat(changed, PRODUCT, "latest").digest != RuleFormat(schema, PRODUCT, "latest").digest
+  assert RuleFormat(json.dumps(changed).encode(), PRODUCT, "latest").digest != RuleFormat(raw, PRODUCT, "latest").digest
+
+def test_downloaded_digest(stub):
+  session = Session(stub.edgerc, "default")
+  digest = RuleFormat.get(session, PRODUCT, "latest").digest
+  assert RuleFormat.get(session, PRODUCT, "latest").digest == digest
+  stub.bodies["schema"] = json.dumps(dict(json.loads(stub.bodies.get("schema")), title="next")).encode()
+  assert RuleFormat.get(session, PRODUCT, "latest").digest != digest
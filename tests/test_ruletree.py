@@ -0,0 +1,62 @@
+import os
+import json
+import pytest
+from src.commands import papi
+from src.jsonstream import JsonStream
+from conftest import PRODUCT, RULE_FORMAT
+
+def evaluate_rule_tree(directory, lib):
+  _jsonnet = pytest.importorskip("_jsonnet")
+  return json.loads(_jsonnet.evaluate_file(os.path.join(directory, "rules.jsonnet"), jpathdir=[lib]))
+
+@pytest.mark.parametrize("options", [dict(), dict(dedup=True)])
+def test_same_json(options, stub, ruleTree, tmp_path, monkeypatch):
+  lib = str(tmp_path / "lib")
+  papi.ruleformat(stub.edgerc, "default", PRODUCT, RULE_FORMAT, noCache=True, out=lib)
+  papi.ruletree(stub.edgerc, "default", PRODUCT, "synthetic", out=str(tmp_path / "api"), ruleFormat=RULE_FORMAT, noCache=True)
+  with open(str(tmp_path / "rules.json"), "w") as fd:
+    json.dump(ruleTree, fd, indent=2)
+  # small chunks, for values to span several of them
+  monkeypatch.setattr(papi, "JsonStream", lambda fd: JsonStream(fd, 100))
+  papi.ruletree(stub.edgerc, "default", PRODUCT, "synthetic", file=str(tmp_path / "rules.json"), out=str(tmp_path / "file"), ruleFormat=RULE_FORMAT, noCache=True, **options)
+  expected = evaluate_rule_tree(str(tmp_path / "api"), lib)
+  assert len(expected.get("rules").get("children"))
+  assert evaluate_rule_tree(str(tmp_path / "file"), lib) == expected
+
+def write_deep_rule_tree(path, depth):
+  """
+  Write a rule tree of depth nested rules, without json.dump, which would give
+  up long before.
+  """
+  with open(path, "w") as fd:
+    fd.write('{"propertyId": "prp_1", "ruleFormat": "%s", "rules": ' % RULE_FORMAT)
+    fd.write('{"name": "default", "options": {}, "behaviors": [], "criteria": [], "children": [')
+    for _ in range(depth - 1):
+      fd.write('{"name": "r", "behaviors": [], "criteria": [], "children": [')
+    fd.write("]}" * depth + "}")
+
+def remove_deep_tree(directory):
+  """
+  Remove directory bottom up, as shutil.rmtree would run out of stack.
+  """
+  directories = [directory]
+  while len(directories):
+    current = directories[-1]
+    entries = os.listdir(current)
+    subdirectories = [os.path.join(current, entry) for entry in entries if os.path.isdir(os.path.join(current, entry))]
+    if len(subdirectories):
+      directories.extend(subdirectories)
+      continue
+    for entry in entries:
+      os.remove(os.path.join(current, entry))
+    os.rmdir(directories.pop())
+
+def test_deep_file(stub, tmp_path):
+  # deeper than json.load can decode
+  write_deep_rule_tree(str(tmp_path / "rules.json"), 600)
+  out = str(tmp_path / "out")
+  try:
+    papi.ruletree(stub.edgerc, "default", PRODUCT, "synthetic", file=str(tmp_path / "rules.json"), out=out, ruleFormat=RULE_FORMAT, noCache=True)
+    assert os.path.exists(os.path.join(out, "rules", *(["r"] * 597), "r.jsonnet"))
+  finally:
+    remove_deep_tree(out)
@@ -0,0 +1,56 @@
+import os
+import pytest
+import requests
+from src.edgegrid import Session
+from src.transport import Transport, TransportError, Recording, ReplayAdapter, request_key
+from src.commands import papi
+from conftest import PRODUCT, RULE_FORMAT, evaluate, read_tree, bootstrap_many
+
+def prepare(url, **headers):
+  return requests.Request("GET", url, headers=headers).prepare()
+
+def test_request_key():
+  key = request_key(prepare("https://a.luna.akamaiapis.net/papi/v1/groups?b=2&a=1", Authorization="EG1-HMAC-SHA256 one"))
+  # the host, the signature and the order of the parameters don't matter
+  assert request_key(prepare("http://127.0.0.1:8080/papi/v1/groups?a=1&b=2", Authorization="EG1-HMAC-SHA256 two")) == key
+  assert request_key(prepare("http://127.0.0.1:8080/papi/v1/groups?a=1&b=3")) != key
+  assert request_key(prepare("http://127.0.0.1:8080/papi/v1/groups?a=1&b=2", Accept="application/json")) != key
+
+def test_not_modified(tmp_path):
+  recording = Recording(str(tmp_path))
+  request = prepare("http://127.0.0.1/papi/v1/schemas/products/prd_1/latest")
+  response = requests.Response()
+  (response.status_code, response.reason, response._content) = (200, "OK", b'{"a": 1}')
+  response.headers.update({"ETag": '"v1"', "Content-Type": "application/json", "Content-Length": "8"})
+  recording.save(request, response)
+  adapter = ReplayAdapter(recording)
+  replayed = adapter.send(request)
+  assert (replayed.status_code, replayed.json()) == (200, {"a": 1})
+  assert "Content-Length" not in replayed.headers
+  # conditional headers don't change the key, the recorded ETag answers them
+  assert adapter.send(prepare(request.url, **{"If-None-Match": '"v1"'})).status_code == 304
+  assert adapter.send(prepare(request.url, **{"If-None-Match": '"v0"'})).status_code == 200
+
+def test_record_replay(fleet, tmp_path, monkeypatch):
+  recording = str(tmp_path / "recording")
+  monkeypatch.setattr(Session, "transport", Transport(record=recording))
+  bootstrap_many(fleet, tmp_path / "recorded")
+  fleet.stop()
+  monkeypatch.setattr(Session, "transport", Transport(replay=recording))
+  bootstrap_many(fleet, tmp_path / "replayed")
+  recorded = read_tree(str(tmp_path / "recorded"))
+  assert sorted(read_tree(str(tmp_path / "replayed"))) == sorted(recorded)
+  assert evaluate(str(tmp_path / "replayed")) == evaluate(str(tmp_path / "recorded"))
+
+def test_missing_response(stub, tmp_path, monkeypatch):
+  os.makedirs(str(tmp_path / "recording"))
+  monkeypatch.setattr(Session, "transport", Transport(replay=str(tmp_path / "recording")))
+  with pytest.raises(TransportError, match="no recorded response"):
+    papi.bootstrap(stub.edgerc, "default", PRODUCT, "synthetic", ruleFormat=RULE_FORMAT, out=str(tmp_path / "out"), noCache=True)
+  assert stub.requests == 0
+
+def test_no_recording(tmp_path):
+  with pytest.raises(TransportError, match="no recording"):
+    Transport(replay=str(tmp_path / "nonexistent")).adapter(1)
+  with pytest.raises(TransportError):
+    Transport(record=str(tmp_path), replay=str(tmp_path))
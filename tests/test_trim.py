@@ -0,0 +1,21 @@
+import os
+from conftest import PRODUCT, RULE_FORMAT, NAMES, evaluate, bootstrap_many
+
+def library(out):
+  with open(os.path.join(out, "lib", "papi", PRODUCT, "{}.libsonnet".format(RULE_FORMAT)), "r") as fd:
+    return fd.read()
+
+def test_same_json(fleet, tmp_path):
+  bootstrap_many(fleet, tmp_path / "full")
+  bootstrap_many(fleet, tmp_path / "trim", trim=True)
+  assert len(library(tmp_path / "trim")) < len(library(tmp_path / "full"))
+  assert evaluate(str(tmp_path / "trim")) == evaluate(str(tmp_path / "full"))
+
+def test_subset_keeps_atoms(fleet, tmp_path):
+  bootstrap_many(fleet, tmp_path / "full")
+  bootstrap_many(fleet, tmp_path / "trim", trim=True, common=True)
+  trimmed = library(tmp_path / "trim")
+  # the library keeps the atoms of bravo and charlie, and their common files
+  bootstrap_many(fleet, tmp_path / "trim", names=NAMES[:1], trim=True, common=True)
+  assert library(tmp_path / "trim") == trimmed
+  assert evaluate(str(tmp_path / "trim")) == evaluate(str(tmp_path / "full"))